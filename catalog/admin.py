@@ -1,29 +1,106 @@
 from django.contrib import admin
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
 
-from catalog.models import Author, Genre,Book, BookInstance, Language, BookReview
+from catalog.models import Author, Genre,Book, BookInstance, Language, BookReview, Hold
+from catalog.pagination import EstimatedCountPaginator
 
 
 #admin.site.register(Author)
 admin.site.register(Genre)
 admin.site.register(Language)
-admin.site.register(BookReview)
 
-class AuthorAdmin(admin.ModelAdmin):
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables too large to count or to list in a <select>:
+    foreign keys use autocomplete or raw id widgets, the total comes from the
+    planner's estimate and filtered lists skip the second, unfiltered COUNT(*).
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """
+    Inline formset editing one page of the related rows, picked by the <prefix>_page query parameter
+    """
+    per_page = 20
+    page_number = 1
+    query = None
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            queryset = super().get_queryset()
+            # A POST must see the rows of the page its forms came from.
+            queryset = queryset.order_by(*(queryset.query.order_by or queryset.model._meta.ordering), 'pk')
+            self.paginator = Paginator(queryset, self.per_page)
+            self.page = self.paginator.get_page(self.page_number)
+            param = f'{self.prefix}_page'
+            self.previous_url = self.next_url = None
+            if self.page.has_previous():
+                self.previous_url = self._page_url(param, self.page.previous_page_number())
+            if self.page.has_next():
+                self.next_url = self._page_url(param, self.page.next_page_number())
+        return self.page.object_list
+
+    def _page_url(self, param, number):
+        query = self.query.copy()
+        query[param] = number
+        return f'?{query.urlencode()}'
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    formset = PaginatedInlineFormSet
+    template = 'admin/catalog/paginated_tabular.html'
+    per_page = 20
+    extra = 1
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        # The change form posts back to its own URL, so a POST saves the page it showed.
+        page_number = request.GET.get(f'{formset.get_default_prefix()}_page', 1)
+        return type(formset.__name__, (formset,),
+                    {'per_page': self.per_page, 'page_number': page_number, 'query': request.GET})
+
+
+class AuthorAdmin(LargeTableAdmin):
    list_display =  ('last_name', 'first_name', 'date_of_birth',)
+   search_fields = ('last_name', 'first_name')
 
 
-class BookInstanceInline(admin.StackedInline):
+class BookInstanceInline(PaginatedTabularInline):
     model = BookInstance
+    fields = ('imprint', 'status', 'due_back', 'borrower')
+    raw_id_fields = ('borrower',)
+    show_change_link = True
+
+    def get_queryset(self, request):
+        # Each row links to the copy (titled by its book) and labels its borrower.
+        return super().get_queryset(request).select_related('book', 'borrower')
 
 
-class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'display_genre', 'language')
+class BookAdmin(LargeTableAdmin):
+    list_display = ('title', 'author', 'display_genre', 'language', 'copies_available')
+    search_fields = ('title', 'isbn')
+    autocomplete_fields = ('author',)
     inlines = [BookInstanceInline,]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_listing_related()
+
 
-class BookInstanceAdmin(admin.ModelAdmin):
+class BookInstanceAdmin(LargeTableAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
     list_filter = ('status', 'due_back')
+    list_select_related = ('book', 'borrower')
+    # Total, so the admin adds no '-pk' tie-breaker the index cannot serve
+    ordering = ('due_back', 'id')
+    date_hierarchy = 'due_back'
+    autocomplete_fields = ('book',)
+    raw_id_fields = ('borrower',)
 
     fieldsets = (
         (None, {
@@ -34,6 +111,29 @@ class BookInstanceAdmin(admin.ModelAdmin):
         }),
     )
 
+
+class HoldAdmin(LargeTableAdmin):
+    list_display = ('book', 'user', 'position', 'copy', 'pickup_deadline')
+    list_select_related = ('book', 'user', 'copy__book')
+    raw_id_fields = ('book', 'user', 'copy')
+
+
+class BookReviewAdmin(LargeTableAdmin):
+    list_display = ('book', 'user', 'rating', 'created_at')
+    list_select_related = ('book', 'user')
+    autocomplete_fields = ('book',)
+    raw_id_fields = ('user',)
+
+
+class LargeUserAdmin(LargeTableAdmin, UserAdmin):
+    """
+    The stock user admin, counted from the estimate like the other large tables
+    """
+
 admin.site.register(Author,  AuthorAdmin)
 admin.site.register(Book, BookAdmin)
-admin.site.register(BookInstance, BookInstanceAdmin)
\ No newline at end of file
+admin.site.register(BookInstance, BookInstanceAdmin)
+admin.site.register(Hold, HoldAdmin)
+admin.site.register(BookReview, BookReviewAdmin)
+admin.site.unregister(User)
+admin.site.register(User, LargeUserAdmin)
\ No newline at end of file
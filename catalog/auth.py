@@ -0,0 +1,102 @@
+"""
+Authentication backend caching the user of each session.
+
+Django loads ``request.user`` from ``auth_user`` on every request with a
+session, and permission checks add two more queries. ``CachedModelBackend``
+keeps each user, with its permissions resolved, in the cache for
+``CATALOG_USER_CACHE_TIMEOUT`` seconds. Saving or deleting a user drops
+its entry, and any change to group memberships or permissions starts a new
+generation of entries (see ``catalog.signals``). Changes made with
+``QuerySet.update`` show up once the entry expires.
+
+The session hash check and permission checks use the cached user, so the
+backend is only enabled with a cache every worker shares; the settings
+list it before ``ModelBackend`` in that case.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'catalog:users:generation'
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_USER_CACHE_TIMEOUT', 300)
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.add(GENERATION_KEY, generation, None)
+        generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+async def _ageneration():
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        await cache.aadd(GENERATION_KEY, generation, None)
+        generation = await cache.aget(GENERATION_KEY, generation)
+    return generation
+
+
+def user_key(user_id, generation):
+    return f'catalog:user:{generation}:{user_id}'
+
+
+def forget_users(user_ids):
+    """
+    Drop the cached copies of some users, now and once the current transaction commits
+    :return:
+    """
+    def delete():
+        generation = _generation()
+        cache.delete_many([user_key(user_id, generation) for user_id in user_ids])
+
+    delete()
+    # A request may cache the old row before the change commits.
+    transaction.on_commit(delete)
+
+
+def forget_all_users():
+    """
+    Drop every cached user, e.g. after a permission change
+    :return:
+    """
+    def bump():
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend reading users, with their permissions, through the cache
+    """
+
+    def get_user(self, user_id):
+        key = user_key(user_id, _generation())
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                # Fills the permission caches on the instance, so they are cached with it.
+                self.get_all_permissions(user)
+                cache.set(key, user, _timeout())
+        return user
+
+    async def aget_user(self, user_id):
+        key = user_key(user_id, await _ageneration())
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await self.aget_all_permissions(user)
+                await cache.aset(key, user, _timeout())
+        return user
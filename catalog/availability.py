@@ -0,0 +1,109 @@
+"""
+Per-book copy counts by status.
+
+``Book.copies_available``, ``copies_on_loan``, ``copies_reserved`` and
+``copies_maintenance`` are adjusted in one UPDATE per book whenever copies
+change status or book: by the ``BookInstance`` handlers in
+``catalog.signals`` for saves and deletes (the admin included) and by
+``catalog.loans`` and ``catalog.holds``, whose conditional UPDATEs send no
+signals, inside the same transaction as the change. The book list and
+search can then show availability and filter on "available now" without
+touching the copies.
+
+The cached book list fragment only shows whether a book has a copy
+available, so it is invalidated when a count crosses zero rather than on
+every loan and return; the detail page shows the exact counts.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from catalog import fragments
+from catalog.models import Book, BookInstance
+
+# Copy status -> Book counter field
+FIELDS = {
+    'a': 'copies_available',
+    'o': 'copies_on_loan',
+    'r': 'copies_reserved',
+    'm': 'copies_maintenance',
+}
+BATCH_SIZE = 1000
+
+
+def moves(book_ids, old_status, new_status):
+    """
+    Count changes of copies moving from old_status to new_status; book_ids has one entry per copy.
+    None stands for a copy that is created or deleted.
+    :return: Counter of (book id, status) -> delta
+    """
+    changes = Counter()
+    for book_id in book_ids:
+        changes[book_id, old_status] -= 1
+        changes[book_id, new_status] += 1
+    return changes
+
+
+def apply(changes):
+    """
+    Adjust the counters of each book by the given changes in a single UPDATE
+    :return:
+    """
+    per_book = defaultdict(dict)
+    for (book_id, status), delta in changes.items():
+        if delta and book_id is not None and status in FIELDS:
+            field = FIELDS[status]
+            per_book[book_id][field] = F(field) + delta
+    for book_id, values in per_book.items():
+        Book.objects.filter(pk=book_id).update(**values)
+    available = {book_id: changes[book_id, 'a'] for book_id in per_book if changes[book_id, 'a']}
+    if available:
+        # Read after the UPDATE, so the row lock orders concurrent changes.
+        counts = Book.objects.filter(pk__in=available).values_list('pk', 'copies_available')
+        if any((count > 0) != (count - available[book_id] > 0) for book_id, count in counts):
+            fragments.invalidate('list')
+
+
+def move(book_ids, old_status, new_status):
+    apply(moves(book_ids, old_status, new_status))
+
+
+def _counts():
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    return {
+        field: Coalesce(Subquery(copies.annotate(n=Count('pk', filter=Q(status=status))).values('n')), 0)
+        for status, field in FIELDS.items()
+    }
+
+
+def recount(book_ids):
+    """
+    Recompute the counters of the given books from their copies, e.g. after a bulk_create
+    :return:
+    """
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), BATCH_SIZE):
+        Book.objects.filter(pk__in=book_ids[start:start + BATCH_SIZE]).update(**_counts())
+    if book_ids:
+        fragments.invalidate('list')
+
+
+def drifted_books():
+    """
+    Books whose stored counters disagree with their copies
+    :return: queryset annotated with actual_<field> for every counter
+    """
+    counts = _counts()
+    return (Book.objects.annotate(**{f'actual_{field}': value for field, value in counts.items()})
+            .exclude(**{field: F(f'actual_{field}') for field in counts}))
+
+
+def reconcile_availability():
+    """
+    Recompute the counters of every book that drifted
+    :return: number of books fixed
+    """
+    book_ids = list(drifted_books().values_list('pk', flat=True))
+    recount(book_ids)
+    return len(book_ids)
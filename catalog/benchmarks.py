@@ -0,0 +1,201 @@
+"""
+Request-level benchmark scenarios.
+
+Each scenario drives a catalog view through the Django test client, in
+process and offline, against whatever database is configured. Timings are
+per request; query counts come from CaptureQueriesContext and memory is
+the tracemalloc peak of one extra request, so tracing does not skew the
+timings. Results are plain dicts that serialize to JSON and can be
+compared with a baseline from another commit.
+"""
+import datetime
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Book, BookInstance, Notification, Wishlist
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of a sorted list
+    :return: value
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Fixture:
+    """
+    The user, book and copy the scenarios request, picked from the busiest rows
+    """
+
+    def __init__(self):
+        self.user = (User.objects.filter(pk__in=Notification.objects.values('user_id'))
+                     .annotate(wishes=Count('wishlist')).order_by('-wishes').first()
+                     or User.objects.first())
+        self.book = (Book.objects.filter(pk__in=Wishlist.objects.values('book_id'))
+                     .annotate(copies=Count('bookinstance')).order_by('-copies').first()
+                     or Book.objects.first())
+        self.copy = BookInstance.objects.filter(status__exact='a', book__isnull=False).first()
+        self.term = self.book.title.split()[0] if self.book else 'book'
+        self.staff = User.objects.filter(is_superuser=True).first()
+        self.client = Client()
+        if self.user is not None:
+            self.client.force_login(self.user)
+        self.admin_client = Client()
+        if self.staff is not None:
+            self.admin_client.force_login(self.staff)
+
+
+def _get(name, *args, **params):
+    """
+    Scenario GETting a URL; args name fixture objects, callable params are given the fixture
+    """
+    def request(fixture):
+        url = reverse(name, args=[getattr(fixture, arg).pk for arg in args])
+        query = {key: value(fixture) if callable(value) else value for key, value in params.items()}
+        response = fixture.client.get(url, query)
+        if response.status_code != 200:
+            raise RuntimeError(f'{name} answered {response.status_code}')
+    return request
+
+
+def _admin_get(name, *args):
+    """
+    Scenario GETting an admin page as a superuser; args name fixture objects
+    """
+    def request(fixture):
+        response = fixture.admin_client.get(reverse(f'admin:{name}', args=[getattr(fixture, arg).pk for arg in args]))
+        if response.status_code != 200:
+            raise RuntimeError(f'{name} answered {response.status_code}')
+    return request
+
+
+def _loan_and_return(fixture):
+    fixture.client.post(reverse('loan-book', args=[fixture.copy.pk]))
+    fixture.client.post(reverse('return-book', args=[fixture.copy.pk]))
+
+
+# Scenario name -> (request function, what it needs from the fixture)
+SCENARIOS = {
+    'index': (_get('index'), ()),
+    'book_list': (_get('books'), ()),
+    'book_list_by_rating': (_get('books', sort='rating'), ()),
+    'book_detail': (_get('book-detail', 'book'), ('book',)),
+    'book_search': (_get('book-search', q=lambda fixture: fixture.term), ('book',)),
+    'loan_return': (_loan_and_return, ('copy',)),
+    'wishlist': (_get('wishlist'), ()),
+    'notifications': (_get('notifications'), ()),
+    'admin_book_changelist': (_admin_get('catalog_book_changelist'), ('staff',)),
+    'admin_book_change': (_admin_get('catalog_book_change', 'book'), ('staff', 'book')),
+    'admin_copy_changelist': (_admin_get('catalog_bookinstance_changelist'), ('staff',)),
+    'admin_copy_change': (_admin_get('catalog_bookinstance_change', 'copy'), ('staff', 'copy')),
+}
+
+
+def run_scenario(request, fixture, repeat, warmup=3, clear_cache=False):
+    """
+    Time repeat requests of a scenario
+    :return: dict of latency percentiles (ms), queries per request and peak memory (KiB)
+    """
+    for _ in range(warmup):
+        request(fixture)
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        if clear_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            request(fixture)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+    if clear_cache:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        request(fixture)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    timings.sort()
+    result = {'requests': repeat, 'mean_ms': statistics.fmean(timings)}
+    result.update({f'p{p}_ms': percentile(timings, p) for p in PERCENTILES})
+    result['queries'] = max(queries)
+    result['peak_kib'] = peak / 1024
+    return result
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=settings.BASE_DIR, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'commit': commit,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'books': Book.objects.count(),
+        'copies': BookInstance.objects.count(),
+        'users': User.objects.count(),
+    }
+
+
+def run_benchmarks(names=None, repeat=50, clear_cache=False, stdout=None):
+    """
+    Run the named scenarios (all by default)
+    :return: {'meta': ..., 'scenarios': {name: result}}
+    """
+    fixture = Fixture()
+    results = {'meta': metadata(), 'scenarios': {}}
+    for name, (request, needs) in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        if fixture.user is None or any(getattr(fixture, need) is None for need in needs):
+            if stdout is not None:
+                stdout.write(f'{name}: skipped, the database lacks the rows it needs')
+            continue
+        result = run_scenario(request, fixture, repeat, clear_cache=clear_cache)
+        results['scenarios'][name] = result
+        if stdout is not None:
+            stdout.write(f"{name:<22} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                         f"p99 {result['p99_ms']:8.2f} ms  {result['queries']:3d} queries  "
+                         f"{result['peak_kib']:8.0f} KiB")
+    return results
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Scenarios that got slower than baseline by more than threshold, or issue more queries
+    :return: list of (scenario, message)
+    """
+    regressions = []
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        if before['p50_ms'] and result['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            regressions.append((name, f"p50 {before['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms"))
+        if result['queries'] > before['queries']:
+            regressions.append((name, f"queries {before['queries']} -> {result['queries']}"))
+    return regressions
@@ -0,0 +1,97 @@
+"""
+System checks keeping templates on the hashed static asset pipeline, and
+cross-process caches off per-process cache backends.
+
+``manage.py check`` fails when a project template links a stylesheet,
+script, image or font by a literal URL (a CDN, ``/static/...``) instead of
+``{% static %}``, which would bypass the content hash and the immutable
+caching. Once ``collectstatic`` has written the manifest, every
+``{% static %}`` name must also be in it, so a missing or misspelt asset
+fails the build rather than the first request for that page.
+
+Cached data that other processes invalidate, such as rendered fragments,
+unread notification counts and session users, must live in a cache shared by every worker: with ``LocMemCache`` each
+gunicorn worker keeps serving its own copy after another one changed it.
+"""
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.template import engines
+
+ASSET_URL = re.compile(
+    r'''\b(?:href|src)\s*=\s*["']([^"'{]+\.(?:css|js|png|jpe?g|gif|svg|ico|webp|woff2?))["']''', re.I)
+STATIC_TAG = re.compile(r'''{%\s*static\s+["']([^"']+)["']''')
+
+
+def template_files():
+    """
+    Templates of the project and its own apps, skipping installed packages
+    :return: iterator of paths
+    """
+    base_dir = os.path.abspath(settings.BASE_DIR)
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            directory = os.path.abspath(directory)
+            if os.path.commonpath([base_dir, directory]) != base_dir or 'site-packages' in directory:
+                continue
+            for root, dirs, files in os.walk(directory):
+                for name in files:
+                    if name.endswith(('.html', '.txt')):
+                        yield os.path.join(root, name)
+
+
+@checks.register(checks.Tags.staticfiles)
+def check_static_references(app_configs=None, **kwargs):
+    errors = []
+    manifest = getattr(staticfiles_storage, 'hashed_files', None)
+    for path in template_files():
+        with open(path, encoding='utf-8') as template:
+            source = template.read()
+        for url in ASSET_URL.findall(source):
+            errors.append(checks.Error(
+                f'{path} references the unhashed asset {url}.',
+                hint="Add the file to catalog/static and link it with {% static %}.",
+                id='catalog.E001',
+            ))
+        if manifest:
+            for name in STATIC_TAG.findall(source):
+                if name not in manifest:
+                    errors.append(checks.Error(
+                        f"{path} uses {{% static '{name}' %}}, which collectstatic did not hash.",
+                        id='catalog.E002',
+                    ))
+    return errors
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_caches(app_configs=None, **kwargs):
+    errors = []
+    if not isinstance(caches['default'], LocMemCache):
+        return errors
+    if getattr(settings, 'CATALOG_FRAGMENT_CACHE', False):
+        errors.append(checks.Error(
+            'CATALOG_FRAGMENT_CACHE is on, but the default cache is local to each process, '
+            'so other workers keep serving fragments after they are invalidated.',
+            hint="Set DJANGO_CACHE_BACKEND to 'file' or 'redis', or turn CATALOG_FRAGMENT_CACHE off.",
+            id='catalog.E003',
+        ))
+    if getattr(settings, 'CATALOG_UNREAD_CACHE', False):
+        errors.append(checks.Error(
+            'CATALOG_UNREAD_CACHE is on, but the default cache is local to each process, '
+            'so notifications created by jobs and other workers leave unread counts stale.',
+            hint="Set DJANGO_CACHE_BACKEND to 'file' or 'redis', or turn CATALOG_UNREAD_CACHE off.",
+            id='catalog.E004',
+        ))
+    if 'catalog.auth.CachedModelBackend' in settings.AUTHENTICATION_BACKENDS:
+        errors.append(checks.Error(
+            'CachedModelBackend is enabled, but the default cache is local to each process, '
+            'so deactivated users, old passwords and revoked permissions stay valid in other workers.',
+            hint="Set DJANGO_CACHE_BACKEND to 'file' or 'redis', or use ModelBackend.",
+            id='catalog.E005',
+        ))
+    return errors
@@ -0,0 +1,186 @@
+"""
+Loan event log and circulation rollups.
+
+``catalog.loans`` appends a ``LoanEvent`` for every loan, return and
+renewal, in the transaction that changes the copy, so the history
+survives the copy being overwritten. ``rollup_circulation`` (run by
+``manage.py rollup_circulation``) turns the events into per-book and
+per-genre buckets for days and months with GROUP BY queries, so reports
+read a few pre-aggregated rows:
+
+* book days come from the events;
+* book months are the sums of their book days;
+* genre days and months are the sums of the book buckets of their books.
+
+Each run recomputes the days since its previous run, plus ``LATE_EVENTS``
+for transactions that committed after a run started, and the months
+containing them. ``archive_events`` then moves events older than the
+retention period to gzipped JSON lines files, ``BATCH_SIZE`` events per
+file and DELETE. It never archives days that were not rolled up yet, so
+the buckets keep the history of the archived events.
+"""
+import datetime
+import os
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from catalog import export
+from catalog.models import (
+    Book, BookCirculation, CirculationBucket, GenreCirculation, JobState, LoanEvent
+)
+
+JOB = 'rollup_circulation'
+# How long after its created_at an event may still commit
+LATE_EVENTS = datetime.timedelta(minutes=10)
+BATCH_SIZE = 5000
+# Bucket field -> event kind
+COUNTS = {
+    'loans': LoanEvent.LOAN,
+    'returns': LoanEvent.RETURN,
+    'renewals': LoanEvent.RENEWAL,
+}
+ARCHIVED_FIELDS = ('id', 'kind', 'copy_id', 'book_id', 'user_id', 'due_back', 'created_at')
+
+
+def record(kind, copies, user_id=None, due_back=None):
+    """
+    Log the same change of some copies, given as (copy id, book id) pairs, in the caller's transaction
+    :return:
+    """
+    now = timezone.now()
+    LoanEvent.objects.bulk_create(
+        LoanEvent(kind=kind, copy_id=copy_id, book_id=book_id, user_id=user_id, due_back=due_back,
+                  created_at=now)
+        for copy_id, book_id in copies
+    )
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _next_month(day):
+    return (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _store(model, period, first, last, rows, key):
+    """
+    Replace the buckets of a period starting between first and last with the aggregated rows
+    :return: number of buckets written
+    """
+    model.objects.filter(period=period, start__range=(first, last)).delete()
+    buckets = model.objects.bulk_create(
+        (model(period=period, start=row['bucket'], **{key: row[key]}, **{field: row[field] for field in COUNTS})
+         for row in rows.iterator()),
+        batch_size=BATCH_SIZE,
+    )
+    return len(buckets)
+
+
+def _sums(queryset, *fields, **expressions):
+    """
+    Add up buckets grouped by the given fields and expressions
+    :return: queryset of dicts
+    """
+    return (queryset.values(*fields, **expressions).order_by()
+            .annotate(**{field: Sum(field) for field in COUNTS}))
+
+
+def rollup_days(first_day, last_day):
+    """
+    Recompute the day buckets of the given days from the events, and the month buckets containing them
+    :return: number of buckets written
+    """
+    first_month, last_month = first_day.replace(day=1), last_day.replace(day=1)
+    month_end = _next_month(last_month) - datetime.timedelta(days=1)
+    events = LoanEvent.objects.filter(created_at__gte=_midnight(first_day),
+                                      created_at__lt=_midnight(last_day + datetime.timedelta(days=1)),
+                                      book_id__in=Book.objects.values('pk'))
+    book_days = (events.values('book_id', bucket=TruncDate('created_at')).order_by()
+                 .annotate(**{field: Count('pk', filter=Q(kind=kind)) for field, kind in COUNTS.items()}))
+    days = BookCirculation.objects.filter(period=CirculationBucket.DAY, start__range=(first_month, month_end))
+    months = BookCirculation.objects.filter(period=CirculationBucket.MONTH, start__range=(first_month, last_month))
+    with transaction.atomic():
+        written = _store(BookCirculation, CirculationBucket.DAY, first_day, last_day, book_days, 'book_id')
+        written += _store(BookCirculation, CirculationBucket.MONTH, first_month, last_month,
+                          _sums(days, 'book_id', bucket=TruncMonth('start')), 'book_id')
+        for period, first, last, books in ((CirculationBucket.DAY, first_day, last_day, days),
+                                           (CirculationBucket.MONTH, first_month, last_month, months)):
+            genres = _sums(books.filter(start__range=(first, last), book__genre__isnull=False),
+                           bucket=F('start'), genre_id=F('book__genre'))
+            written += _store(GenreCirculation, period, first, last, genres, 'genre_id')
+    return written
+
+
+def rolled_up_until():
+    """
+    Time before which every committed event is in the buckets
+    :return: aware datetime, or None before the first rollup
+    """
+    value = JobState.objects.filter(name=JOB).values_list('value', flat=True).first()
+    return datetime.datetime.fromisoformat(value) - LATE_EVENTS if value else None
+
+
+def rollup_circulation(full=False):
+    """
+    Recompute the buckets of the days with events since the previous run, or of every day with events
+    :return: (first day, last day, buckets written), or None when there is nothing to roll up
+    """
+    started = timezone.now()
+    since = None if full else rolled_up_until()
+    if since is None:
+        since = LoanEvent.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    result = None
+    if since is not None:
+        first_day, last_day = timezone.localdate(since), timezone.localdate(started)
+        result = first_day, last_day, rollup_days(first_day, last_day)
+    JobState.objects.update_or_create(name=JOB, defaults={'value': started.isoformat()})
+    return result
+
+
+def archive_events(before, directory, batch_size=BATCH_SIZE):
+    """
+    Move the events of the days before a datetime to gzipped JSON lines files in directory,
+    batch_size events per file; days not rolled up yet are kept
+    :return: number of events archived
+    """
+    rolled_up = rolled_up_until()
+    if rolled_up is None:
+        return 0
+    # Whole days only, so a full rollup never sees part of a day.
+    before = _midnight(timezone.localdate(min(before, rolled_up)))
+    os.makedirs(directory, exist_ok=True)
+    old = LoanEvent.objects.filter(created_at__lt=before).order_by('pk').values_list(*ARCHIVED_FIELDS)
+    archived = 0
+    while True:
+        batch = list(old[:batch_size])
+        if not batch:
+            return archived
+        path = os.path.join(directory, f'loan-events-{batch[0][0]:012d}-{batch[-1][0]:012d}.jsonl.gz')
+        chunks = (text.encode() for text in export.encode_jsonl(ARCHIVED_FIELDS, batch))
+        with open(path + '.tmp', 'wb') as archive:
+            archive.writelines(export.gzip_chunks(chunks))
+        # The file is complete before its events are deleted.
+        os.replace(path + '.tmp', path)
+        archived += LoanEvent.objects.filter(pk__in=[row[0] for row in batch]).delete()[0]
+
+
+def top_books(period, start, limit=10):
+    """
+    Most borrowed books of a day or month
+    :return: queryset of BookCirculation with the book loaded
+    """
+    return (BookCirculation.objects.filter(period=period, start=start, loans__gt=0)
+            .select_related('book').order_by('-loans', 'book_id')[:limit])
+
+
+def top_genres(period, start, limit=10):
+    """
+    Most borrowed genres of a day or month
+    :return: queryset of GenreCirculation with the genre loaded
+    """
+    return (GenreCirculation.objects.filter(period=period, start=start, loans__gt=0)
+            .select_related('genre').order_by('-loans', 'genre_id')[:limit])
@@ -0,0 +1,14 @@
+from catalog.notifications import unread_count
+
+
+def notifications(request):
+    """
+    Expose the cached unread notification count as unread_notifications
+    :return: dict
+    """
+    def unread():
+        # Evaluated only by templates that use it
+        user = request.user
+        return unread_count(user.pk) if user.is_authenticated else 0
+
+    return {'unread_notifications': unread}
@@ -0,0 +1,95 @@
+"""
+Denormalized catalog counters shown on the home page.
+
+The values live in ``CatalogCounter`` rows and are adjusted in place by the
+handlers in ``catalog.signals``, so reading all of them is a single query.
+Each counter is split over ``SLOTS`` rows and a change adjusts a random
+one, so concurrent loans and returns rarely wait for each other's row lock
+on the counter; a read sums the slots.
+Bulk operations that bypass model signals (``QuerySet.update``,
+``bulk_create``) must adjust the counters themselves or be followed by
+``manage.py rebuild_counters``.
+"""
+import random
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F, Sum
+
+from catalog.models import Author, Book, BookInstance, CatalogCounter
+
+NUM_BOOKS = 'num_books'
+NUM_INSTANCES = 'num_instances'
+NUM_INSTANCES_AVAILABLE = 'num_instance_available'
+NUM_AUTHORS = 'num_authors'
+# Rows per counter
+SLOTS = 16
+
+SOURCES = {
+    NUM_BOOKS: lambda: Book.objects.all(),
+    NUM_INSTANCES: lambda: BookInstance.objects.all(),
+    NUM_INSTANCES_AVAILABLE: lambda: BookInstance.objects.filter(status__exact='a'),
+    NUM_AUTHORS: lambda: Author.objects.all(),
+}
+
+
+def rebuild_counters(names=None):
+    """
+    Recompute counters from the source tables
+    :return: dict of name -> value
+    """
+    values = {}
+    with transaction.atomic():
+        for name in names or SOURCES:
+            values[name] = SOURCES[name]().count()
+            CatalogCounter.objects.update_or_create(name=name, slot=0, defaults={'value': values[name]})
+            CatalogCounter.objects.filter(name=name, slot__gt=0).update(value=0)
+            CatalogCounter.objects.bulk_create((CatalogCounter(name=name, slot=slot) for slot in range(1, SLOTS)),
+                                               ignore_conflicts=True)
+    return values
+
+
+def increment(name, delta=1):
+    """
+    Atomically adjust a counter by delta, in one of its slots
+    :return:
+    """
+    if not delta:
+        return
+    slot = random.randrange(SLOTS)
+    updated = CatalogCounter.objects.filter(name=name, slot=slot).update(value=F('value') + delta)
+    if not updated:
+        # First change since the counter was dropped; the count already includes it.
+        rebuild_counters([name])
+
+
+def _totals():
+    """
+    :return: queryset of (name, sum of the slots) tuples
+    """
+    return (CatalogCounter.objects.filter(name__in=SOURCES).values('name').order_by()
+            .annotate(total=Sum('value')).values_list('name', 'total'))
+
+
+def get_counters():
+    """
+    Read all counters with one query
+    :return: dict of name -> value
+    """
+    values = dict(_totals())
+    missing = [name for name in SOURCES if name not in values]
+    if missing:
+        values.update(rebuild_counters(missing))
+    return values
+
+
+async def aget_counters():
+    """
+    Async version of get_counters()
+    :return: dict of name -> value
+    """
+    values = {name: value async for name, value in _totals()}
+    missing = [name for name in SOURCES if name not in values]
+    if missing:
+        values.update(await sync_to_async(rebuild_counters)(missing))
+    return values
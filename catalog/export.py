@@ -0,0 +1,135 @@
+"""
+Streaming catalog export.
+
+Rows are read with ``values_list().iterator()`` (a server-side cursor on
+PostgreSQL, chunked fetches elsewhere), so no model instances are built and
+only one chunk of rows is held at a time. The rows are encoded into batches
+of text and optionally gzip-compressed on the fly, which lets the same
+generator feed a ``StreamingHttpResponse`` or a file.
+
+Under ASGI, Django reads a sync iterator given to a streaming response
+into a list before sending any of it, so ``aexport`` wraps the generator
+in an async iterator that produces one piece at a time in the request's
+sync thread.
+"""
+import csv
+import io
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from catalog.models import Book, BookInstance, BookReview
+
+CHUNK_SIZE = 2000
+# Rows encoded per yielded piece of output
+BATCH_ROWS = 500
+
+# Dataset -> (model, exported fields)
+DATASETS = {
+    'books': (Book, ('id', 'title', 'author_id', 'author__last_name', 'author__first_name', 'isbn',
+                     'language__name', 'review_count', 'rating_avg')),
+    'copies': (BookInstance, ('id', 'book_id', 'book__title', 'imprint', 'status', 'due_back',
+                              'borrower_id', 'borrower__username')),
+    'reviews': (BookReview, ('id', 'book_id', 'user_id', 'user__username', 'rating', 'comment',
+                             'created_at')),
+}
+
+# Format -> content type
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def rows(dataset):
+    """
+    Stream the rows of a dataset as tuples
+    :return: (field names, iterator of tuples)
+    """
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.order_by('pk').values_list(*fields)
+    return fields, queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _batches(iterable):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_csv(fields, records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for batch in _batches(records):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_jsonl(fields, records):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for batch in _batches(records):
+        yield ''.join(encoder.encode(dict(zip(fields, record))) + '\n' for record in batch)
+
+
+def gzip_chunks(chunks):
+    """
+    Compress a stream of bytes into a gzip stream
+    :return: iterator of bytes
+    """
+    compressor = zlib.compressobj(wbits=31)  # 16 + MAX_WBITS: gzip header
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(dataset, fmt='csv', compress=False):
+    """
+    Stream a dataset encoded as csv, jsonl or ndjson
+    :return: iterator of bytes
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f'Unknown dataset {dataset!r}')
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}')
+    fields, records = rows(dataset)
+    encode = encode_csv if fmt == 'csv' else encode_jsonl
+    chunks = (text.encode() for text in encode(fields, records))
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def filename(dataset, fmt, compress=False):
+    return f'{dataset}.{fmt}' + ('.gz' if compress else '')
+
+
+async def aiterate(iterator):
+    """
+    Async iterator over a sync one, advancing it in the request's sync thread
+    :return: async iterator
+    """
+    iterator = iter(iterator)
+    done = object()
+    advance = sync_to_async(next)
+    while (item := await advance(iterator, done)) is not done:
+        yield item
+
+
+def aexport(dataset, fmt='csv', compress=False):
+    """
+    export() for ASGI responses
+    :return: async iterator of bytes
+    """
+    return aiterate(export(dataset, fmt, compress))
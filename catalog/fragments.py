@@ -0,0 +1,141 @@
+"""
+Rendered template fragment cache with model-driven invalidation.
+
+Every fragment kind belongs to a scope such as ``book:<id>`` or ``list``.
+Each scope has a generation token stored in the cache and every fragment
+key includes the token, so invalidating a scope is a single write of a new
+token and stale fragments simply expire. The handlers in ``catalog.signals``
+(and the loan engine, whose UPDATEs send no signals) invalidate the scopes
+a model change affects.
+
+Fragments must not contain per-user data such as CSRF tokens; anything that
+varies by user is passed as a ``vary`` value.
+
+A request reading from a lagging read replica may render rows older than
+the current generation. What it renders is stored under a separate key for
+``CATALOG_REPLICA_STICKY_SECONDS`` only, and requests reading the primary
+never see it, so clients keep reading their own writes.
+
+Invalidation only works if every process sees the tokens, so fragments
+are cached only when ``CATALOG_FRAGMENT_CACHE`` is on, which the settings
+do for shared (file, redis) caches; otherwise they are rendered every time.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from catalog import routers
+
+# Fragment kind -> scope prefix
+SCOPES = {
+    'book_detail': 'book',
+    'book_copies': 'copies',
+    'book_reviews': 'reviews',
+    'book_list': 'list',
+}
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def enabled():
+    return getattr(settings, 'CATALOG_FRAGMENT_CACHE', False)
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_FRAGMENT_CACHE_TIMEOUT', 3600)
+
+
+def _replica_timeout():
+    return getattr(settings, 'CATALOG_REPLICA_STICKY_SECONDS', 10)
+
+
+def _generation_key(scope):
+    return f'catalog:generation:{scope}'
+
+
+def scope_name(kind, scope_id=None):
+    prefix = SCOPES[kind]
+    return prefix if scope_id is None else f'{prefix}:{scope_id}'
+
+
+def invalidate(*scopes):
+    """
+    Drop every fragment of the given scopes, e.g. invalidate('book:1', 'list')
+    :return:
+    """
+    if not scopes or not enabled():
+        return
+
+    def bump():
+        token = uuid.uuid4().hex
+        cache.set_many({_generation_key(scope): token for scope in scopes}, None)
+
+    bump()
+    # Bump again once the change is visible, so a fragment another request
+    # rendered from the old rows in the meantime is not served.
+    transaction.on_commit(bump)
+
+
+def invalidate_books(book_ids, kinds=('book_detail',)):
+    """
+    Drop the fragments of the given kinds for several books
+    :return:
+    """
+    invalidate(*(scope_name(kind, book_id) for book_id in book_ids for kind in kinds))
+
+
+def _record(kind, hit):
+    with _stats_lock:
+        counts = _stats.setdefault(kind, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+
+
+def stats():
+    """
+    Hit and miss counts of this process per fragment kind
+    :return: dict of kind -> {'hits', 'misses', 'hit_rate'}
+    """
+    with _stats_lock:
+        result = {kind: dict(counts) for kind, counts in _stats.items()}
+    for counts in result.values():
+        total = counts['hits'] + counts['misses']
+        counts['hit_rate'] = counts['hits'] / total if total else 0.0
+    return result
+
+
+def get_or_render(kind, scope_id, vary, render):
+    """
+    Return the cached fragment or render and store it
+    :return: rendered string
+    """
+    if not enabled():
+        _record(kind, False)
+        return render()
+    scope = scope_name(kind, scope_id)
+    generation_key = _generation_key(scope)
+    generation = cache.get(generation_key)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.add(generation_key, generation, None)
+        generation = cache.get(generation_key, generation)
+    digest = hashlib.md5(repr(vary).encode(), usedforsecurity=False).hexdigest()
+    key = f'catalog:fragment:{kind}:{scope}:{generation}:{digest}'
+    replica_key = f'{key}:replica'
+    if routers.uses_replica():
+        found = cache.get_many([key, replica_key])
+        content = found.get(key, found.get(replica_key))
+    else:
+        content = cache.get(key)
+    _record(kind, content is not None)
+    if content is None:
+        content = render()
+        if routers.uses_replica():
+            cache.set(replica_key, content, _replica_timeout())
+        else:
+            cache.set(key, content, _timeout())
+    return content
@@ -0,0 +1,163 @@
+"""
+Reservation (hold) queues.
+
+Users queue for a book with an increasing per-book ``position``. When a
+copy becomes available it is set aside for the head of the queue: the
+waiting hold with the lowest position, found through the partial
+``(book, position)`` index without scanning the queue. Claiming the hold
+and reserving the copy are both conditional UPDATEs inside a savepoint, so
+a concurrent loan or assignment makes one side lose cleanly instead of
+double-booking. Holds that are not picked up before their deadline are
+released by ``expire_holds`` and the copy rolls on to the next in line.
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from catalog import availability, counters, fragments, notifications
+from catalog.models import Book, BookInstance, Hold, Notification
+
+PICKUP_PERIOD = datetime.timedelta(days=3)
+BATCH_SIZE = 500
+# Attempts at taking the next position when enqueues race
+PLACE_ATTEMPTS = 5
+
+
+class HoldError(Exception):
+    pass
+
+
+class _CopyTaken(Exception):
+    pass
+
+
+def place_hold(user, book_id):
+    """
+    Queue user for a book, reserving an available copy straight away if there is one
+    :return: Hold
+    """
+    for _ in range(PLACE_ATTEMPTS):
+        last = Hold.objects.filter(book_id=book_id).aggregate(last=Max('position'))['last'] or 0
+        try:
+            with transaction.atomic():
+                hold = Hold.objects.create(book_id=book_id, user=user, position=last + 1)
+            break
+        except IntegrityError:
+            if Hold.objects.filter(book_id=book_id, user=user).exists():
+                raise HoldError('You are already in the queue for this book.')
+    else:
+        raise HoldError('The queue is busy, please try again.')
+    with transaction.atomic():
+        copy_ids = BookInstance.objects.filter(book_id=book_id, status__exact='a').values_list('pk', flat=True)
+        reserved = reserve_copies([(copy_id, book_id) for copy_id in copy_ids])
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE, -len(reserved))
+    hold.refresh_from_db()
+    return hold
+
+
+def _assign(copy_id, book_id, now):
+    """
+    Set an available copy aside for the head of its book's queue
+    :return: (hold id, user id), or None when nobody waits or the copy is gone
+    """
+    while True:
+        head = (Hold.objects.filter(book_id=book_id, copy__isnull=True)
+                .order_by('position').values_list('pk', 'user_id').first())
+        if head is None:
+            return None
+        hold_id, user_id = head
+        try:
+            with transaction.atomic():
+                claimed = (Hold.objects.filter(pk=hold_id, copy__isnull=True)
+                           .update(copy_id=copy_id, pickup_deadline=now + PICKUP_PERIOD))
+                if not claimed:
+                    # Cancelled or served meanwhile; look at the new head.
+                    continue
+                if not (BookInstance.objects.filter(pk=copy_id, status__exact='a')
+                        .update(status='r', borrower_id=user_id, due_back=None)):
+                    raise _CopyTaken
+                availability.move([book_id], 'a', 'r')
+        except (_CopyTaken, IntegrityError):
+            return None
+        return hold_id, user_id
+
+
+def reserve_copies(copies, now=None):
+    """
+    Hand available copies, given as (copy id, book id) pairs, to their queues.
+
+    Callers adjust the available counter by the number of copies reserved.
+    :return: dict of reserved copy id -> user id
+    """
+    now = now or timezone.now()
+    reserved = {}
+    books = {}
+    for copy_id, book_id in copies:
+        assigned = _assign(copy_id, book_id, now)
+        if assigned is not None:
+            reserved[copy_id] = assigned[1]
+            books[copy_id] = book_id
+    if reserved:
+        titles = dict(Book.objects.filter(pk__in=set(books.values())).values_list('pk', 'title'))
+        deadline = timezone.localtime(now + PICKUP_PERIOD).strftime('%b %d, %Y %H:%M')
+        notifications.create_notifications(
+            Notification(user_id=user_id, dedupe_key=f'hold:{books[copy_id]}',
+                         message=f"'{titles[books[copy_id]]}' is waiting for you. Pick it up by {deadline}.")
+            for copy_id, user_id in reserved.items()
+        )
+        fragments.invalidate_books(set(books.values()), kinds=('book_copies',))
+    return reserved
+
+
+def _release(copy_id, book_id, user_id, now=None):
+    """
+    Take a reserved copy back from user and pass it to the next in line
+    :return:
+    """
+    released = (BookInstance.objects.filter(pk=copy_id, status__exact='r', borrower_id=user_id)
+                .update(status='a', borrower=None))
+    if not released:
+        return
+    availability.move([book_id], 'r', 'a')
+    fragments.invalidate_books([book_id], kinds=('book_copies',))
+    if not reserve_copies([(copy_id, book_id)], now):
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE)
+        notifications.schedule_availability_notice(book_id)
+
+
+def cancel_hold(user, book_id):
+    """
+    Leave the queue of a book, releasing a copy set aside for user
+    :return:
+    """
+    with transaction.atomic():
+        hold = Hold.objects.filter(book_id=book_id, user=user).values_list('pk', 'copy_id').first()
+        if hold is None:
+            raise HoldError('You are not in the queue for this book.')
+        hold_id, copy_id = hold
+        if Hold.objects.filter(pk=hold_id).delete()[0] and copy_id:
+            _release(copy_id, book_id, user.pk)
+
+
+def expire_holds(now=None, batch_size=BATCH_SIZE):
+    """
+    Release copies not picked up by their deadline, batch_size holds per transaction
+    :return: number of holds expired
+    """
+    now = now or timezone.now()
+    overdue = (Hold.objects.filter(copy__isnull=False, pickup_deadline__lt=now)
+               .order_by('pickup_deadline')
+               .values_list('pk', 'copy_id', 'book_id', 'user_id'))
+    expired = 0
+    while True:
+        batch = list(overdue[:batch_size])
+        if not batch:
+            return expired
+        with transaction.atomic():
+            for hold_id, copy_id, book_id, user_id in batch:
+                # Conditional: a pickup in the meantime already removed the hold.
+                if Hold.objects.filter(pk=hold_id, copy_id=copy_id).delete()[0]:
+                    _release(copy_id, book_id, user_id, now)
+                    expired += 1
@@ -0,0 +1,139 @@
+"""
+Loan and return engine.
+
+Every state change is a single conditional UPDATE (``... WHERE status='a'``)
+run inside a transaction, so two concurrent requests can never both loan
+the same copy, and only the changed columns are written. Because
+``QuerySet.update`` does not send model signals, the denormalized data the
+signal handlers maintain is adjusted here. Each change is also appended to
+the loan event log (see ``catalog.circulation``) in the same transaction.
+"""
+import datetime
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from catalog import availability, circulation, counters, fragments, holds, notifications
+from catalog.models import BookInstance, Hold, LoanEvent
+
+LOAN_PERIOD = datetime.timedelta(weeks=2)
+
+
+class LoanConflict(Exception):
+    """
+    Raised when a copy is not in the state the operation requires
+    """
+
+    def __init__(self, message, copy_ids=()):
+        super().__init__(message)
+        self.copy_ids = list(copy_ids)
+
+
+def _copy_ids(copy_ids):
+    """
+    Distinct copy ids, however each was written (case, hyphens)
+    :return: set of UUID
+    """
+    try:
+        copy_ids = {value if isinstance(value, uuid.UUID) else uuid.UUID(str(value)) for value in copy_ids}
+    except ValueError:
+        raise ValidationError('Invalid copy id.')
+    if not copy_ids:
+        raise LoanConflict('No copies were selected.')
+    return copy_ids
+
+
+def _copies(copy_ids):
+    """
+    The book of each of the copies
+    :return: list of (copy id, book id or None)
+    """
+    return list(BookInstance.objects.filter(pk__in=copy_ids).values_list('pk', 'book_id'))
+
+
+def _book_ids(copies):
+    """
+    :return: list, with a book id repeated for every copy of it
+    """
+    return [book_id for copy_id, book_id in copies if book_id is not None]
+
+
+def loan_copies(user, copy_ids, due_back=None):
+    """
+    Loan the given copies to user, all or none
+    :return: number of copies loaned
+    """
+    copy_ids = _copy_ids(copy_ids)
+    due_back = due_back or datetime.date.today() + LOAN_PERIOD
+    with transaction.atomic():
+        loaned = (BookInstance.objects.filter(pk__in=copy_ids, status__exact='a')
+                  .update(status='o', borrower=user, due_back=due_back))
+        if loaned != len(copy_ids):
+            # Rolls back the copies that were free.
+            raise LoanConflict('Some of the copies are no longer available.', copy_ids)
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE, -loaned)
+        copies = _copies(copy_ids)
+        circulation.record(LoanEvent.LOAN, copies, user.pk, due_back)
+        book_ids = _book_ids(copies)
+        availability.move(book_ids, 'a', 'o')
+        fragments.invalidate_books(set(book_ids), kinds=('book_copies',))
+    return loaned
+
+
+def return_copies(user, copy_ids):
+    """
+    Return copies on loan to user, all or none.
+
+    Returned copies go to the head of their book's hold queue first; only
+    copies nobody is waiting for become available.
+    :return: number of copies returned
+    """
+    copy_ids = _copy_ids(copy_ids)
+    with transaction.atomic():
+        returned = (BookInstance.objects.filter(pk__in=copy_ids, status__exact='o', borrower=user)
+                    .update(status='a', borrower=None, due_back=None))
+        if returned != len(copy_ids):
+            raise LoanConflict('Some of the copies are not on loan to you.', copy_ids)
+        copies = _copies(copy_ids)
+        circulation.record(LoanEvent.RETURN, copies, user.pk)
+        copies = [(copy_id, book_id) for copy_id, book_id in copies if book_id is not None]
+        # Before the queue takes some of them
+        availability.move(_book_ids(copies), 'o', 'a')
+        reserved = holds.reserve_copies(copies)
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE, returned - len(reserved))
+        fragments.invalidate_books({book_id for copy_id, book_id in copies}, kinds=('book_copies',))
+        for book_id in {book_id for copy_id, book_id in copies if copy_id not in reserved}:
+            notifications.schedule_availability_notice(book_id)
+    return returned
+
+
+def collect_hold(user, copy_id, due_back=None):
+    """
+    Loan user the copy set aside for them, ending their hold
+    :return:
+    """
+    due_back = due_back or datetime.date.today() + LOAN_PERIOD
+    with transaction.atomic():
+        if not Hold.objects.filter(copy_id=copy_id, user=user).delete()[0]:
+            raise LoanConflict('This copy is not waiting for you.', [copy_id])
+        collected = (BookInstance.objects.filter(pk=copy_id, status__exact='r', borrower=user)
+                     .update(status='o', due_back=due_back))
+        if not collected:
+            raise LoanConflict('This copy is not waiting for you.', [copy_id])
+        copies = _copies([copy_id])
+        circulation.record(LoanEvent.LOAN, copies, user.pk, due_back)
+        book_ids = _book_ids(copies)
+        availability.move(book_ids, 'r', 'o')
+        fragments.invalidate_books(book_ids, kinds=('book_copies',))
+
+
+def renew_copy(copy, due_back):
+    """
+    Move the due date of a copy, e.g. when a librarian renews a loan
+    :return:
+    """
+    with transaction.atomic():
+        copy.due_back = due_back
+        copy.save()
+        circulation.record(LoanEvent.RENEWAL, [(copy.pk, copy.book_id)], copy.borrower_id, due_back)
@@ -0,0 +1,23 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog.circulation import BATCH_SIZE, archive_events
+
+
+class Command(BaseCommand):
+    help = ('Move loan events older than the retention period to gzipped JSON lines files, in '
+            'batches; events not rolled up yet are kept')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CATALOG_LOAN_EVENT_RETENTION_DAYS,
+                            help='Retention period in days')
+        parser.add_argument('--directory', default=settings.CATALOG_LOAN_EVENT_ARCHIVE_DIR)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        archived = archive_events(before, options['directory'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{archived} loan events archived to {options['directory']}"))
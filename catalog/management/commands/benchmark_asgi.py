@@ -0,0 +1,180 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from catalog.benchmarks import percentile
+from catalog.models import Book, Notification
+from catalog.seeding import seed_catalog
+
+
+class Command(BaseCommand):
+    help = ('Compare requests/sec and tail latency of the read-heavy pages served by the '
+            'WSGI application (a pool of sync workers) and the ASGI application (concurrent '
+            'async requests on one event loop), called in process with no server or network, '
+            'against a temporary seeded database. --db-latency-ms adds a delay to every query '
+            'to stand in for a database across the network.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=400, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight')
+        parser.add_argument('--workers', type=int, default=4, help='Sync workers serving WSGI')
+        parser.add_argument('--db-latency-ms', type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        temp_dir = None
+        if connection.vendor == 'sqlite':
+            # Worker threads need a shared on-disk database rather than an in-memory one.
+            temp_dir = tempfile.mkdtemp()
+            settings_dict['TEST'] = {**settings_dict.get('TEST', {}),
+                                     'NAME': os.path.join(temp_dir, 'asgi.sqlite3')}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        setup_test_environment()
+        try:
+            seed_catalog(options['books'], users=options['users'], stdout=self.stdout)
+            with override_settings(CATALOG_NOTIFICATIONS_ASYNC=False):
+                self.run(options)
+        finally:
+            teardown_test_environment()
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if temp_dir:
+                for name in os.listdir(temp_dir):
+                    os.remove(os.path.join(temp_dir, name))
+                os.rmdir(temp_dir)
+
+    def urls(self):
+        book = Book.objects.filter(reviews__isnull=False).first() or Book.objects.first()
+        term = book.title.split()[0]
+        return [
+            reverse('index'),
+            reverse('wishlist'),
+            reverse('notifications'),
+            reverse('book-reviews', args=[book.pk]),
+            f"{reverse('book-search')}?q={term}",
+        ]
+
+    def run(self, options):
+        user = (User.objects.filter(pk__in=Notification.objects.values('user_id')).first()
+                or User.objects.first())
+        login = Client()
+        login.force_login(user)
+        cookie = '; '.join(f'{name}={morsel.value}' for name, morsel in login.cookies.items())
+        urls = [url.partition('?')[::2] for url in self.urls()]
+        total = options['requests']
+
+        delay = options['db_latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        if delay:
+            connection_created.connect(add_latency)
+            connections.close_all()
+        try:
+            results = [('WSGI', *self.run_wsgi(urls, cookie, total, options['workers'])),
+                       ('ASGI', *self.run_asgi(urls, cookie, total, options['concurrency']))]
+        finally:
+            connection_created.disconnect(add_latency)
+
+        self.stdout.write(f"{total} requests, {options['concurrency']} in flight (ASGI), "
+                          f"{options['workers']} workers (WSGI), {options['db_latency_ms']} ms per query")
+        for mode, elapsed, timings in results:
+            timings.sort()
+            self.stdout.write(
+                f'{mode}: {len(timings) / elapsed:8.1f} req/s  mean {statistics.fmean(timings):7.2f} ms  '
+                f'p50 {percentile(timings, 50):7.2f} ms  p95 {percentile(timings, 95):7.2f} ms  '
+                f'p99 {percentile(timings, 99):7.2f} ms'
+            )
+
+    def run_wsgi(self, urls, cookie, total, workers):
+        application = WSGIHandler()
+
+        def request(i):
+            path, query = urls[i % len(urls)]
+            environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_COOKIE': cookie,
+                       'HTTP_HOST': 'testserver'}
+            setup_testing_defaults(environ)
+            status = []
+            start = time.perf_counter()
+            body = application(environ, lambda line, headers, exc_info=None: status.append(line))
+            try:
+                b''.join(body)
+            finally:
+                body.close()
+            assert status[0].startswith('200'), status[0]
+            return (time.perf_counter() - start) * 1000
+
+        def close(_):
+            connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            timings = list(pool.map(request, range(total)))
+            elapsed = time.perf_counter() - start
+            list(pool.map(close, range(workers)))
+        return elapsed, timings
+
+    def run_asgi(self, urls, cookie, total, concurrency):
+        application = ASGIHandler()
+
+        async def get(path, query):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                'query_string': query.encode(), 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+                'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            }
+            done = asyncio.Event()
+            messages = []
+
+            async def receive():
+                if not messages:
+                    messages.append(None)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if message['type'] == 'http.response.body' and not message.get('more_body'):
+                    done.set()
+
+            await application(scope, receive, send)
+            return messages[1]['status']
+
+        async def main():
+            limit = asyncio.Semaphore(concurrency)
+
+            async def request(i):
+                async with limit:
+                    start = time.perf_counter()
+                    status = await get(*urls[i % len(urls)])
+                    assert status == 200, status
+                    return (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            timings = await asyncio.gather(*(request(i) for i in range(total)))
+            return time.perf_counter() - start, list(timings)
+
+        return asyncio.run(main())
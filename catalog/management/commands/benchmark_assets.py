@@ -0,0 +1,58 @@
+import re
+import shutil
+import tempfile
+from urllib.parse import urlsplit
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+# Stylesheets, scripts and images a browser fetches before it can paint the page
+ASSET = re.compile(r'''<(?:link[^>]*rel="stylesheet"[^>]*href|script[^>]*src|img[^>]*src)="([^"]+)"''')
+
+
+class Command(BaseCommand):
+    help = ('Count the requests and bytes a browser needs to paint a page for the first '
+            'time: the page and the assets it links, served by WhiteNoise from a '
+            'temporary collectstatic run as in production. Assets on other hosts are '
+            'listed but cannot be measured.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='Page to measure (default: the login page)')
+        parser.add_argument('--accept-encoding', default='br, gzip')
+
+    def handle(self, *args, **options):
+        static_root = tempfile.mkdtemp()
+        setup_test_environment(debug=False)
+        try:
+            with override_settings(STATIC_ROOT=static_root):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                self.measure(options['path'] or reverse('login'), options['accept_encoding'])
+        finally:
+            teardown_test_environment()
+            shutil.rmtree(static_root)
+
+    def measure(self, path, accept_encoding):
+        client = Client(HTTP_ACCEPT_ENCODING=accept_encoding)
+        page = client.get(path)
+        assert page.status_code == 200, page.status_code
+        html = page.content.decode()
+        rows = [(path, len(page.content), page.get('Content-Encoding', ''), page.get('Cache-Control', ''))]
+        external = []
+        for url in ASSET.findall(html):
+            if urlsplit(url).netloc:
+                external.append(url)
+                continue
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            rows.append((url, len(body), response.get('Content-Encoding', ''), response.get('Cache-Control', '')))
+
+        for url, size, encoding, cache_control in rows:
+            self.stdout.write(f'{size:9d} B  {encoding or "identity":8}  {cache_control:42}  {url}')
+        for url in external:
+            self.stdout.write(f'{"?":>9} B  {"":8}  {"(another host)":42}  {url}')
+        self.stdout.write(f'{len(rows) + len(external)} requests ({len(external)} to other hosts), '
+                          f'{sum(row[1] for row in rows)} B measured')
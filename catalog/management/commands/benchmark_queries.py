@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from catalog.models import Book, BookInstance, BookReview, Notification, Wishlist
+from catalog.seeding import seed_catalog
+
+
+def hot_queries(user_id, book_id):
+    """
+    The lookups served by the composite indexes, as (name, queryset, evaluation)
+    """
+    return [
+        ('loans of a user',
+         BookInstance.objects.filter(borrower_id=user_id, status='o').order_by('due_back', 'id')[:10], list),
+        ('available copies (count)',
+         BookInstance.objects.filter(status='a').order_by(), lambda queryset: queryset.count()),
+        ('available copies of a book',
+         BookInstance.objects.filter(book_id=book_id, status='a'), list),
+        ('newest notifications of a user',
+         Notification.objects.filter(user_id=user_id).order_by('-created_at')[:20], list),
+        ('unread notifications of a user (count)',
+         Notification.objects.filter(user_id=user_id, is_read=False).order_by(),
+         lambda queryset: queryset.count()),
+        ('reviews of a book',
+         BookReview.objects.filter(book_id=book_id).order_by('created_at'), list),
+        ('wishers of a book',
+         Wishlist.objects.filter(book_id=book_id).values_list('user_id', flat=True), list),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Show query plans and latencies of the hot catalog lookups. By default a '
+            'temporary test database is created and seeded; use --use-existing to '
+            'measure the configured database as it is.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=50000)
+        parser.add_argument('--copies', type=int, default=3, help='Average copies per book')
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+        parser.add_argument('--use-existing', action='store_true',
+                            help='Run against the configured database without seeding')
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['use_existing']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            self.stdout.write('Seeding...')
+            seed_catalog(options['books'], copies=options['copies'], users=options['users'],
+                         stdout=self.stdout)
+        try:
+            self.run(options['repeat'])
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, repeat):
+        # A busy user and a popular book exercise the indexes hardest.
+        user_id = (BookInstance.objects.filter(status='o').values_list('borrower_id', flat=True).first()
+                   or User.objects.values_list('pk', flat=True).first())
+        book_id = (Wishlist.objects.values_list('book_id', flat=True).first()
+                   or Book.objects.values_list('pk', flat=True).first())
+        if user_id is None or book_id is None:
+            self.stderr.write('The database holds no users or books to query.')
+            return
+
+        for name, queryset, evaluate in hot_queries(user_id, book_id):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                evaluate(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write(
+                f'min {timings[0]:.3f} ms  median {statistics.median(timings):.3f} ms  '
+                f'p95 {timings[int(len(timings) * 0.95) - 1]:.3f} ms\n'
+            )
@@ -0,0 +1,110 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from catalog import visits
+from catalog.benchmarks import percentile
+from catalog.seeding import seed_catalog
+
+ENGINE = 'django.contrib.sessions.backends.'
+CACHED_USERS = ['catalog.auth.CachedModelBackend']
+
+# name -> settings; the first one is how every request worked before
+MODES = {
+    'db, uncached user': {'SESSION_ENGINE': ENGINE + 'db',
+                          'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+                          'CATALOG_VISITS_FLUSH_EVERY': 1},
+    'db': {'SESSION_ENGINE': ENGINE + 'db', 'AUTHENTICATION_BACKENDS': CACHED_USERS},
+    'cached_db': {'SESSION_ENGINE': ENGINE + 'cached_db', 'AUTHENTICATION_BACKENDS': CACHED_USERS},
+    'cache': {'SESSION_ENGINE': ENGINE + 'cache', 'AUTHENTICATION_BACKENDS': CACHED_USERS},
+    'signed_cookies': {'SESSION_ENGINE': ENGINE + 'signed_cookies', 'AUTHENTICATION_BACKENDS': CACHED_USERS},
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare the time and queries of authenticated page loads with each session engine, '
+            'with and without the cached user lookup and buffered visit counter, against a '
+            'temporary seeded database. --db-latency-ms adds a delay to every query to stand in '
+            'for a database across the network.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=500)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=600, help='Requests per mode')
+        parser.add_argument('--db-latency-ms', type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        setup_test_environment()
+        try:
+            seed_catalog(options['books'], users=options['users'], stdout=self.stdout)
+            with override_settings(CATALOG_NOTIFICATIONS_ASYNC=False):
+                self.run(options)
+        finally:
+            teardown_test_environment()
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        user = User.objects.filter(is_staff=False).first()
+        urls = [reverse('index'), reverse('books'), reverse('my-borrowed')]
+        delay = options['db_latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(delay)
+            return execute(sql, params, many, context)
+
+        # Every request runs on this thread's connection.
+        if delay:
+            connection.execute_wrappers.append(slow_query)
+        try:
+            results = [(name, *self.run_mode(mode, user, urls, options['requests']))
+                       for name, mode in MODES.items()]
+        finally:
+            if delay:
+                connection.execute_wrappers.remove(slow_query)
+
+        self.stdout.write(f"{options['requests']} authenticated requests per mode over {', '.join(urls)}, "
+                          f"{options['db_latency_ms']} ms per query")
+        baseline = statistics.fmean(results[0][2])
+        for name, queries, timings in results:
+            timings.sort()
+            mean = statistics.fmean(timings)
+            self.stdout.write(
+                f'{name:<18} {queries:5.2f} queries/page  mean {mean:7.2f} ms  '
+                f'p50 {percentile(timings, 50):7.2f} ms  p95 {percentile(timings, 95):7.2f} ms  '
+                f'saves {baseline - mean:6.2f} ms'
+            )
+
+    def run_mode(self, mode, user, urls, total):
+        """
+        Load the pages as a logged in user with the given settings
+        :return: (mean queries per page, list of ms per request)
+        """
+        with override_settings(**mode):
+            cache.clear()
+            visits.clear()
+            client = Client()
+            client.force_login(user)
+            for url in urls:
+                # Warm the fragment, counter and user caches.
+                client.get(url)
+            with CaptureQueriesContext(connection) as captured:
+                for url in urls * 10:
+                    client.get(url)
+            queries = len(captured) / (len(urls) * 10)
+            timings = []
+            for i in range(total):
+                start = time.perf_counter()
+                response = client.get(urls[i % len(urls)])
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.status_code
+        return queries, timings
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.recommendations import refresh_similar_books
+
+
+class Command(BaseCommand):
+    help = ('Precompute the "readers also liked" neighbours of each book from wishlists and '
+            'high-rated reviews. Meant to be run from cron or a Procfile scheduler; each run '
+            'only rebuilds the books affected by likes added since the previous run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild every book, also reflecting removed wishes and reviews')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        books, written, since = refresh_similar_books(full=options['full'])
+        elapsed = time.perf_counter() - start
+        window = f'likes since {since:%Y-%m-%d %H:%M:%S}' if since else 'full rebuild'
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the neighbours of {books} books ({window}), {written} rows written in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.holds import BATCH_SIZE, expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Release reserved copies not picked up by their deadline and pass them to the next in line'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        expired = expire_holds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{expired} holds expired in {time.perf_counter() - start:.2f}s'
+        ))
@@ -0,0 +1,35 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog import export
+
+
+class Command(BaseCommand):
+    help = 'Stream books, copies (loan state) or reviews to a file or stdout as CSV, JSONL or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(export.DATASETS))
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--output', '-o', help='File to write; defaults to stdout')
+
+    def handle(self, *args, **options):
+        chunks = export.export(options['dataset'], options['format'], options['gzip'])
+        start = time.perf_counter()
+        written = 0
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+        if options['output']:
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'Wrote {written} bytes to {options["output"]} in {elapsed:.1f}s '
+                              f'({written / elapsed / 2 ** 20 if elapsed else 0:.1f} MiB/s)')
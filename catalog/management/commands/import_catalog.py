@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog import counters, fragments, search
+from catalog.models import Author, Book, BookInstance, Genre, JobState, Language
+
+FIELDS = ('title', 'author_first_name', 'author_last_name', 'summary', 'isbn', 'genres',
+          'language', 'copies', 'imprint')
+
+
+def read_records(path, fmt):
+    """
+    Stream records from a CSV or JSONL file
+    :return: iterator of dicts
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def split_genres(value):
+    if isinstance(value, list):
+        return [name.strip() for name in value if name.strip()]
+    return [name.strip() for name in (value or '').split('|') if name.strip()]
+
+
+def copy_count(record):
+    """
+    :return: number of copies to create, or None if the value is not a non-negative whole number
+    """
+    try:
+        count = int(str(record.get('copies') or 0).strip())
+    except ValueError:
+        return None
+    return count if count >= 0 else None
+
+
+def author_name(record):
+    first, last = record.get('author_first_name'), record.get('author_last_name')
+    if first is None and last is None and record.get('author'):
+        # "Last, First" as shown by Author.__str__
+        last, _, first = record['author'].partition(',')
+    return (first or '').strip(), (last or '').strip()
+
+
+class Command(BaseCommand):
+    help = (f'Bulk import books and their copies from a CSV or JSONL file with the fields '
+            f'{", ".join(FIELDS)}. Genres are separated by "|" (or a JSON list) and copies is '
+            f'the number of available copies to create. Progress is checkpointed per chunk, so '
+            f'a failed import resumes where it stopped when run again on the unchanged file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint of a previous run and start from the top')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+        chunk_size = options['chunk_size']
+        job = f'import_catalog:{path}'
+        # A checkpoint only applies to the file it was written for.
+        stat = os.stat(path)
+        self.identity = f'{stat.st_size}:{stat.st_mtime_ns}'
+
+        if options['restart']:
+            JobState.objects.filter(name=job).delete()
+        state = JobState.objects.filter(name=job).first()
+        done = 0
+        if state:
+            identity, _, position = state.value.rpartition(':')
+            if identity == self.identity:
+                done = int(position)
+                self.stdout.write(f'Resuming after record {done}')
+            else:
+                self.stdout.write('The file changed since the last checkpoint; starting from the top')
+
+        self.genres = dict(Genre.objects.values_list('name', 'pk'))
+        self.languages = dict(Language.objects.values_list('name', 'pk'))
+        self.authors = {(first, last): pk for pk, first, last
+                        in Author.objects.values_list('pk', 'first_name', 'last_name').iterator()}
+
+        start = time.perf_counter()
+        imported = skipped = 0
+        position = 0
+        chunk = []
+        for position, record in enumerate(read_records(path, fmt), start=1):
+            if position <= done:
+                continue
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                imported, skipped = self.flush(chunk, job, position, imported, skipped, start)
+                chunk = []
+        if chunk:
+            imported, skipped = self.flush(chunk, job, position, imported, skipped, start)
+        # Completed: the next import of this path starts from the top.
+        JobState.objects.filter(name=job).delete()
+        fragments.invalidate('list')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} books ({skipped} skipped) in {elapsed:.1f}s '
+            f'({imported / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
+
+    def flush(self, chunk, job, position, imported, skipped, start):
+        with transaction.atomic():
+            books, skipped_here = self.import_chunk(chunk)
+            JobState.objects.update_or_create(name=job, defaults={'value': f'{self.identity}:{position}'})
+        imported += books
+        skipped += skipped_here
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'{position} records read, {imported} books imported '
+                          f'({imported / elapsed if elapsed else 0:.0f} rows/s)')
+        return imported, skipped
+
+    def resolve(self, lookup, keys, create):
+        """
+        Add the keys missing from lookup, creating their rows with create(keys)
+        :return: number of rows created
+        """
+        missing = [key for key in dict.fromkeys(keys) if key not in lookup]
+        if missing:
+            # bulk_create returns the objects, with their pks, in order
+            lookup.update(zip(missing, (obj.pk for obj in create(missing))))
+        return len(missing)
+
+    def import_chunk(self, chunk):
+        """
+        Insert one chunk of records
+        :return: (books imported, records skipped)
+        """
+        # Records without a title or with a malformed or negative copy count are skipped.
+        records = [record for record in chunk
+                   if (record.get('title') or '').strip() and copy_count(record) is not None]
+
+        self.resolve(
+            self.genres,
+            (name for record in records for name in split_genres(record.get('genres'))),
+            lambda names: Genre.objects.bulk_create(Genre(name=name) for name in names),
+        )
+        self.resolve(
+            self.languages,
+            ((record.get('language') or '').strip() for record in records if (record.get('language') or '').strip()),
+            lambda names: Language.objects.bulk_create(Language(name=name) for name in names),
+        )
+        new_authors = self.resolve(
+            self.authors,
+            (author_name(record) for record in records if any(author_name(record))),
+            lambda names: Author.objects.bulk_create(Author(first_name=first, last_name=last)
+                                                     for first, last in names),
+        )
+
+        books = Book.objects.bulk_create(
+            Book(
+                title=record['title'].strip(),
+                author_id=self.authors.get(author_name(record)),
+                summary=record.get('summary') or '',
+                isbn=str(record.get('isbn') or ''),
+                language_id=self.languages.get((record.get('language') or '').strip()),
+                # Every imported copy is available.
+                copies_available=copy_count(record),
+            )
+            for record in records
+        )
+        Through = Book.genre.through
+        Through.objects.bulk_create(
+            Through(book_id=book.pk, genre_id=self.genres[name])
+            for book, record in zip(books, records)
+            for name in dict.fromkeys(split_genres(record.get('genres')))
+        )
+        copies = BookInstance.objects.bulk_create(
+            BookInstance(book_id=book.pk, imprint=record.get('imprint') or '', status='a')
+            for book, record in zip(books, records)
+            for _ in range(copy_count(record))
+        )
+
+        # bulk_create sends no signals; keep the derived data in step.
+        search.index_books([book.pk for book in books])
+        counters.increment(counters.NUM_BOOKS, len(books))
+        counters.increment(counters.NUM_AUTHORS, new_authors)
+        counters.increment(counters.NUM_INSTANCES, len(copies))
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE, len(copies))
+        return len(books), len(chunk) - len(records)
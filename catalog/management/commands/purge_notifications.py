@@ -0,0 +1,19 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from catalog.notifications import BATCH_SIZE, purge_read
+
+
+class Command(BaseCommand):
+    help = 'Delete read notifications older than the retention period, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Retention period in days')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        deleted = purge_read(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} read notifications deleted'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized catalog counters from scratch'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            values = rebuild_counters()
+        for name, value in sorted(values.items()):
+            self.stdout.write(f'{name}: {value}')
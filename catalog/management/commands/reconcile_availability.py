@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.availability import drifted_books, reconcile_availability
+
+
+class Command(BaseCommand):
+    help = 'Fix books whose stored copy counts per status drifted from their copies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted books')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f'{drifted_books().count()} books drifted')
+            return
+        with transaction.atomic():
+            fixed = reconcile_availability()
+        self.stdout.write(self.style.SUCCESS(f'{fixed} books fixed'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.ratings import drifted_books, reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = 'Fix books whose stored review count or rating sum drifted from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted books')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f'{drifted_books().count()} books drifted')
+            return
+        with transaction.atomic():
+            fixed = reconcile_ratings()
+        self.stdout.write(self.style.SUCCESS(f'{fixed} books fixed'))
@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from catalog.benchmarks import SCENARIOS, compare, run_benchmarks
+from catalog.seeding import seed_catalog
+
+
+class Command(BaseCommand):
+    help = ('Time the main catalog pages and actions and write the results as JSON. By default '
+            'a temporary test database is created and seeded; use --use-existing to measure the '
+            'configured database (e.g. one filled by seed_catalog). With --compare the run fails '
+            'when a scenario regressed against an earlier results file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--copies', type=int, default=3, help='Average copies per book')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--use-existing', action='store_true',
+                            help='Run against the configured database without seeding')
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help='Only run this scenario; may be repeated')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed requests per scenario')
+        parser.add_argument('--clear-cache', action='store_true',
+                            help='Clear the cache before every request to measure cold renders')
+        parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+        parser.add_argument('--compare', metavar='BASELINE', help='Results file of an earlier run')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed median slowdown before a scenario counts as regressed')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        old_name = None
+        if not options['use_existing']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            self.stdout.write('Seeding...')
+            seed_catalog(options['books'], copies=options['copies'], users=options['users'],
+                         stdout=self.stdout)
+        # Lets the test client through ALLOWED_HOSTS
+        setup_test_environment()
+        try:
+            results = run_benchmarks(options['scenario'], options['repeat'], options['clear_cache'],
+                                     stdout=self.stdout)
+        finally:
+            teardown_test_environment()
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            for name, message in regressions:
+                self.stderr.write(f'{name}: {message}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,36 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import JobState
+from catalog.overdue import send_overdue_reminders
+
+JOB = 'scan_overdue'
+
+
+class Command(BaseCommand):
+    help = ('Send reminders for loans that became overdue since the last run. Meant to be run '
+            'daily from cron or a Procfile scheduler; each run only scans the due dates after '
+            'the previous run\'s watermark.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Ignore the watermark and remind about every overdue loan')
+
+    def handle(self, *args, **options):
+        today = datetime.date.today()
+        start = time.perf_counter()
+        with transaction.atomic():
+            state = JobState.objects.select_for_update().filter(name=JOB).first()
+            since = None
+            if state and state.value and not options['full']:
+                since = datetime.date.fromisoformat(state.value)
+            scanned, created = send_overdue_reminders(today, since)
+            JobState.objects.update_or_create(name=JOB, defaults={'value': today.isoformat()})
+        elapsed = time.perf_counter() - start
+        window = f'due {since} to {today - datetime.timedelta(days=1)}' if since else f'due before {today}'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} overdue loans ({window}), {created} reminders created in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.seeding import seed_catalog
+
+
+class Command(BaseCommand):
+    help = 'Fill the configured database with a synthetic catalog using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--copies', type=int, default=3, help='Average copies per book')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--wishes', type=int, default=5, help='Average wishlist entries per user')
+        parser.add_argument('--reviews', type=int, default=2, help='Average reviews per user')
+        parser.add_argument('--notifications', type=int, default=5, help='Average notifications per user')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        created = seed_catalog(options['books'], copies=options['copies'], users=options['users'],
+                               wishes=options['wishes'], reviews=options['reviews'],
+                               notifications=options['notifications'], seed=options['seed'],
+                               stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {sum(created.values())} rows in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,121 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+
+from catalog import loans
+from catalog.models import Book, BookInstance
+
+
+def naive_loan(user, copy_ids):
+    """
+    The former read-check-save loan, kept to show the race it allowed
+    :return: number of copies loaned
+    """
+    loaned = 0
+    for copy in BookInstance.objects.filter(pk__in=copy_ids):
+        if copy.status == 'a':
+            time.sleep(0)  # let another thread in between the check and the write
+            copy.status = 'o'
+            copy.borrower = user
+            copy.save()
+            loaned += 1
+    return loaned
+
+
+class Command(BaseCommand):
+    help = ('Hammer the loan engine from several threads against a temporary database '
+            'and report throughput, conflicts and double loans.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--copies', type=int, default=50)
+        parser.add_argument('--operations', type=int, default=500, help='Loan attempts per thread')
+        parser.add_argument('--batch', type=int, default=2, help='Copies borrowed per loan')
+        parser.add_argument('--naive', action='store_true',
+                            help='Use the unlocked read-check-save loan for comparison')
+
+    def handle(self, *args, **options):
+        settings_dict = connection.settings_dict
+        temp_dir = None
+        if connection.vendor == 'sqlite':
+            # Threads need a shared on-disk database rather than an in-memory one.
+            temp_dir = tempfile.mkdtemp()
+            settings_dict['TEST'] = {**settings_dict.get('TEST', {}),
+                                     'NAME': os.path.join(temp_dir, 'stress.sqlite3')}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Keep notification fan-outs on the worker threads being measured.
+            with override_settings(CATALOG_NOTIFICATIONS_ASYNC=False):
+                self.run(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if temp_dir:
+                os.rmdir(temp_dir)
+
+    def run(self, options):
+        book = Book.objects.create(title='Stress Test', summary='Stress test', isbn='0000000000000')
+        copy_ids = [BookInstance.objects.create(book=book, imprint='Stress', status='a').pk
+                    for _ in range(options['copies'])]
+        users = [User.objects.create_user(username=f'stress-{i}') for i in range(options['threads'])]
+        loan = naive_loan if options['naive'] else loans.loan_copies
+        tally = {'loaned': 0, 'returned': 0, 'conflicts': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(user, seed):
+            rng = random.Random(seed)
+            mine = []
+            result = dict.fromkeys(tally, 0)
+            try:
+                for _ in range(options['operations']):
+                    wanted = rng.sample(copy_ids, options['batch'])
+                    try:
+                        loaned = loan(user, wanted)
+                        result['loaned'] += loaned
+                        if loaned == len(wanted):
+                            mine.extend(wanted)
+                        else:
+                            result['conflicts'] += 1
+                    except loans.LoanConflict:
+                        result['conflicts'] += 1
+                    except OperationalError:
+                        result['errors'] += 1
+                    if mine and rng.random() < 0.5:
+                        returning, mine = mine, []
+                        try:
+                            result['returned'] += loans.return_copies(user, returning)
+                        except loans.LoanConflict:
+                            # Another thread overwrote one of our loans.
+                            result['conflicts'] += 1
+                        except OperationalError:
+                            result['errors'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in result.items():
+                        tally[key] += value
+
+        threads = [threading.Thread(target=worker, args=(user, i)) for i, user in enumerate(users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        attempts = options['threads'] * options['operations']
+        on_loan = BookInstance.objects.filter(status='o').count()
+        double_loans = tally['loaned'] - tally['returned'] - on_loan
+        self.stdout.write(f"{attempts} loan attempts by {options['threads']} threads in {elapsed:.2f}s "
+                          f"({attempts / elapsed:.0f} attempts/s)")
+        self.stdout.write(f"copies loaned {tally['loaned']}, returned {tally['returned']}, "
+                          f"conflicts {tally['conflicts']}, database errors {tally['errors']}")
+        style = self.style.ERROR if double_loans else self.style.SUCCESS
+        self.stdout.write(style(f'double loans: {double_loans}'))
@@ -0,0 +1,82 @@
+"""
+Middleware adapted to run in both sync (WSGI) and async (ASGI) stacks.
+
+A sync-only middleware forces Django to run everything below it, views
+included, through thread adapters, which undoes the point of async views.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from catalog import routers
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can also sit in an async middleware stack
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Scans the filesystem
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the catalog reads of each request (see catalog.routers) and keep
+    clients that wrote on the primary for CATALOG_REPLICA_STICKY_SECONDS
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.CATALOG_READ_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = routers.start_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.stick(state, response)
+
+    async def __acall__(self, request):
+        # The state object is shared with views run in threads by sync_to_async,
+        # which see a copy of this context.
+        state, token = routers.start_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.end_request(token)
+        return self.stick(state, response)
+
+    def stick(self, state, response):
+        if state.wrote:
+            response.set_cookie(routers.STICKY_COOKIE, '1', max_age=settings.CATALOG_REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
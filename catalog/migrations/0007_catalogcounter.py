@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:21
+
+from django.db import migrations, models
+
+
+def populate_counters(apps, schema_editor):
+    Author = apps.get_model('catalog', 'Author')
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    CatalogCounter = apps.get_model('catalog', 'CatalogCounter')
+    CatalogCounter.objects.bulk_create([
+        CatalogCounter(name='num_books', value=Book.objects.count()),
+        CatalogCounter(name='num_instances', value=BookInstance.objects.count()),
+        CatalogCounter(name='num_instance_available', value=BookInstance.objects.filter(status='a').count()),
+        CatalogCounter(name='num_authors', value=Author.objects.count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_book_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
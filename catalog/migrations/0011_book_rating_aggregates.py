@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:29
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def populate_aggregates(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookReview = apps.get_model('catalog', 'BookReview')
+    reviews = BookReview.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    review_count = Coalesce(Subquery(reviews.annotate(n=Count('*')).values('n')), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    Book.objects.update(
+        review_count=review_count,
+        rating_sum=rating_sum,
+        rating_avg=Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Average rating'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-rating_avg', 'id'], name='catalog_book_rating_idx'),
+        ),
+        migrations.RunPython(populate_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 03:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    Book.objects.update(**{
+        field: Coalesce(Subquery(copies.annotate(n=Count('pk', filter=Q(status=status))).values('n')), 0)
+        for status, field in (('a', 'copies_available'), ('o', 'copies_on_loan'),
+                              ('r', 'copies_reserved'), ('m', 'copies_maintenance'))
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_hold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_maintenance',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('copies_available__gt', 0)), fields=['title', 'id'], name='catalog_book_available_idx'),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+# catalog.counters.SLOTS when this migration was written
+SLOTS = 16
+
+
+def add_slots(apps, schema_editor):
+    CatalogCounter = apps.get_model('catalog', 'CatalogCounter')
+    names = CatalogCounter.objects.values_list('name', flat=True)
+    CatalogCounter.objects.bulk_create(
+        CatalogCounter(name=name, slot=slot) for name in list(names) for slot in range(1, SLOTS)
+    )
+
+
+def remove_slots(apps, schema_editor):
+    CatalogCounter = apps.get_model('catalog', 'CatalogCounter')
+    for name in list(CatalogCounter.objects.values_list('name', flat=True).distinct()):
+        total = CatalogCounter.objects.filter(name=name).aggregate(total=models.Sum('value'))['total']
+        CatalogCounter.objects.filter(name=name, slot=0).update(value=total)
+    CatalogCounter.objects.filter(slot__gt=0).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0019_loan_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogcounter',
+            name='slot',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='catalogcounter',
+            name='name',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AlterUniqueTogether(
+            name='catalogcounter',
+            unique_together={('name', 'slot')},
+        ),
+        migrations.RunPython(add_slots, remove_slots),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.utils import timezone
 from datetime import date
 
 
@@ -20,6 +21,27 @@ class Genre(models.Model):
         """
         return self.name
 
+class BookQuerySet(models.QuerySet):
+    """
+    Queryset with the related-object loading used by book pages
+    """
+
+    def with_listing_related(self):
+        """
+        Load what list pages and the admin changelist show for every row
+        :return: queryset
+        """
+        return self.select_related('author', 'language').prefetch_related('genre')
+
+    def with_detail_related(self):
+        """
+        Load what the detail page shows outside its cached fragments; the genres and
+        copies are queried only when a fragment has to be rendered
+        :return: queryset
+        """
+        return self.select_related('author', 'language')
+
+
 class Book(models.Model):
     """
     Model representing a book
@@ -31,6 +53,30 @@ class Book(models.Model):
     genre = models.ManyToManyField(Genre, help_text='Select a Genre for this book')
     language = models.ForeignKey('Language', help_text='Select the language of the book', on_delete=models.SET_NULL, null=True)
 
+    # Review aggregates maintained by catalog.ratings
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_avg = models.FloatField('Average rating', default=0, editable=False)
+
+    # Copies per status maintained by catalog.availability
+    copies_available = models.PositiveIntegerField(default=0, editable=False)
+    copies_on_loan = models.PositiveIntegerField(default=0, editable=False)
+    copies_reserved = models.PositiveIntegerField(default=0, editable=False)
+    copies_maintenance = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the book list
+            models.Index(fields=['title', 'id'], name='catalog_book_title_id_idx'),
+            # Sorting and filtering the book list by average rating
+            models.Index(fields=['-rating_avg', 'id'], name='catalog_book_rating_idx'),
+            # The "available now" filter of the book list
+            models.Index(fields=['title', 'id'], condition=models.Q(copies_available__gt=0),
+                         name='catalog_book_available_idx'),
+        ]
+
     def __str__(self):
         """
          String representation of the Model object
@@ -78,6 +124,18 @@ class BookInstance(models.Model):
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # Loans of a user (LoanedBooksByUserListView)
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='catalog_bi_borrower_status_idx'),
+            # Catalog-wide status counts
+            models.Index(fields=['status'], name='catalog_bi_status_idx'),
+            # Available copies of a book; partial where the backend supports it
+            models.Index(fields=['book'], condition=models.Q(status='a'), name='catalog_bi_available_idx'),
+            # Overdue scan: due_back < today among copies on loan
+            models.Index(fields=['due_back'], condition=models.Q(status='o'), name='catalog_bi_overdue_idx'),
+            # Admin changelist: default ordering, due_back date hierarchy and filter
+            models.Index(fields=['due_back', 'id'], name='catalog_bi_due_back_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id} ({self.book.title})'
@@ -126,6 +184,11 @@ class BookReview(models.Model):
     comment = models.TextField(max_length=1000)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['book', 'created_at'], name='catalog_review_book_date_idx'),
+        ]
+
     def __str__(self):
         return f"Review for {self.book.title} by {self.user.username}"
 
@@ -136,16 +199,187 @@ class Wishlist(models.Model):
 
     class Meta:
         unique_together = ('user', 'book')
+        indexes = [
+            # Covers the wishers-of-a-book fan-out without touching the table
+            models.Index(fields=['book', 'user'], name='catalog_wish_book_user_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} wishes {self.book.title}"
 
+class SimilarBook(models.Model):
+    """
+    Model storing one of the books most often wished or liked by the readers of a book
+    (see catalog.recommendations)
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_books')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    # 1 for the closest neighbour
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        # Also the index serving a book's neighbours in rank order
+        unique_together = ('book', 'rank')
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.score:.3f})"
+
+class Hold(models.Model):
+    """
+    Model representing a user's place in the reservation queue of a book
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='holds')
+    # Increases per book; the waiting hold with the lowest position is next in line
+    position = models.BigIntegerField()
+    # The copy set aside once it is the user's turn, to be picked up before the deadline
+    copy = models.OneToOneField(BookInstance, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='hold')
+    pickup_deadline = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['book', 'position']
+        unique_together = (('book', 'position'), ('book', 'user'))
+        indexes = [
+            # Head of a book's queue: the first waiting hold by position
+            models.Index(fields=['book', 'position'], condition=models.Q(copy__isnull=True),
+                         name='catalog_hold_queue_idx'),
+            # Expired pickups
+            models.Index(fields=['pickup_deadline'], condition=models.Q(copy__isnull=False),
+                         name='catalog_hold_deadline_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} holds {self.book.title} (#{self.position})"
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     message = models.CharField(max_length=255)
     is_read = models.BooleanField(default=False)
+    # Identifies what the notification is about so fan-outs can skip users
+    # who still have an unread notice for the same event
+    dedupe_key = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='catalog_notif_user_date_idx'),
+            models.Index(fields=['user', 'is_read'], name='catalog_notif_user_read_idx'),
+            # Retention purge of old read notifications
+            models.Index(fields=['created_at'], condition=models.Q(is_read=True),
+                         name='catalog_notif_read_date_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message}"
 
+
+class CatalogCounter(models.Model):
+    """
+    Model holding one slot of a denormalized catalog-wide aggregate (see catalog.counters)
+    """
+    name = models.CharField(max_length=50)
+    slot = models.PositiveSmallIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('name', 'slot'),)
+
+    def __str__(self):
+        return f"{self.name}[{self.slot}]: {self.value}"
+
+
+class JobState(models.Model):
+    """
+    Model recording the progress of a batch job (an import checkpoint, a scan watermark, ...)
+    """
+    name = models.CharField(max_length=255, unique=True)
+    value = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class LoanEvent(models.Model):
+    """
+    Model recording a loan, return or renewal of a copy; rows are only ever added (see catalog.circulation)
+    """
+    LOAN = 'loan'
+    RETURN = 'return'
+    RENEWAL = 'renewal'
+    KINDS = (
+        (LOAN, 'Loan'),
+        (RETURN, 'Return'),
+        (RENEWAL, 'Renewal'),
+    )
+    kind = models.CharField(max_length=7, choices=KINDS)
+    # Plain ids rather than foreign keys: the log outlives deleted copies, books and users
+    copy_id = models.UUIDField()
+    book_id = models.IntegerField(null=True, blank=True)
+    user_id = models.IntegerField(null=True, blank=True)
+    due_back = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Rollup windows and archiving by age
+            models.Index(fields=['created_at'], name='catalog_loanevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} of {self.copy_id} at {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class CirculationBucket(models.Model):
+    """
+    Loans, returns and renewals in a day or a month, aggregated from LoanEvent
+    """
+    DAY = 'day'
+    MONTH = 'month'
+    PERIODS = (
+        (DAY, 'Day'),
+        (MONTH, 'Month'),
+    )
+    period = models.CharField(max_length=5, choices=PERIODS)
+    # First day of the period
+    start = models.DateField()
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    renewals = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class BookCirculation(CirculationBucket):
+    """
+    Model holding the circulation of a book in a day or a month
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('period', 'start', 'book')
+        indexes = [
+            # Most borrowed books of a period
+            models.Index(fields=['period', 'start', '-loans'], name='catalog_bookcirc_top_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} {self.period} of {self.start}: {self.loans} loans"
+
+
+class GenreCirculation(CirculationBucket):
+    """
+    Model holding the circulation of the books of a genre in a day or a month
+    """
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('period', 'start', 'genre')
+
+    def __str__(self):
+        return f"{self.genre_id} {self.period} of {self.start}: {self.loans} loans"
@@ -0,0 +1,179 @@
+"""
+Notification fan-out and inbox.
+
+Notifications are written with batched ``bulk_create`` calls. Fan-outs
+triggered from a request are deferred until the surrounding transaction
+commits and, unless ``CATALOG_NOTIFICATIONS_ASYNC`` is off, handed to a
+background worker thread so large fan-outs do not hold up the response.
+
+Each user's unread count is cached. Creating or reading notifications
+drops the cached value of the users involved, so the next page view
+recounts once over the (user, is_read) index instead of on every page.
+Notifications are also created by the ``scan_overdue`` job and the
+fan-out thread, so counts are only cached when ``CATALOG_UNREAD_CACHE`` is
+on, which the settings do for caches every process shares (file, redis);
+otherwise every page counts.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+
+from catalog import routers
+from catalog.models import Book, Notification, Wishlist
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+UNREAD_TIMEOUT = 24 * 60 * 60
+
+_executor = None
+
+
+def notify_users(user_ids, message, dedupe_key=''):
+    """
+    Create one notification per user in batches of BATCH_SIZE
+    :return: number of notifications created
+    """
+    return create_notifications(
+        Notification(user_id=user_id, message=message, dedupe_key=dedupe_key) for user_id in user_ids
+    )
+
+
+def create_notifications(notes):
+    """
+    Insert Notification objects in batches of BATCH_SIZE
+    :return: number of notifications created
+    """
+    created = 0
+    batch = []
+    for note in notes:
+        batch.append(note)
+        if len(batch) >= BATCH_SIZE:
+            created += _create(batch)
+            batch = []
+    if batch:
+        created += _create(batch)
+    return created
+
+
+def _create(batch):
+    Notification.objects.bulk_create(batch)
+    forget_unread({notification.user_id for notification in batch})
+    return len(batch)
+
+
+def unread_key(user_id):
+    return f'catalog:unread:{user_id}'
+
+
+def unread_count(user_id):
+    """
+    Number of unread notifications of a user, cached
+    :return: int
+    """
+    if not getattr(settings, 'CATALOG_UNREAD_CACHE', False):
+        return Notification.objects.filter(user_id=user_id, is_read=False).count()
+    key = unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        # Not from a lagging replica: the count is kept until the next change.
+        count = Notification.objects.using(routers.PRIMARY).filter(user_id=user_id, is_read=False).count()
+        cache.set(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def forget_unread(user_ids):
+    """
+    Drop the cached unread counts of the given users
+    :return:
+    """
+    keys = [unread_key(user_id) for user_id in user_ids]
+    if not keys or not getattr(settings, 'CATALOG_UNREAD_CACHE', False):
+        return
+    cache.delete_many(keys)
+    # Again after commit, in case a count was taken from the old rows meanwhile.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def mark_read(user_id, notification_ids=None):
+    """
+    Mark the given notifications of a user, or all of them, read in one UPDATE
+    :return: number of notifications marked
+    """
+    notes = Notification.objects.filter(user_id=user_id, is_read=False)
+    if notification_ids is not None:
+        notes = notes.filter(pk__in=notification_ids)
+    marked = notes.update(is_read=True)
+    if marked:
+        forget_unread([user_id])
+    return marked
+
+
+def purge_read(before, batch_size=BATCH_SIZE):
+    """
+    Delete read notifications created before a datetime, batch_size rows per DELETE
+    :return: number of notifications deleted
+    """
+    old = Notification.objects.filter(is_read=True, created_at__lt=before).order_by()
+    deleted = 0
+    while True:
+        ids = list(old.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Notification.objects.filter(pk__in=ids).delete()[0]
+
+
+def availability_key(book_id):
+    return f'available:{book_id}'
+
+
+def notify_wishlist_users(book_id):
+    """
+    Tell everyone wishing for a book that a copy is available.
+
+    Users still holding an unread notice for the same book are skipped, so
+    repeated returns do not pile up duplicates.
+    :return: number of notifications created
+    """
+    title = Book.objects.filter(pk=book_id).values_list('title', flat=True).first()
+    if title is None:
+        return 0
+    key = availability_key(book_id)
+    unread = Notification.objects.filter(user=OuterRef('user'), dedupe_key=key, is_read=False)
+    user_ids = (Wishlist.objects.filter(book_id=book_id)
+                .filter(~Exists(unread))
+                .values_list('user_id', flat=True)
+                .iterator(chunk_size=BATCH_SIZE))
+    with transaction.atomic():
+        return notify_users(user_ids, f"'{title}' is now available!", dedupe_key=key)
+
+
+def _run_in_background(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background notification job %s%r failed', func.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def _submit(func, *args):
+    global _executor
+    if not getattr(settings, 'CATALOG_NOTIFICATIONS_ASYNC', True):
+        func(*args)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notifications')
+    _executor.submit(_run_in_background, func, *args)
+
+
+def schedule_availability_notice(book_id):
+    """
+    Notify wishlist users once the current transaction commits
+    :return:
+    """
+    transaction.on_commit(lambda: _submit(notify_wishlist_users, book_id))
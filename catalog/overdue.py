@@ -0,0 +1,61 @@
+"""
+Overdue loan scan.
+
+Overdue copies are found with one range query on the partial index over
+``due_back`` of copies on loan, streamed in borrower order and turned into
+one reminder notification per borrower, written in bulk.
+"""
+import datetime
+from itertools import groupby
+
+from django.db import transaction
+
+from catalog.models import BookInstance, Notification
+from catalog.notifications import BATCH_SIZE, create_notifications
+
+MESSAGE_LENGTH = Notification._meta.get_field('message').max_length
+
+
+def overdue_loans(today=None, since=None):
+    """
+    Copies on loan due before today, and on or after since if given
+    :return: queryset
+    """
+    today = today or datetime.date.today()
+    loans = BookInstance.objects.filter(status__exact='o', due_back__lt=today, borrower__isnull=False)
+    if since is not None:
+        loans = loans.filter(due_back__gte=since)
+    return loans
+
+
+def reminder_message(titles):
+    if len(titles) == 1:
+        message = f"'{titles[0]}' is overdue. Please return it."
+    else:
+        message = f"{len(titles)} books are overdue: " + ', '.join(f"'{title}'" for title in titles)
+    return message if len(message) <= MESSAGE_LENGTH else message[:MESSAGE_LENGTH - 3] + '...'
+
+
+def send_overdue_reminders(today=None, since=None):
+    """
+    Remind every borrower of their copies that became overdue in [since, today)
+    :return: (loans scanned, reminders created)
+    """
+    today = today or datetime.date.today()
+    rows = (overdue_loans(today, since)
+            .order_by('borrower_id', 'due_back')
+            .values_list('borrower_id', 'book__title')
+            .iterator(chunk_size=BATCH_SIZE))
+    scanned = 0
+
+    def reminders():
+        nonlocal scanned
+        for borrower_id, loans in groupby(rows, key=lambda row: row[0]):
+            titles = [title or 'Unknown book' for _, title in loans]
+            scanned += len(titles)
+            yield Notification(user_id=borrower_id, message=reminder_message(titles),
+                               dedupe_key=f'overdue:{today.isoformat()}')
+
+    with transaction.atomic():
+        created = create_notifications(reminders())
+    return scanned, created
@@ -0,0 +1,235 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Instead of ``OFFSET n`` every page seeks past the ordering key of the last
+row it has seen, so page N costs the same as page 1 as long as the ordering
+is backed by an index. No total count is taken; pages link to each other
+through opaque cursor tokens.
+
+``EstimatedCountPaginator`` keeps page numbers but, for unfiltered listings
+of large tables, reads the planner's row estimate instead of ``COUNT(*)``.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _after(field, value, descending):
+    """
+    Rows sorting after value on field; nulls sort last ascending, first descending
+    :return: Q
+    """
+    if descending:
+        return Q(**{f'{field}__isnull': False}) if value is None else Q(**{f'{field}__lt': value})
+    if value is None:
+        return Q(pk__in=[])
+    return Q(**{f'{field}__gt': value}) | Q(**{f'{field}__isnull': True})
+
+
+def _equal(field, value):
+    return Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+
+
+class CursorPage:
+    """
+    A page of results together with the cursors of its neighbours
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset by seeking on its ordering key.
+
+    ``ordering`` is a sequence of field names (prefixed with '-' for
+    descending order) whose last entry must be unique, e.g. ('title', 'id').
+    """
+    is_cursor = True
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def _order_by(self, backwards):
+        expressions = []
+        for field, descending in self.ordering:
+            if descending != backwards:
+                expressions.append(F(field).desc(nulls_first=True))
+            else:
+                expressions.append(F(field).asc(nulls_last=True))
+        return expressions
+
+    def _seek(self, values, backwards):
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for (field, descending), value in zip(self.ordering, values):
+            condition |= prefix & _after(field, value, descending != backwards)
+            prefix &= _equal(field, value)
+        return condition
+
+    def encode_cursor(self, obj, backwards):
+        values = [getattr(obj, field) for field, descending in self.ordering]
+        payload = json.dumps([int(backwards), values], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            backwards, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError('cursor does not match the ordering')
+            meta = self.queryset.model._meta
+            values = [
+                None if value is None else meta.get_field(field).to_python(value)
+                for (field, descending), value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, UnicodeDecodeError, ValidationError) as e:
+            raise InvalidCursor(str(e))
+        return bool(backwards), values
+
+    def _window(self, cursor):
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            backwards, values = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._seek(values, backwards))
+        # One extra row tells whether there is anything beyond this page.
+        return backwards, queryset.order_by(*self._order_by(backwards))[:self.per_page + 1]
+
+    def page(self, cursor=None):
+        """
+        Fetch the page starting after (or, going back, ending before) cursor
+        :return: CursorPage
+        """
+        backwards, window = self._window(cursor)
+        return self._page(list(window), cursor, backwards)
+
+    async def apage(self, cursor=None):
+        """
+        Async version of page()
+        :return: CursorPage
+        """
+        backwards, window = self._window(cursor)
+        return self._page([row async for row in window], cursor, backwards)
+
+    def _page(self, rows, cursor, backwards):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        next_cursor = previous_cursor = None
+        if rows:
+            if more or backwards:
+                next_cursor = self.encode_cursor(rows[-1], backwards=False)
+            if (more and backwards) or (cursor and not backwards):
+                previous_cursor = self.encode_cursor(rows[0], backwards=True)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """
+    ListView mixin paginating with CursorPaginator.
+
+    Set pagination_mode = 'offset' to fall back to Django's page-number
+    pagination over the same ordering.
+    """
+    pagination_mode = 'cursor'
+    cursor_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def get_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.pagination_mode != 'cursor':
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.get_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Invalid page cursor.')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def estimated_count(model, using='default'):
+    """
+    The planner's row estimate for the table of model
+    :return: int, or None when the backend keeps no (or no current) estimate
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # -1 until the table is first vacuumed or analyzed
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(table)])
+        elif connection.vendor == 'sqlite':
+            # sqlite_stat1 exists once ANALYZE has run. Each row starts with the number of
+            # entries of one index, which is the row count unless the index is partial.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting unfiltered querysets from the planner's estimate.
+
+    Counts below CATALOG_ADMIN_EXACT_COUNT_LIMIT, and counts of filtered
+    querysets, which can use an index, stay exact.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= getattr(settings, 'CATALOG_ADMIN_EXACT_COUNT_LIMIT', 100000):
+                return estimate
+        return super().count
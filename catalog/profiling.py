@@ -0,0 +1,298 @@
+"""
+Opt-in request profiling.
+
+``ProfilingMiddleware`` records, per resolved URL name, the wall time, the
+number and total time of SQL queries, queries repeated within a request
+(the fingerprints of likely N+1 loops) and the template render time. It
+aggregates them in process into histograms, served by the staff-only
+``profiling-stats`` (JSON) and ``profiling-metrics`` (Prometheus text)
+views, and adds a ``Server-Timing`` header to profiled responses.
+
+``CATALOG_PROFILING_SAMPLE_RATE`` is the fraction of requests profiled. At
+0 (the default) the middleware removes itself at startup, so it costs
+nothing; unsampled requests pay only for one random number. The middleware is
+async-capable, so under ASGI it does not force the chain back to sync.
+"""
+import contextvars
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import base as template_base
+
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+# Fingerprints kept per view, most frequent first
+TOP_FINGERPRINTS = 10
+
+_current = contextvars.ContextVar('catalog_profile', default=None)
+_lock = threading.Lock()
+_views = {}
+_templates_instrumented = False
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_VALUES_LIST = re.compile(r'VALUES (?:\((?:%s, )*%s\), )*\((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    """
+    The SQL with variable-length parameter lists collapsed
+    :return: str
+    """
+    return _VALUES_LIST.sub('VALUES (...)', _IN_LIST.sub('IN (...)', sql))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        (upper bound, observations <= bound) pairs, ending with '+Inf'
+        :return: list
+        """
+        running = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'buckets': self.cumulative(),
+        }
+
+
+class ViewStats:
+    def __init__(self):
+        self.duration_ms = Histogram(DURATION_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.duplicate_queries = 0
+        self.fingerprints = Counter()
+
+    def record(self, profile, duration_ms):
+        self.duration_ms.observe(duration_ms)
+        self.queries.observe(len(profile.queries))
+        self.db_ms += profile.db_ms
+        self.template_ms += profile.template_ms
+        for sql, count in profile.duplicates().items():
+            self.duplicate_queries += count - 1
+            self.fingerprints[sql] += count - 1
+        if len(self.fingerprints) > TOP_FINGERPRINTS * 10:
+            self.fingerprints = Counter(dict(self.fingerprints.most_common(TOP_FINGERPRINTS)))
+
+    def as_dict(self):
+        return {
+            'duration_ms': self.duration_ms.as_dict(),
+            'queries': self.queries.as_dict(),
+            'db_ms': self.db_ms,
+            'template_ms': self.template_ms,
+            'duplicate_queries': self.duplicate_queries,
+            'repeated_fingerprints': self.fingerprints.most_common(TOP_FINGERPRINTS),
+        }
+
+
+class Profile:
+    """
+    Measurements of one request
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - start) * 1000
+            self.queries.append(fingerprint(sql))
+
+    def duplicates(self):
+        return {sql: count for sql, count in Counter(self.queries).items() if count > 1}
+
+
+def _instrument_templates():
+    """
+    Time the outermost Template.render of profiled requests
+    :return:
+    """
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    render = template_base.Template.render
+
+    def timed_render(self, context):
+        profile = _current.get()
+        if profile is None:
+            return render(self, context)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_depth -= 1
+            if not profile.template_depth:
+                profile.template_ms += (time.perf_counter() - start) * 1000
+
+    template_base.Template.render = timed_render
+    _templates_instrumented = True
+
+
+def record(view_name, profile, duration_ms):
+    with _lock:
+        stats = _views.get(view_name)
+        if stats is None:
+            stats = _views[view_name] = ViewStats()
+        stats.record(profile, duration_ms)
+
+
+def snapshot():
+    """
+    Aggregated measurements per URL name
+    :return: dict
+    """
+    with _lock:
+        return {name: stats.as_dict() for name, stats in sorted(_views.items())}
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"')
+
+
+def prometheus():
+    """
+    The aggregates in the Prometheus text exposition format
+    :return: str
+    """
+    lines = []
+    views = snapshot()
+    for metric, key, help_text in (
+        ('catalog_request_duration_milliseconds', 'duration_ms', 'Wall time of profiled requests'),
+        ('catalog_request_queries', 'queries', 'SQL queries per profiled request'),
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+        for name, stats in views.items():
+            histogram = stats[key]
+            for bound, count in histogram['buckets']:
+                lines.append(f'{metric}_bucket{{view="{_label(name)}",le="{bound}"}} {count}')
+            lines.append(f'{metric}_sum{{view="{_label(name)}"}} {histogram["sum"]}')
+            lines.append(f'{metric}_count{{view="{_label(name)}"}} {histogram["count"]}')
+    for metric, key, help_text in (
+        ('catalog_db_milliseconds_total', 'db_ms', 'Time spent in SQL'),
+        ('catalog_template_milliseconds_total', 'template_ms', 'Time spent rendering templates'),
+        ('catalog_duplicate_queries_total', 'duplicate_queries', 'Queries repeating an earlier one'),
+    ):
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for name, stats in views.items():
+            lines.append(f'{metric}{{view="{_label(name)}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def wrap_connections(stack, profile):
+    """
+    Record the queries of every connection of the current thread in profile
+    until stack is closed
+    """
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests; see the module docstring
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'CATALOG_PROFILING_SAMPLE_RATE', 0.0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.server_timing = getattr(settings, 'CATALOG_PROFILING_SERVER_TIMING', True)
+        _instrument_templates()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        profile = Profile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                wrap_connections(stack, profile)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        profile = Profile()
+        # Views run in threads by sync_to_async see a copy of this context, so
+        # they report to the same profile.
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                # Connections are per thread: wrap those of the thread the ORM
+                # and sync views of this request run in.
+                await sync_to_async(wrap_connections)(stack, profile)
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, profile, start)
+
+    def finish(self, request, response, profile, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+        match = getattr(request, 'resolver_match', None)
+        record(match.view_name if match else '<unresolved>', profile, duration_ms)
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'total;dur={duration_ms:.1f}, '
+                f'db;dur={profile.db_ms:.1f};desc="{len(profile.queries)} queries", '
+                f'tpl;dur={profile.template_ms:.1f}'
+            )
+        return response
@@ -0,0 +1,69 @@
+"""
+Per-book review aggregates.
+
+``Book.review_count``, ``rating_sum`` and ``rating_avg`` are adjusted in a
+single UPDATE whenever a review is added, changed or removed (see
+``catalog.signals``), so list pages can sort and filter on the average
+without aggregating reviews.
+"""
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from catalog.models import Book, BookReview
+
+BATCH_SIZE = 1000
+
+
+def average(rating_sum, review_count):
+    """
+    Average rating expression; 0 for books without reviews
+    :return: expression
+    """
+    return Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), Value(0.0))
+
+
+def apply_review_delta(book_id, count_delta, sum_delta):
+    """
+    Atomically adjust the aggregates of a book
+    :return:
+    """
+    if not count_delta and not sum_delta:
+        return
+    # All right-hand sides see the row as it was before the UPDATE.
+    Book.objects.filter(pk=book_id).update(
+        review_count=F('review_count') + count_delta,
+        rating_sum=F('rating_sum') + sum_delta,
+        rating_avg=average(F('rating_sum') + sum_delta, F('review_count') + count_delta),
+    )
+
+
+def drifted_books():
+    """
+    Books whose stored aggregates disagree with their reviews
+    :return: queryset annotated with actual_count and actual_sum
+    """
+    reviews = BookReview.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    return Book.objects.annotate(
+        actual_count=Coalesce(Subquery(reviews.annotate(n=Count('*')).values('n')), 0),
+        actual_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+    ).exclude(review_count=F('actual_count'), rating_sum=F('actual_sum'))
+
+
+def reconcile_ratings():
+    """
+    Recompute the aggregates of every book that drifted
+    :return: number of books fixed
+    """
+    fixed = 0
+    batch = []
+    for book in drifted_books().only('pk').iterator(chunk_size=BATCH_SIZE):
+        book.review_count = book.actual_count
+        book.rating_sum = book.actual_sum
+        book.rating_avg = book.actual_sum / book.actual_count if book.actual_count else 0.0
+        batch.append(book)
+        if len(batch) >= BATCH_SIZE:
+            fixed += Book.objects.bulk_update(batch, ['review_count', 'rating_sum', 'rating_avg'])
+            batch = []
+    if batch:
+        fixed += Book.objects.bulk_update(batch, ['review_count', 'rating_sum', 'rating_avg'])
+    return fixed
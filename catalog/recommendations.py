@@ -0,0 +1,163 @@
+"""
+"Readers also liked" recommendations from precomputed book neighbours.
+
+A reader likes a book if it is on their wishlist or they reviewed it with
+at least ``MIN_RATING``. Two books are similar when many readers like
+both: the score is the cosine similarity of their reader sets,
+``common / sqrt(readers(a) * readers(b))``. That is the book x book
+product of the sparse reader x book matrix, computed one row per book from
+dicts of reader sets, so only the nonzero cells are ever visited.
+
+``rebuild_similar_books`` processes ``CHUNK_SIZE`` books at a time and
+only loads the likes of the readers of those books, so memory is bounded
+by the chunk rather than the catalog. The ``NEIGHBOURS`` best matches of
+each book are stored as ``SimilarBook`` rows, and the detail page reads
+them with one indexed query. ``refresh_similar_books`` (run by
+``manage.py build_recommendations``) only rebuilds the books whose
+neighbours may have changed since its last run: every book liked by a
+reader who added a like. Other books keep their lists, in which a newly
+popular book may now score a little high, and deleted wishes and reviews
+leave no trace to find; both are only reflected by a full rebuild.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from catalog.models import BookReview, JobState, SimilarBook, Wishlist
+
+JOB = 'build_recommendations'
+MIN_RATING = 4
+NEIGHBOURS = 10
+CHUNK_SIZE = 500
+# Readers per IN (...) list
+BATCH_SIZE = 1000
+
+
+def _likes(book_ids=None, user_ids=None):
+    """
+    Distinct (book id, user id) likes, optionally restricted to some books or readers
+    :return: queryset of tuples
+    """
+    wished = Wishlist.objects.values_list('book_id', 'user_id')
+    reviewed = BookReview.objects.filter(rating__gte=MIN_RATING).values_list('book_id', 'user_id')
+    if book_ids is not None:
+        wished, reviewed = wished.filter(book_id__in=book_ids), reviewed.filter(book_id__in=book_ids)
+    if user_ids is not None:
+        wished, reviewed = wished.filter(user_id__in=user_ids), reviewed.filter(user_id__in=user_ids)
+    return wished.order_by().union(reviewed.order_by())
+
+
+def readers_per_book():
+    """
+    Number of readers who like each book
+    :return: Counter of book id -> readers
+    """
+    return Counter(book_id for book_id, user_id in _likes().iterator())
+
+
+def _books_of(user_ids):
+    """
+    :return: dict of user id -> set of liked book ids
+    """
+    user_ids = list(user_ids)
+    books = defaultdict(set)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        for book_id, user_id in _likes(user_ids=user_ids[start:start + BATCH_SIZE]):
+            books[user_id].add(book_id)
+    return books
+
+
+def neighbours(book_ids, readers):
+    """
+    Best matches of some books, given readers_per_book()
+    :return: dict of book id -> list of (score, similar book id), best first
+    """
+    readers_of = defaultdict(set)
+    for book_id, user_id in _likes(book_ids=book_ids):
+        readers_of[book_id].add(user_id)
+    books_of = _books_of(set().union(*readers_of.values()))
+    result = {}
+    for book_id in book_ids:
+        likers = readers_of.get(book_id, ())
+        common = Counter()
+        for user_id in likers:
+            common.update(books_of[user_id])
+        common.pop(book_id, None)
+        # Likes added since readers was counted may exceed it.
+        own = max(readers[book_id], len(likers))
+        scores = ((count / math.sqrt(own * max(readers[other], count)), other)
+                  for other, count in common.items())
+        # Ties go to the lower id, so rebuilds are deterministic.
+        result[book_id] = heapq.nlargest(NEIGHBOURS, scores, key=lambda pair: (pair[0], -pair[1]))
+    return result
+
+
+def rebuild_similar_books(book_ids, readers=None):
+    """
+    Recompute and store the neighbours of the given books, CHUNK_SIZE books per transaction
+    :return: number of SimilarBook rows written
+    """
+    book_ids = sorted(book_ids)
+    if readers is None:
+        readers = readers_per_book()
+    written = 0
+    for start in range(0, len(book_ids), CHUNK_SIZE):
+        chunk = book_ids[start:start + CHUNK_SIZE]
+        rows = [SimilarBook(book_id=book_id, similar_id=other, rank=rank, score=score)
+                for book_id, matches in neighbours(chunk, readers).items()
+                for rank, (score, other) in enumerate(matches, 1)]
+        with transaction.atomic():
+            SimilarBook.objects.filter(book_id__in=chunk).delete()
+            SimilarBook.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def changed_books(since):
+    """
+    Books whose neighbours may differ because of likes added since the given time:
+    every book liked by a reader who added one
+    :return: set of book ids
+    """
+    readers = set(Wishlist.objects.filter(date_added__gte=since).values_list('user_id', flat=True))
+    readers.update(BookReview.objects.filter(created_at__gte=since, rating__gte=MIN_RATING)
+                   .values_list('user_id', flat=True))
+    return set().union(*_books_of(readers).values())
+
+
+def refresh_similar_books(full=False):
+    """
+    Rebuild the neighbours of every liked book, or with full=False only of the books
+    changed since the previous run
+    :return: (books rebuilt, SimilarBook rows written, start of the window or None for a full rebuild)
+    """
+    started = timezone.now()
+    state = JobState.objects.filter(name=JOB).first()
+    since = None
+    if state and state.value and not full:
+        since = datetime.fromisoformat(state.value)
+    readers = readers_per_book()
+    if since is None:
+        book_ids = set(readers)
+        # Books nobody likes any more keep no neighbours.
+        unliked = sorted(set(SimilarBook.objects.order_by().values_list('book_id', flat=True).distinct()) - book_ids)
+        for start in range(0, len(unliked), BATCH_SIZE):
+            SimilarBook.objects.filter(book_id__in=unliked[start:start + BATCH_SIZE]).delete()
+    else:
+        book_ids = changed_books(since)
+    written = rebuild_similar_books(book_ids, readers)
+    # Likes added while the job ran are picked up next time.
+    JobState.objects.update_or_create(name=JOB, defaults={'value': started.isoformat()})
+    return len(book_ids), written, since
+
+
+def similar_books(book):
+    """
+    Stored neighbours of a book, best first
+    :return: queryset of SimilarBook with the similar book loaded
+    """
+    return SimilarBook.objects.filter(book=book).select_related('similar').order_by('rank')
@@ -0,0 +1,101 @@
+"""
+Read-replica routing.
+
+While ``ReplicaRoutingMiddleware`` serves a GET (or HEAD/OPTIONS) request,
+reads of the catalog models go to one of ``CATALOG_READ_REPLICAS``, picked
+per request so that all of its queries see the same snapshot. Everything
+else uses the primary (``default``):
+
+* writes, and every read of a request with an unsafe method;
+* every later read of a request once it wrote to a catalog model;
+* requests arriving within ``CATALOG_REPLICA_STICKY_SECONDS`` of the same
+  client's last write, so users see their own loans, reviews and wishlist
+  changes despite replication lag;
+* other apps' models (sessions, users), management commands and
+  background threads.
+
+Data read from a replica may lag, so it must not fill long-lived shared
+caches: ``catalog.fragments`` keeps what such a request renders apart and
+briefly (``uses_replica``), and cached counts are read from the primary.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+
+PRIMARY = 'default'
+# Set on responses to requests that wrote; its presence pins reads to the primary
+STICKY_COOKIE = 'catalog_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = contextvars.ContextVar('catalog_routing', default=None)
+
+
+class RoutingState:
+    """
+    Routing of the current request
+    """
+
+    def __init__(self, replica):
+        # Alias the catalog reads go to, None for the primary
+        self.replica = replica
+        self.wrote = False
+        # Whether a catalog read went to the replica, before a write pinned the request
+        self.read_replica = False
+
+
+def start_request(request):
+    """
+    Choose where the reads of a request go
+    :return: (RoutingState, token for end_request)
+    """
+    replicas = settings.CATALOG_READ_REPLICAS
+    pinned = request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES
+    state = RoutingState(None if pinned or not replicas else random.choice(replicas))
+    return state, _state.set(state)
+
+
+def end_request(token):
+    _state.reset(token)
+
+
+def uses_replica():
+    """
+    Whether the current request reads, or has read, catalog data from a replica
+    :return: bool
+    """
+    state = _state.get()
+    return state is not None and (state.replica is not None or state.read_replica)
+
+
+class ReplicaRouter:
+    """
+    Send catalog reads of replica-eligible requests to their replica; see the module docstring
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or model._meta.app_label != 'catalog':
+            return None
+        state.read_replica = True
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label == 'catalog':
+            # Read your own writes for the rest of the request.
+            state.wrote = True
+            state.replica = None
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {PRIMARY, *settings.CATALOG_READ_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication.
+        if db in settings.CATALOG_READ_REPLICAS:
+            return False
+        return None
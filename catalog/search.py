@@ -0,0 +1,221 @@
+"""
+Full-text search over the book catalog.
+
+The inverted index lives in a backend specific table next to the catalog
+tables and is kept up to date by the handlers in ``catalog.signals``:
+
+* SQLite: the FTS5 virtual table ``catalog_book_fts`` (rowid = book id).
+* PostgreSQL: ``catalog_book_search`` holding one weighted ``tsvector`` per
+  book behind a GIN index.
+
+Any other backend falls back to ``icontains`` lookups.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from catalog.models import Book
+
+FTS_TABLE = 'catalog_book_fts'
+PG_TABLE = 'catalog_book_search'
+
+# Longer queries add little precision but make every MATCH more expensive.
+MAX_TERMS = 8
+
+SQLITE_DOCUMENT_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, title, author, summary, isbn, genre)
+    SELECT b.id, b.title,
+           COALESCE(a.first_name || ' ' || a.last_name, ''),
+           b.summary, b.isbn,
+           COALESCE((SELECT group_concat(g.name, ' ')
+                       FROM catalog_book_genre bg
+                       JOIN catalog_genre g ON g.id = bg.genre_id
+                      WHERE bg.book_id = b.id), '')
+      FROM catalog_book b
+      LEFT JOIN catalog_author a ON a.id = b.author_id
+"""
+
+POSTGRES_DOCUMENT_SQL = f"""
+    INSERT INTO {PG_TABLE} (book_id, document)
+    SELECT b.id,
+           setweight(to_tsvector('simple', b.title), 'A') ||
+           setweight(to_tsvector('simple', COALESCE(a.first_name || ' ' || a.last_name, '')), 'A') ||
+           setweight(to_tsvector('simple', b.isbn), 'A') ||
+           setweight(to_tsvector('simple', COALESCE(string_agg(g.name, ' '), '')), 'B') ||
+           setweight(to_tsvector('simple', b.summary), 'C')
+      FROM catalog_book b
+      LEFT JOIN catalog_author a ON a.id = b.author_id
+      LEFT JOIN catalog_book_genre bg ON bg.book_id = b.id
+      LEFT JOIN catalog_genre g ON g.id = bg.genre_id
+"""
+
+
+def _connection(write=False):
+    """
+    Connection holding the index for the Book table
+    :return: connection
+    """
+    alias = router.db_for_write(Book) if write else router.db_for_read(Book)
+    return connections[alias or 'default']
+
+
+def parse_terms(query):
+    """
+    Split a user supplied query into lower-cased search terms
+    :return: list of terms
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def index_books(book_ids):
+    """
+    (Re)build the index entries of the given books
+    :return:
+    """
+    book_ids = [int(pk) for pk in book_ids]
+    if not book_ids:
+        return
+    connection = _connection(write=True)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(book_ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', book_ids)
+            cursor.execute(f'{SQLITE_DOCUMENT_SQL} WHERE b.id IN ({placeholders})', book_ids)
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DELETE FROM {PG_TABLE} WHERE book_id = ANY(%s)', [book_ids])
+            cursor.execute(f'{POSTGRES_DOCUMENT_SQL} WHERE b.id = ANY(%s) GROUP BY b.id, a.id',
+                           [book_ids])
+
+
+def remove_books(book_ids):
+    """
+    Drop the index entries of the given books
+    :return:
+    """
+    book_ids = [int(pk) for pk in book_ids]
+    if not book_ids:
+        return
+    connection = _connection(write=True)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            placeholders = ', '.join(['%s'] * len(book_ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', book_ids)
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DELETE FROM {PG_TABLE} WHERE book_id = ANY(%s)', [book_ids])
+
+
+def rebuild_index():
+    """
+    Rebuild the whole index from the catalog tables
+    :return:
+    """
+    connection = _connection(write=True)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(SQLITE_DOCUMENT_SQL)
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'TRUNCATE {PG_TABLE}')
+            cursor.execute(f'{POSTGRES_DOCUMENT_SQL} GROUP BY b.id, a.id')
+
+
+class SearchResults:
+    """
+    Ranked search results, evaluated lazily one page at a time.
+
+    Supports ``count()`` and slicing so it can be handed straight to
+    Django's Paginator.
+    """
+
+    def __init__(self, query, available=False):
+        self.query = query
+        self.terms = parse_terms(query)
+        self.available = available
+        self._count = None
+
+    @property
+    def connection(self):
+        # Looked up on use: connections are per thread and async views
+        # evaluate the results in a worker thread.
+        return _connection()
+
+    def _fallback_queryset(self):
+        queryset = Book.objects.filter(copies_available__gt=0) if self.available else Book.objects.all()
+        for term in self.terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(author__first_name__icontains=term) |
+                Q(author__last_name__icontains=term) | Q(summary__icontains=term) |
+                Q(isbn__icontains=term) | Q(genre__name__icontains=term)
+            )
+        return queryset.distinct().order_by('title', 'id')
+
+    def _match(self):
+        if self.connection.vendor == 'sqlite':
+            # Every term is a quoted prefix query; juxtaposed terms are ANDed.
+            return ' '.join(f'"{term}"*' for term in self.terms)
+        return ' & '.join(f'{term}:*' for term in self.terms)
+
+    def _available_join(self):
+        # Restricting to books with an available copy needs the book row.
+        if not self.available:
+            return '', ''
+        key = f'{FTS_TABLE}.rowid' if self.connection.vendor == 'sqlite' else f'{PG_TABLE}.book_id'
+        return f' JOIN catalog_book b ON b.id = {key}', ' AND b.copies_available > 0'
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self._count is None:
+            join, where = self._available_join()
+            if self.connection.vendor == 'sqlite':
+                sql = f'SELECT count(*) FROM {FTS_TABLE}{join} WHERE {FTS_TABLE} MATCH %s{where}'
+            elif self.connection.vendor == 'postgresql':
+                sql = f"SELECT count(*) FROM {PG_TABLE}{join} WHERE document @@ to_tsquery('simple', %s){where}"
+            else:
+                self._count = self._fallback_queryset().count()
+                return self._count
+            with self.connection.cursor() as cursor:
+                cursor.execute(sql, [self._match()])
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def _ids(self, offset, limit):
+        join, where = self._available_join()
+        if self.connection.vendor == 'sqlite':
+            # Column weights: title, author, summary, isbn, genre.
+            sql = (f'SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE}{join} WHERE {FTS_TABLE} MATCH %s{where} '
+                   f'ORDER BY bm25({FTS_TABLE}, 10.0, 8.0, 1.0, 10.0, 4.0), {FTS_TABLE}.rowid '
+                   f'LIMIT %s OFFSET %s')
+        else:
+            sql = (f"SELECT {PG_TABLE}.book_id FROM {PG_TABLE}{join}, to_tsquery('simple', %s) query "
+                   f'WHERE document @@ query{where} ORDER BY ts_rank_cd(document, query) DESC, {PG_TABLE}.book_id '
+                   f'LIMIT %s OFFSET %s')
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, [self._match(), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    def __getitem__(self, k):
+        if not isinstance(k, slice):
+            return self[k:k + 1][0]
+        if not self.terms:
+            return []
+        if self.connection.vendor not in ('sqlite', 'postgresql'):
+            return list(self._fallback_queryset().select_related('author')[k])
+        offset = k.start or 0
+        limit = (k.stop - offset) if k.stop is not None else self.count() - offset
+        ids = self._ids(offset, max(limit, 0))
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
+
+
+def search_books(query, available=False):
+    """
+    Search the catalog, optionally only books with a copy available now
+    :return: SearchResults ordered by relevance
+    """
+    return SearchResults(query, available)
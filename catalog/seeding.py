@@ -0,0 +1,141 @@
+"""
+Synthetic catalog generator for benchmarks.
+
+Everything is written with ``bulk_create`` in batches, so model signals do
+not fire; the denormalized data they maintain is rebuilt at the end.
+"""
+import datetime
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from catalog import availability, counters, ratings, search
+from catalog.models import (
+    Author, Book, BookInstance, BookReview, Genre, Language, Notification, Wishlist
+)
+
+BATCH_SIZE = 5000
+
+WORDS = (
+    'shadow river winter garden silent empire glass night crown stone fire ocean '
+    'secret journey forest storm golden hidden last city dream iron paper star '
+    'house machine letter island mirror kingdom road memory bridge lantern'
+).split()
+FIRST_NAMES = 'Ada Alan Grace Edsger Barbara Donald Ken Dennis Margaret Tim Linus Guido Bjarne'.split()
+LAST_NAMES = 'Lovelace Turing Hopper Dijkstra Liskov Knuth Thompson Ritchie Hamilton Lee Torvalds Rossum'.split()
+GENRES = 'Fantasy Horror Mystery Romance Thriller Biography History Poetry Science Travel'.split()
+LANGUAGES = 'English French German Spanish Italian'.split()
+
+
+def _batches(iterable, size=BATCH_SIZE):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+
+
+def seed_catalog(books, copies=2, users=100, wishes=5, reviews=2, notifications=5, seed=0, stdout=None):
+    """
+    Insert a synthetic catalog.
+
+    copies, wishes, reviews and notifications are averages per book
+    (copies) or per user (the rest).
+    :return: dict of model name -> rows created
+    """
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    created = {}
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    with transaction.atomic():
+        languages = Language.objects.bulk_create(Language(name=name) for name in LANGUAGES)
+        genres = Genre.objects.bulk_create(Genre(name=name) for name in GENRES)
+        authors = Author.objects.bulk_create(
+            Author(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES))
+            for _ in range(max(1, books // 5))
+        )
+        password = make_password('benchmark')
+        prefix = uuid.uuid4().hex[:8]
+        user_ids = []
+        for batch in _batches(User(username=f'bench-{prefix}-{i}', password=password) for i in range(users)):
+            user_ids.extend(user.pk for user in User.objects.bulk_create(batch))
+        # Signs in to the admin scenarios of catalog.benchmarks
+        User.objects.bulk_create([User(username=f'bench-{prefix}-admin', password=password,
+                                       is_staff=True, is_superuser=True)])
+        created['User'] = len(user_ids) + 1
+        log(f'{len(user_ids)} users')
+
+        book_ids = []
+        book_rows = (
+            Book(title=_title(rng), author=rng.choice(authors), language=rng.choice(languages),
+                 summary=' '.join(rng.choice(WORDS) for _ in range(30)),
+                 isbn=str(rng.randrange(10 ** 12, 10 ** 13)))
+            for _ in range(books)
+        )
+        Through = Book.genre.through
+        for batch in _batches(book_rows):
+            batch = Book.objects.bulk_create(batch)
+            book_ids.extend(book.pk for book in batch)
+            Through.objects.bulk_create(
+                Through(book_id=book.pk, genre_id=genre.pk)
+                for book in batch for genre in rng.sample(genres, rng.randint(1, 3))
+            )
+        created['Book'] = len(book_ids)
+        log(f'{len(book_ids)} books')
+
+        def instances():
+            for book_id in book_ids:
+                for _ in range(rng.randint(0, 2 * copies)):
+                    status = rng.choice('maoor' if user_ids else 'mar')
+                    on_loan = status == 'o'
+                    yield BookInstance(
+                        book_id=book_id, imprint=f'Imprint {rng.randint(1, 50)}', status=status,
+                        borrower_id=rng.choice(user_ids) if on_loan else None,
+                        due_back=today + datetime.timedelta(days=rng.randint(-30, 30)) if on_loan else None,
+                    )
+        created['BookInstance'] = 0
+        for batch in _batches(instances()):
+            created['BookInstance'] += len(BookInstance.objects.bulk_create(batch))
+        log(f"{created['BookInstance']} copies")
+
+        def per_user(average, make):
+            for user_id in user_ids:
+                for book_id in set(rng.choice(book_ids) for _ in range(rng.randint(0, 2 * average))):
+                    yield make(user_id, book_id)
+
+        for model, average, make in (
+            (Wishlist, wishes, lambda user_id, book_id: Wishlist(user_id=user_id, book_id=book_id)),
+            (BookReview, reviews, lambda user_id, book_id: BookReview(
+                user_id=user_id, book_id=book_id, rating=rng.randint(1, 5), comment=_title(rng))),
+            (Notification, notifications, lambda user_id, book_id: Notification(
+                user_id=user_id, message=f'Book {book_id} is now available!', is_read=rng.random() < 0.7)),
+        ):
+            created[model.__name__] = 0
+            if not book_ids:
+                continue
+            for batch in _batches(per_user(average, make)):
+                created[model.__name__] += len(model.objects.bulk_create(batch))
+            log(f'{created[model.__name__]} {model.__name__} rows')
+
+        counters.rebuild_counters()
+        ratings.reconcile_ratings()
+        availability.recount(book_ids)
+        search.rebuild_index()
+    # Refresh planner statistics so the new rows get realistic query plans
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return created
@@ -0,0 +1,193 @@
+"""
+Signal handlers keeping derived catalog data in sync with the models.
+"""
+from django.contrib.auth.models import Group, User
+from django.db.models import DEFERRED
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from catalog import auth, availability, counters, fragments, holds, notifications, ratings, search
+from catalog.models import Author, Book, BookInstance, BookReview, Genre, Language
+
+
+def refresh_books(book_ids, listed=False):
+    """
+    Reindex books and drop their cached detail fragments
+    :return:
+    """
+    book_ids = list(book_ids)
+    search.index_books(book_ids)
+    fragments.invalidate_books(book_ids)
+    if listed:
+        fragments.invalidate('list')
+
+
+@receiver(post_save, sender=Book)
+def refresh_saved_book(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_books([instance.pk], listed=True)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_deleted_book(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+    fragments.invalidate_books([instance.pk], kinds=fragments.SCOPES.keys() - {'book_list'})
+    fragments.invalidate('list')
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def index_book_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # A reverse clear() does not report the affected books after the fact.
+        instance._indexed_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_books([instance.pk])
+    elif pk_set:
+        refresh_books(pk_set)
+    else:
+        refresh_books(getattr(instance, '_indexed_book_ids', []))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def refresh_related_books(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        # The book list shows author names but not genres.
+        refresh_books(instance.book_set.values_list('pk', flat=True), listed=sender is Author)
+
+
+@receiver(post_save, sender=Language)
+def refresh_language_books(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        # The language is shown on the detail page only and is not indexed.
+        fragments.invalidate_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+def remember_related_books(sender, instance, **kwargs):
+    instance._indexed_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def refresh_orphaned_books(sender, instance, **kwargs):
+    refresh_books(getattr(instance, '_indexed_book_ids', []), listed=sender is Author)
+
+
+@receiver(post_delete, sender=Language)
+def refresh_languageless_books(sender, instance, **kwargs):
+    # SET_NULL clears the books' language with an UPDATE that sends no signals.
+    fragments.invalidate_books(getattr(instance, '_indexed_book_ids', []))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+def count_created(sender, instance, created=False, **kwargs):
+    if created:
+        name = counters.NUM_BOOKS if sender is Book else counters.NUM_AUTHORS
+        counters.increment(name)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+def count_deleted(sender, instance, **kwargs):
+    name = counters.NUM_BOOKS if sender is Book else counters.NUM_AUTHORS
+    counters.increment(name, -1)
+
+
+@receiver(post_init, sender=BookInstance)
+def remember_loaded_status(sender, instance, **kwargs):
+    # Read through __dict__ so a deferred status field is not fetched.
+    instance._loaded_status = instance.__dict__.get('status')
+    instance._loaded_book_id = instance.__dict__.get('book_id', DEFERRED)
+
+
+@receiver(post_save, sender=BookInstance)
+def track_instance_status(sender, instance, created=False, raw=False, **kwargs):
+    previous = instance._loaded_status
+    previous_book_id = instance._loaded_book_id
+    if previous_book_id is DEFERRED:
+        previous_book_id = instance.book_id
+    if created:
+        counters.increment(counters.NUM_INSTANCES)
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE, int(instance.status == 'a'))
+        availability.move([instance.book_id], None, instance.status)
+    elif previous is not None:
+        counters.increment(counters.NUM_INSTANCES_AVAILABLE, int(instance.status == 'a') - int(previous == 'a'))
+        changes = availability.moves([previous_book_id], previous, None)
+        changes.update(availability.moves([instance.book_id], None, instance.status))
+        availability.apply(changes)
+    if not raw:
+        # A copy moved to another book leaves the old book's list too.
+        book_ids = {instance.book_id} if created else {instance.book_id, previous_book_id}
+        fragments.invalidate_books(book_ids - {None}, kinds=('book_copies',))
+    became_available = instance.status == 'a' and (created or previous not in (None, 'a'))
+    if became_available and instance.book_id and not raw:
+        # Someone waiting in the hold queue gets the copy before wishers hear of it.
+        reserved = holds.reserve_copies([(instance.pk, instance.book_id)])
+        if reserved:
+            counters.increment(counters.NUM_INSTANCES_AVAILABLE, -1)
+            instance.status, instance.borrower_id, instance.due_back = 'r', reserved[instance.pk], None
+        else:
+            notifications.schedule_availability_notice(instance.book_id)
+    instance._loaded_status = instance.status
+    instance._loaded_book_id = instance.book_id
+
+
+@receiver(post_delete, sender=BookInstance)
+def count_deleted_instance(sender, instance, **kwargs):
+    fragments.invalidate_books([instance.book_id], kinds=('book_copies',))
+    counters.increment(counters.NUM_INSTANCES, -1)
+    counters.increment(counters.NUM_INSTANCES_AVAILABLE, -int(instance.status == 'a'))
+    availability.move([instance.book_id], instance.status, None)
+
+
+@receiver(post_init, sender=BookReview)
+def remember_loaded_rating(sender, instance, **kwargs):
+    instance._loaded_rating = (instance.__dict__.get('book_id'), instance.__dict__.get('rating'))
+
+
+@receiver(post_save, sender=BookReview)
+def aggregate_saved_review(sender, instance, created=False, **kwargs):
+    if created:
+        ratings.apply_review_delta(instance.book_id, 1, instance.rating)
+    else:
+        book_id, rating = instance._loaded_rating
+        if rating is not None and (book_id, rating) != (instance.book_id, instance.rating):
+            ratings.apply_review_delta(book_id, -1, -rating)
+            ratings.apply_review_delta(instance.book_id, 1, instance.rating)
+            fragments.invalidate_books([book_id], kinds=('book_detail', 'book_reviews'))
+    instance._loaded_rating = (instance.book_id, instance.rating)
+    # Ratings are shown on the detail page and the book list.
+    fragments.invalidate_books([instance.book_id], kinds=('book_detail', 'book_reviews'))
+    fragments.invalidate('list')
+
+
+@receiver(post_delete, sender=BookReview)
+def aggregate_deleted_review(sender, instance, **kwargs):
+    ratings.apply_review_delta(instance.book_id, -1, -instance.rating)
+    fragments.invalidate_books([instance.book_id], kinds=('book_detail', 'book_reviews'))
+    fragments.invalidate('list')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    auth.forget_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def forget_cached_permissions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        auth.forget_all_users()
+
+
+@receiver(post_delete, sender=Group)
+def forget_group_members(sender, instance, **kwargs):
+    auth.forget_all_users()
@@ -0,0 +1,38 @@
+from django import template
+
+from catalog import fragments
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, kind, scope_id, vary):
+        self.nodelist = nodelist
+        self.kind = kind
+        self.scope_id = scope_id
+        self.vary = vary
+
+    def render(self, context):
+        kind = self.kind.resolve(context)
+        scope_id = self.scope_id.resolve(context)
+        vary = [value.resolve(context) for value in self.vary]
+        return fragments.get_or_render(kind, scope_id, vary, lambda: self.nodelist.render(context))
+
+
+@register.tag('cachefragment')
+def do_cachefragment(parser, token):
+    """
+    Cache a fragment until its scope is invalidated (see catalog.fragments).
+
+    Usage::
+
+        {% cachefragment "book_detail" book.pk [vary ...] %} ... {% endcachefragment %}
+        {% cachefragment "book_list" None request.GET.urlencode %} ... {% endcachefragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment kind and a scope id.")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    kind, scope_id, *vary = [parser.compile_filter(bit) for bit in bits[1:]]
+    return FragmentCacheNode(nodelist, kind, scope_id, vary)
@@ -1,10 +1,42 @@
+import base64
 import datetime
-from django.test import TestCase
+import gzip
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
 from catalog.models import (
-    Book, Author, Genre, Language, BookInstance, Wishlist
+    Book, Author, Genre, Language, BookInstance, Wishlist, Notification, BookReview, Hold,
+    BookCirculation, CatalogCounter, CirculationBucket, GenreCirculation, JobState, LoanEvent
 )
+from catalog import (
+    auth, availability, circulation, counters, fragments, holds, loans, notifications, profiling, recommendations, routers, visits
+)
+from catalog.management.commands.import_catalog import Command as ImportCommand
+from catalog.middleware import ReplicaRoutingMiddleware
+from catalog.ratings import reconcile_ratings
+from catalog.search import search_books
+from catalog.benchmarks import SCENARIOS, compare, run_benchmarks
+from catalog.checks import check_shared_caches, check_static_references
+from catalog.pagination import EstimatedCountPaginator
+from catalog.seeding import seed_catalog
+from locallibrary import database
 
 class TestWishlist(TestCase):
     def setUp(self):
@@ -69,4 +101,1035 @@ class TestLoanedBooksView(TestCase):
         response = self.client.get(reverse('my-borrowed'))
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "Loan Book")
-        self.assertContains(response, self.book_instance.due_back.strftime('%B %d, %Y'))
\ No newline at end of file
+        self.assertContains(response, self.book_instance.due_back.strftime('%B %d, %Y'))
+
+class TestBookSearch(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='searchuser', password='searchpass')
+        self.client.login(username='searchuser', password='searchpass')
+
+        self.genre = Genre.objects.create(name="Mystery")
+        language = Language.objects.create(name="English")
+        self.author = Author.objects.create(first_name="Agatha", last_name="Christie")
+
+        self.book = Book.objects.create(
+            title='Murder on the Orient Express',
+            author=self.author,
+            summary="Poirot investigates aboard a snowbound train",
+            isbn='9780007119318',
+            language=language,
+        )
+        self.book.genre.set([self.genre])
+        Book.objects.create(
+            title='Unrelated Title',
+            summary="Nothing to see here",
+            isbn='1234567890123',
+            language=language,
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse('book-search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['results'])
+
+    def test_search_by_title_author_and_genre(self):
+        self.assertEqual(self.search('orient'), [self.book])
+        self.assertEqual(self.search('christie'), [self.book])
+        self.assertEqual(self.search('myst'), [self.book])
+        self.assertEqual(self.search('christie unrelated'), [])
+
+    def test_index_follows_related_changes(self):
+        self.author.last_name = 'Mallowan'
+        self.author.save()
+        self.assertEqual(self.search('mallowan'), [self.book])
+
+        self.book.genre.clear()
+        self.assertEqual(self.search('mystery'), [])
+
+        self.book.delete()
+        self.assertEqual(self.search('orient'), [])
+
+
+class TestIndexCounters(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='indexuser', password='indexpass')
+        self.client.login(username='indexuser', password='indexpass')
+
+        author = Author.objects.create(first_name="Jane", last_name="Austen")
+        self.book = Book.objects.create(title="Emma", author=author, summary="Matchmaking", isbn="1234567890123")
+        self.copy = BookInstance.objects.create(book=self.book, imprint="Penguin", status='a')
+        BookInstance.objects.create(book=self.book, imprint="Penguin", status='m')
+
+    def test_counters_follow_model_changes(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_books'], 1)
+        self.assertEqual(response.context['num_instances'], 2)
+        self.assertEqual(response.context['num_instance_available'], 1)
+        self.assertEqual(response.context['num_authors'], 1)
+
+        self.copy.status = 'o'
+        self.copy.save()
+        self.copy.delete()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_instances'], 1)
+        self.assertEqual(response.context['num_instance_available'], 0)
+
+    def test_counters_are_spread_over_slots(self):
+        counters.rebuild_counters()
+        for slot in range(counters.SLOTS):
+            with mock.patch('catalog.counters.random.randrange', return_value=slot):
+                counters.increment(counters.NUM_AUTHORS, 2)
+        slots = CatalogCounter.objects.filter(name=counters.NUM_AUTHORS)
+        self.assertEqual(slots.count(), counters.SLOTS)
+        self.assertFalse(slots.filter(value=0).exists())
+        self.assertEqual(counters.get_counters()[counters.NUM_AUTHORS], 1 + 2 * counters.SLOTS)
+
+
+class TestBookQueryCounts(TestCase):
+    """Book pages must render in a constant number of queries."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            username='countuser', password='countpass', email='count@example.com'
+        )
+        self.client.login(username='countuser', password='countpass')
+        # The sidebar's unread count and the session's user are cached across
+        # pages; load them up front.
+        cache.clear()
+        notifications.unread_count(self.user.pk)
+        auth.CachedModelBackend().get_user(self.user.pk)
+        self.language = Language.objects.create(name="English")
+        self.genres = [Genre.objects.create(name=name) for name in ("Fantasy", "Horror", "Satire")]
+        self.book = self.create_book("Dracula")
+
+    def create_book(self, title):
+        author = Author.objects.create(first_name="Bram", last_name=title)
+        book = Book.objects.create(title=title, author=author, summary="Summary",
+                                   isbn="1234567890123", language=self.language)
+        book.genre.set(self.genres)
+        return book
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_book_detail_with_many_copies(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        BookInstance.objects.create(book=self.book, imprint="First", status='o', borrower=self.user)
+        baseline = self.count_queries(url)
+        for i in range(5):
+            borrower = get_user_model().objects.create_user(username=f'borrower{i}', password='x')
+            BookInstance.objects.create(book=self.book, imprint="More", status='o', borrower=borrower)
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_admin_book_changelist_with_many_books(self):
+        url = reverse('admin:catalog_book_changelist')
+        baseline = self.count_queries(url)
+        for i in range(5):
+            self.create_book(f"Book {i}")
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_admin_copy_changelist_with_many_copies(self):
+        url = reverse('admin:catalog_bookinstance_changelist')
+        BookInstance.objects.create(book=self.book, imprint="First", status='o', borrower=self.user)
+        baseline = self.count_queries(url)
+        for i in range(5):
+            borrower = get_user_model().objects.create_user(username=f'admin-borrower{i}', password='x')
+            BookInstance.objects.create(book=self.create_book(f"Copy {i}"), imprint="More", status='o',
+                                        borrower=borrower, due_back=datetime.date.today())
+        self.assertEqual(self.count_queries(url), baseline)
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pageuser', password='pagepass')
+        self.client.login(username='pageuser', password='pagepass')
+        book = Book.objects.create(title="Paged Book", summary="Summary", isbn="1234567890123")
+        today = datetime.date.today()
+        # Pairs of copies share a due date so the id tie-breaker is exercised.
+        self.copies = [
+            BookInstance.objects.create(book=book, imprint="Imprint", status='o', borrower=self.user,
+                                        due_back=today + datetime.timedelta(days=i // 2))
+            for i in range(25)
+        ]
+        self.copies.sort(key=lambda copy: (copy.due_back, copy.id))
+
+    def test_walk_forward_and_back(self):
+        url = reverse('my-borrowed')
+        response = self.client.get(url)
+        pages = [list(response.context['bookinstance_list'])]
+        self.assertFalse(response.context['page_obj'].has_previous())
+        while response.context['page_obj'].has_next():
+            response = self.client.get(url, {'cursor': response.context['page_obj'].next_cursor})
+            pages.append(list(response.context['bookinstance_list']))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([copy for page in pages for copy in page], self.copies)
+
+        response = self.client.get(url, {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(list(response.context['bookinstance_list']), pages[1])
+        self.assertContains(response, 'cursor=')
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('my-borrowed'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_crafted_cursor(self):
+        # Well-formed cursors whose values the fields reject
+        for values in (['2020-13-45', str(self.copies[0].id)], [str(datetime.date.today()), 'not-a-uuid']):
+            cursor = base64.urlsafe_b64encode(json.dumps([0, values]).encode()).decode()
+            response = self.client.get(reverse('my-borrowed'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CATALOG_NOTIFICATIONS_ASYNC=False)
+class TestAvailabilityNotifications(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='returner', password='returnpass')
+        self.client.login(username='returner', password='returnpass')
+        self.book = Book.objects.create(title="Wished Book", summary="Summary", isbn="1234567890123")
+        self.copy = BookInstance.objects.create(book=self.book, imprint="Imprint", status='o', borrower=self.user)
+        self.wishers = [get_user_model().objects.create_user(username=f'wisher{i}', password='x') for i in range(3)]
+        for wisher in self.wishers:
+            Wishlist.objects.create(user=wisher, book=self.book)
+
+    def return_and_reloan(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('return-book', args=[self.copy.pk]))
+        self.client.post(reverse('loan-book', args=[self.copy.pk]))
+
+    def test_return_notifies_wishers_once(self):
+        self.return_and_reloan()
+        self.assertEqual(Notification.objects.filter(user__in=self.wishers).count(), 3)
+
+        # Unread notices are not duplicated by another return...
+        self.return_and_reloan()
+        self.assertEqual(Notification.objects.count(), 3)
+
+        # ...but users who read theirs are told again.
+        Notification.objects.filter(user=self.wishers[0]).update(is_read=True)
+        self.return_and_reloan()
+        self.assertEqual(Notification.objects.filter(user=self.wishers[0]).count(), 2)
+        self.assertEqual(Notification.objects.count(), 4)
+
+
+class TestLoanEngine(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='borrower', password='borrowpass')
+        self.other = get_user_model().objects.create_user(username='other', password='otherpass')
+        self.client.login(username='borrower', password='borrowpass')
+        self.book = Book.objects.create(title="Popular Book", summary="Summary", isbn="1234567890123")
+        self.copies = [BookInstance.objects.create(book=self.book, imprint="Imprint", status='a') for _ in range(2)]
+
+    def test_loan_conflict(self):
+        self.client.post(reverse('loan-book', args=[self.copies[0].pk]))
+        self.client.logout()
+        self.client.login(username='other', password='otherpass')
+        response = self.client.post(reverse('loan-book', args=[self.copies[0].pk]), follow=True)
+        self.assertContains(response, 'no longer available')
+        self.copies[0].refresh_from_db()
+        self.assertEqual(self.copies[0].borrower, self.user)
+
+    def test_loan_several_copies_all_or_nothing(self):
+        BookInstance.objects.filter(pk=self.copies[1].pk).update(status='m')
+        ids = [str(copy.pk) for copy in self.copies]
+        self.client.post(reverse('loan-books'), {'copy': ids})
+        self.assertFalse(BookInstance.objects.filter(status='o').exists())
+
+        BookInstance.objects.filter(pk=self.copies[1].pk).update(status='a')
+        self.client.post(reverse('loan-books'), {'copy': ids})
+        self.assertEqual(BookInstance.objects.filter(status='o', borrower=self.user).count(), 2)
+
+        self.client.post(reverse('return-book', args=[self.copies[0].pk]))
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 1)
+
+    def test_copy_ids_are_normalised(self):
+        copy_id = self.copies[0].pk
+        self.assertEqual(loans.loan_copies(self.user, [str(copy_id).upper(), copy_id.hex]), 1)
+        with self.assertRaises(loans.LoanConflict):
+            loans.return_copies(self.user, [])
+
+        response = self.client.post(reverse('loan-books'), follow=True)
+        self.assertContains(response, 'Select at least one copy.')
+        response = self.client.post(reverse('loan-books'), {'copy': ['not-a-uuid']}, follow=True)
+        self.assertContains(response, 'Invalid copy id.')
+
+
+class TestRatingAggregates(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='reviewer', password='reviewpass')
+        self.client.login(username='reviewer', password='reviewpass')
+        self.book = Book.objects.create(title="Rated Book", summary="Summary", isbn="1234567890123")
+        self.other = Book.objects.create(title="Another Book", summary="Summary", isbn="1234567890123")
+
+    def test_aggregates_follow_reviews(self):
+        self.client.post(reverse('add-book-review', args=[self.book.pk]), {'rating': 5, 'comment': 'Great'})
+        self.client.post(reverse('add-book-review', args=[self.book.pk]), {'rating': 2, 'comment': 'Meh'})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.rating_sum), (2, 7))
+        self.assertAlmostEqual(self.book.rating_avg, 3.5)
+
+        BookReview.objects.get(rating=2).delete()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.rating_avg), (1, 5.0))
+
+        response = self.client.get(reverse('books'), {'sort': 'rating', 'min_rating': 4})
+        self.assertEqual(list(response.context['book_list']), [self.book])
+
+    def test_reconcile_fixes_drift(self):
+        BookReview.objects.create(book=self.book, user=self.user, rating=4, comment='Good')
+        Book.objects.filter(pk=self.book.pk).update(review_count=0, rating_sum=0, rating_avg=0)
+        self.assertEqual(reconcile_ratings(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.rating_sum, self.book.rating_avg), (1, 4, 4.0))
+
+
+@override_settings(CATALOG_FRAGMENT_CACHE=True)
+class TestFragmentCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='cacheuser', password='cachepass')
+        self.other = get_user_model().objects.create_user(username='cacheother', password='cachepass')
+        self.client.login(username='cacheuser', password='cachepass')
+        self.book = Book.objects.create(title="Cached Book", summary="Summary", isbn="1234567890123")
+        self.copy = BookInstance.objects.create(book=self.book, imprint="Imprint", status='a')
+        self.url = reverse('book-detail', args=[self.book.pk])
+
+    def test_fragments_invalidated_by_model_changes(self):
+        self.assertContains(self.client.get(self.url), 'Cached Book')
+        self.book.title = 'Renamed Book'
+        self.book.save()
+        self.assertContains(self.client.get(self.url), 'Renamed Book')
+        self.assertGreaterEqual(fragments.stats()['book_detail']['misses'], 2)
+
+        self.client.post(reverse('add-book-review', args=[self.book.pk]), {'rating': 4, 'comment': 'Nice'})
+        self.assertContains(self.client.get(self.url), '4.0/5 from 1 review')
+
+    def test_per_user_buttons(self):
+        self.assertContains(self.client.get(self.url), 'Loan Book')
+        self.client.post(reverse('loan-book', args=[self.copy.pk]))
+        self.assertContains(self.client.get(self.url), 'Return Book')
+
+        self.client.login(username='cacheother', password='cachepass')
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Return Book')
+        self.assertNotContains(response, 'Loan Book')
+
+    def test_hits_skip_the_fragment_queries(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as hit:
+            self.assertContains(self.client.get(self.url), str(self.copy.pk))
+        sqls = [query['sql'] for query in hit.captured_queries]
+        self.assertFalse(any('catalog_book_genre' in sql for sql in sqls))
+        # Only the per-user vary key reads the copies.
+        self.assertEqual(len([sql for sql in sqls if 'FROM "catalog_bookinstance"' in sql]), 1)
+
+    def test_language_and_moved_copy_invalidate(self):
+        language = Language.objects.create(name="Klingon")
+        Book.objects.filter(pk=self.book.pk).update(language=language)
+        fragments.invalidate_books([self.book.pk])
+        self.assertContains(self.client.get(self.url), 'Klingon')
+        language.name = 'tlhIngan Hol'
+        language.save()
+        self.assertContains(self.client.get(self.url), 'tlhIngan Hol')
+        language.delete()
+        self.assertNotContains(self.client.get(self.url), 'tlhIngan Hol')
+
+        self.assertContains(self.client.get(self.url), str(self.copy.pk))
+        other = Book.objects.create(title="Other Book", summary="Summary", isbn="1234567890123")
+        self.copy.book = other
+        self.copy.save()
+        self.assertNotContains(self.client.get(self.url), str(self.copy.pk))
+
+    def test_local_cache_is_not_used(self):
+        self.assertEqual([error.id for error in check_shared_caches()], ['catalog.E003'])
+        with override_settings(CATALOG_FRAGMENT_CACHE=False):
+            self.assertEqual(check_shared_caches(), [])
+            self.client.get(self.url)
+            Book.objects.filter(pk=self.book.pk).update(title='Renamed Quietly')
+            self.assertContains(self.client.get(self.url), 'Renamed Quietly')
+
+
+class TestImportCatalog(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', newline='') as f:
+            f.write('title,author_first_name,author_last_name,genres,language,copies\n'
+                    'Imported One,Ada,Writer,Fantasy|Horror,English,2\n'
+                    'Imported Two,Ada,Writer,Fantasy,,0\n'
+                    ',Nobody,Here,,,1\n')
+        self.addCleanup(os.remove, self.path)
+
+    def test_import_and_resume(self):
+        call_command('import_catalog', self.path, chunk_size=2, stdout=io.StringIO())
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 2)
+        self.assertEqual(Author.objects.filter(last_name='Writer').count(), 1)
+        book = Book.objects.get(title='Imported One')
+        self.assertEqual(sorted(book.genre.values_list('name', flat=True)), ['Fantasy', 'Horror'])
+        self.assertEqual(book.bookinstance_set.filter(status='a').count(), 2)
+        self.assertEqual(search_books('imported').count(), 2)
+        self.assertFalse(JobState.objects.filter(name__startswith='import_catalog:').exists())
+
+    def test_resume_after_failure(self):
+        import_chunk = ImportCommand.import_chunk
+
+        def fail_second_chunk(command, chunk):
+            if chunk[0]['title'] != 'Imported One':
+                raise RuntimeError('interrupted')
+            return import_chunk(command, chunk)
+
+        with mock.patch.object(ImportCommand, 'import_chunk', fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                call_command('import_catalog', self.path, chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 1)
+
+        # The rerun resumes after the checkpoint rather than importing the first record twice.
+        out = io.StringIO()
+        call_command('import_catalog', self.path, chunk_size=1, stdout=out)
+        self.assertIn('Resuming after record 1', out.getvalue())
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 2)
+
+        # A new file at the same path is imported in full.
+        with open(self.path, 'a', newline='') as f:
+            f.write('Imported Three,Ada,Writer,,,1\n')
+        call_command('import_catalog', self.path, stdout=io.StringIO())
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 5)
+
+    def test_malformed_and_negative_copy_counts_are_skipped(self):
+        with open(self.path, 'w', newline='') as f:
+            f.write('title,copies\n'
+                    'Good Copies,2\n'
+                    'Spelled Out,two\n'
+                    'Fractional,2.5\n'
+                    'Negative,-2\n')
+        out = io.StringIO()
+        call_command('import_catalog', self.path, stdout=out)
+        self.assertIn('Imported 1 books (3 skipped)', out.getvalue())
+        self.assertEqual(list(Book.objects.values_list('title', 'copies_available')), [('Good Copies', 2)])
+
+    def test_changed_file_ignores_checkpoint(self):
+        JobState.objects.create(name=f'import_catalog:{os.path.abspath(self.path)}', value='1:1:2')
+        call_command('import_catalog', self.path, stdout=io.StringIO())
+        self.assertEqual(Book.objects.filter(title__startswith='Imported').count(), 2)
+
+
+class TestExportCatalog(TestCase):
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(username='exporter', password='exportpass', is_staff=True)
+        self.book = Book.objects.create(title="Exported Book", summary="Summary", isbn="1234567890123")
+        BookInstance.objects.create(book=self.book, imprint="Imprint", status='o', borrower=self.staff,
+                                    due_back=datetime.date(2030, 1, 2))
+
+    def test_requires_staff(self):
+        response = self.client.get(reverse('export-catalog', args=['books']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_streams_formats(self):
+        self.client.login(username='exporter', password='exportpass')
+        response = self.client.get(reverse('export-catalog', args=['copies']))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'book_id'])
+        self.assertIn('exporter', lines[1])
+
+        response = self.client.get(reverse('export-catalog', args=['copies']), {'format': 'ndjson', 'gzip': '1'})
+        record = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(record['due_back'], '2030-01-02')
+        self.assertEqual(record['borrower__username'], 'exporter')
+
+        response = self.client.get(reverse('export-catalog', args=['loans']))
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch('catalog.export.BATCH_ROWS', 1)
+    async def test_streams_piece_by_piece_under_asgi(self):
+        await BookInstance.objects.acreate(book=self.book, imprint="Second", status='a')
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('export-catalog', args=['copies']), {'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        pieces = [piece async for piece in response.streaming_content]
+        self.assertEqual(sorted(json.loads(piece)['imprint'] for piece in pieces), ['Imprint', 'Second'])
+
+
+class TestNotificationInbox(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='reader', password='readpass')
+        self.client.login(username='reader', password='readpass')
+        notifications.notify_users([self.user.pk] * 3, 'Hello')
+
+    @override_settings(CATALOG_UNREAD_CACHE=True)
+    def test_unread_counter_and_mark_read(self):
+        self.assertContains(self.client.get(reverse('index')), 'Notifications (3)')
+        # The count is cached between pages
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('my-borrowed'))
+        self.assertFalse(any('catalog_notification' in query['sql'] for query in queries))
+
+        note = Notification.objects.filter(user=self.user).first()
+        self.client.post(reverse('mark-notifications-read'), {'notification': [note.pk]})
+        self.assertContains(self.client.get(reverse('index')), 'Notifications (2)')
+
+        notifications.notify_users([self.user.pk], 'Again')
+        response = self.client.post(reverse('mark-notifications-read'), {'all': '1'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {'marked': 3, 'unread': 0})
+
+    def test_counted_per_page_in_a_local_cache(self):
+        self.assertEqual(check_shared_caches(), [])
+        with override_settings(CATALOG_UNREAD_CACHE=True):
+            self.assertEqual([error.id for error in check_shared_caches()], ['catalog.E004'])
+        self.assertContains(self.client.get(reverse('index')), 'Notifications (3)')
+        # As another process would: nothing tells this one to forget the count.
+        Notification.objects.bulk_create([Notification(user=self.user, message='From a job')])
+        self.assertContains(self.client.get(reverse('index')), 'Notifications (4)')
+
+    def test_listing_and_purge(self):
+        response = self.client.get(reverse('notifications'))
+        self.assertEqual(len(response.context['notifications']), 3)
+        notifications.mark_read(self.user.pk)
+        Notification.objects.update(created_at=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc))
+        notifications.notify_users([self.user.pk], 'Recent')
+        call_command('purge_notifications', days=30, batch_size=2, stdout=io.StringIO())
+        self.assertEqual(list(Notification.objects.values_list('message', flat=True)), ['Recent'])
+
+
+class TestScanOverdue(TestCase):
+    def setUp(self):
+        self.users = [get_user_model().objects.create_user(username=f'late{i}', password='x') for i in range(2)]
+        self.book = Book.objects.create(title="Late Book", summary="Summary", isbn="1234567890123")
+        today = datetime.date.today()
+        for days, user in ((3, self.users[0]), (1, self.users[0]), (2, self.users[1]), (-1, self.users[1])):
+            BookInstance.objects.create(book=self.book, imprint="Imprint", status='o', borrower=user,
+                                        due_back=today - datetime.timedelta(days=days))
+
+    def test_reminders_grouped_and_incremental(self):
+        out = io.StringIO()
+        call_command('scan_overdue', stdout=out)
+        self.assertIn('Scanned 3 overdue loans', out.getvalue())
+        self.assertEqual(Notification.objects.get(user=self.users[0]).message,
+                         "2 books are overdue: 'Late Book', 'Late Book'")
+        self.assertEqual(Notification.objects.filter(user=self.users[1]).count(), 1)
+
+        # The watermark makes a second run the same day a no-op
+        call_command('scan_overdue', stdout=io.StringIO())
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+@override_settings(CATALOG_NOTIFICATIONS_ASYNC=False)
+class TestHolds(TestCase):
+    def setUp(self):
+        self.borrower = get_user_model().objects.create_user(username='holder0', password='holdpass')
+        self.waiting = [get_user_model().objects.create_user(username=f'holder{i}', password='holdpass')
+                        for i in (1, 2)]
+        self.book = Book.objects.create(title="Held Book", summary="Summary", isbn="1234567890123")
+        self.copy = BookInstance.objects.create(book=self.book, imprint="Imprint", status='o', borrower=self.borrower)
+        for user in self.waiting:
+            self.client.login(username=user.username, password='holdpass')
+            self.client.post(reverse('place-hold', args=[self.book.pk]))
+        counters.rebuild_counters()
+
+    def test_return_goes_to_head_of_queue(self):
+        self.assertEqual(list(Hold.objects.values_list('user__username', 'position')),
+                         [('holder1', 1), ('holder2', 2)])
+        self.client.login(username='holder0', password='holdpass')
+        self.client.post(reverse('return-book', args=[self.copy.pk]))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('r', self.waiting[0]))
+        self.assertEqual(counters.get_counters()[counters.NUM_INSTANCES_AVAILABLE], 0)
+        self.assertTrue(Notification.objects.filter(user=self.waiting[0], dedupe_key__startswith='hold:').exists())
+
+        self.client.login(username='holder1', password='holdpass')
+        self.client.post(reverse('collect-hold', args=[self.copy.pk]))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('o', self.waiting[0]))
+        self.assertEqual(Hold.objects.count(), 1)
+        self.assertFalse(availability.drifted_books().exists())
+
+    def test_expired_hold_rolls_to_next(self):
+        self.client.login(username='holder0', password='holdpass')
+        self.client.post(reverse('return-book', args=[self.copy.pk]))
+        holds.expire_holds(now=timezone.now() + holds.PICKUP_PERIOD * 2)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('r', self.waiting[1]))
+
+        # Nobody left in line: cancelling makes the copy available again
+        self.client.login(username='holder2', password='holdpass')
+        self.client.post(reverse('cancel-hold', args=[self.book.pk]))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('a', None))
+        self.assertEqual(counters.get_counters()[counters.NUM_INSTANCES_AVAILABLE], 1)
+        self.assertFalse(availability.drifted_books().exists())
+
+
+@override_settings(CATALOG_NOTIFICATIONS_ASYNC=False)
+class TestBenchmarks(TestCase):
+    def test_scenarios_run_and_compare(self):
+        seed_catalog(30, users=5)
+        results = run_benchmarks(repeat=2)
+        self.assertEqual(set(results['scenarios']), set(SCENARIOS))
+        self.assertGreater(results['scenarios']['book_detail']['queries'], 0)
+
+        slower = json.loads(json.dumps(results))
+        slower['scenarios']['index']['queries'] += 1
+        self.assertEqual([name for name, message in compare(results, slower)], ['index'])
+
+
+@override_settings(CATALOG_PROFILING_SAMPLE_RATE=1.0)
+class TestProfilingMiddleware(TestCase):
+    def setUp(self):
+        profiling.reset()
+        self.user = get_user_model().objects.create_user(username='profiled', password='profpass', is_staff=True)
+        self.client.login(username='profiled', password='profpass')
+        self.book = Book.objects.create(title="Profiled Book", summary="Summary", isbn="1234567890123")
+
+    def test_records_per_view(self):
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        stats = profiling.snapshot()['book-detail']
+        self.assertEqual(stats['duration_ms']['count'], 1)
+        self.assertGreater(stats['queries']['sum'], 0)
+        self.assertGreater(stats['template_ms'], 0)
+
+        metrics = self.client.get(reverse('profiling-metrics')).content.decode()
+        self.assertIn('catalog_request_queries_count{view="book-detail"} 1', metrics)
+
+    async def test_records_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        for name, url in (('index', reverse('index')), ('book-detail', reverse('book-detail', args=[self.book.pk]))):
+            response = await self.async_client.get(url)
+            self.assertIn('db;dur=', response['Server-Timing'])
+            self.assertGreater(profiling.snapshot()[name]['queries']['sum'], 0)
+
+    def test_fingerprints(self):
+        self.assertEqual(profiling.fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'), 'SELECT 1 WHERE id IN (...)')
+
+
+class TestAsyncViews(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='asyncuser', password='asyncpass')
+        self.book = Book.objects.create(title="Async Book", summary="Summary", isbn="1234567890123")
+        Wishlist.objects.create(user=self.user, book=self.book)
+        notifications.notify_users([self.user.pk], 'Async hello')
+        BookReview.objects.create(book=self.book, user=self.user, rating=5, comment='Quick read')
+
+    async def test_views_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        for url, text in (
+            (reverse('index'), 'Notifications (1)'),
+            (reverse('wishlist'), 'Async Book'),
+            (reverse('notifications'), 'Async hello'),
+            (reverse('book-reviews', args=[self.book.pk]), 'Quick read'),
+            (reverse('book-search') + '?q=async', 'Async Book'),
+        ):
+            response = await self.async_client.get(url)
+            self.assertContains(response, text)
+
+
+class TestConnectionPool(TestCase):
+    postgres_url = os.environ.get('CATALOG_TEST_POSTGRES_URL', 'postgres://localhost/library')
+
+    def configure(self, **env):
+        environ = {key: value for key, value in os.environ.items()
+                   if not key.startswith(('DJANGO_DB_', 'DJANGO_CONN_', 'WEB_CONCURRENCY'))}
+        with mock.patch.dict(os.environ, {**environ, 'DATABASE_URL': self.postgres_url, **env}, clear=True):
+            return database.database_from_env({})
+
+    def test_pool_sized_per_worker(self):
+        config = self.configure(DJANGO_DB_POOL='True', DJANGO_DB_MAX_CONNECTIONS='50', WEB_CONCURRENCY='4')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool']['max_size'], 10)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', self.configure().get('OPTIONS', {}))
+        self.assertEqual(self.configure(DJANGO_CONN_MAX_AGE='60')['CONN_MAX_AGE'], 60)
+
+    @unittest.skipUnless(importlib.util.find_spec('psycopg_pool'), 'psycopg_pool is not installed')
+    @unittest.skipUnless('CATALOG_TEST_POSTGRES_URL' in os.environ, 'needs a local PostgreSQL')
+    def test_pool_lowers_connection_overhead(self):
+        def per_request_ms(config):
+            handler = ConnectionHandler({'default': {**config, 'CONN_MAX_AGE': 0}})
+            connection = handler['default']
+            timings = []
+            try:
+                for _ in range(20):
+                    # What each request does: connect, query, close at request end
+                    start = time.perf_counter()
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    connection.close()
+                    timings.append(time.perf_counter() - start)
+            finally:
+                connection.close_pool() if 'pool' in config.get('OPTIONS', {}) else connection.close()
+            return sorted(timings)[len(timings) // 2] * 1000
+
+        pooled = per_request_ms(self.configure(DJANGO_DB_POOL='True'))
+        direct = per_request_ms(self.configure())
+        self.assertLess(pooled, direct)
+
+        stats = None
+        handler = ConnectionHandler({'default': self.configure(DJANGO_DB_POOL='True')})
+        try:
+            handler['default'].ensure_connection()
+            stats = database.pool_stats(handler)['default']
+        finally:
+            handler['default'].close_pool()
+        self.assertTrue(stats['pooled'])
+        self.assertIn('requests_num', stats)
+
+
+@override_settings(CATALOG_READ_REPLICAS=['replica1'])
+class TestReplicaRouting(TestCase):
+    def serve(self, request, write=False):
+        seen = {}
+
+        def view(request):
+            seen['before'] = Book.objects.all().db
+            seen['user'] = get_user_model().objects.all().db
+            if write:
+                Wishlist.objects.create(user=self.user, book=self.book)
+            seen['after'] = Book.objects.all().db
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen, response
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='reader', password='secret')
+        self.book = Book.objects.create(title='Replicated', summary='s', isbn='1234567890123')
+        self.factory = RequestFactory()
+
+    def test_reads_of_get_requests_use_the_replica(self):
+        seen, response = self.serve(self.factory.get('/catalog/books/'))
+        self.assertEqual(seen, {'before': 'replica1', 'user': 'default', 'after': 'replica1'})
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+        # Outside a request, e.g. in management commands
+        self.assertEqual(Book.objects.all().db, 'default')
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        seen, response = self.serve(self.factory.get('/catalog/books/'), write=True)
+        self.assertEqual((seen['before'], seen['after']), ('replica1', 'default'))
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+
+        request = self.factory.get('/catalog/books/')
+        request.COOKIES[routers.STICKY_COOKIE] = '1'
+        self.assertEqual(self.serve(request)[0]['before'], 'default')
+        self.assertEqual(self.serve(self.factory.post('/catalog/books/'))[0]['before'], 'default')
+
+    @override_settings(CATALOG_FRAGMENT_CACHE=True, CATALOG_UNREAD_CACHE=True)
+    def test_lagging_replica_does_not_fill_shared_caches(self):
+        cache.clear()
+
+        def render(request, rows):
+            # rows: what the database the request reads from shows
+            def view(request):
+                content = fragments.get_or_render('book_copies', self.book.pk, [], lambda: rows)
+                return HttpResponse(f'{content} {notifications.unread_count(self.user.pk)}')
+            return ReplicaRoutingMiddleware(view)(request).content.decode()
+
+        def sticky():
+            request = self.factory.get('/catalog/books/')
+            request.COOKIES[routers.STICKY_COOKIE] = '1'
+            return request
+
+        # The loan is committed on the primary; the replica still shows the copy available.
+        notifications.notify_users([self.user.pk], 'Loaned')
+        self.assertEqual(render(self.factory.get('/catalog/books/'), 'available'), 'available 1')
+        self.assertEqual(render(self.factory.get('/catalog/books/'), 'caught up'), 'available 1')
+        # The borrower reads the primary and never gets the replica's rendering.
+        self.assertEqual(render(sticky(), 'on loan'), 'on loan 1')
+        self.assertEqual(render(self.factory.get('/catalog/books/'), 'caught up'), 'on loan 1')
+
+    def test_replicas_from_env(self):
+        with mock.patch.dict(os.environ, {'DATABASE_REPLICA_URLS': 'sqlite:////tmp/r1.sqlite3, sqlite:////tmp/r2.sqlite3'}):
+            replicas = database.replicas_from_env()
+        self.assertEqual(sorted(replicas), ['replica1', 'replica2'])
+        self.assertEqual(replicas['replica2']['NAME'], '/tmp/r2.sqlite3')
+        self.assertEqual(replicas['replica1']['TEST'], {'MIRROR': 'default'})
+
+
+@override_settings(CATALOG_NOTIFICATIONS_ASYNC=False)
+class TestAvailability(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='avail', password='availpass')
+        self.book = Book.objects.create(title="Available Book", summary="Summary", isbn="1234567890123")
+        self.other = Book.objects.create(title="Available Other", summary="Summary", isbn="1234567890124")
+        self.copies = [BookInstance.objects.create(book=self.book, imprint="Imprint", status=status)
+                       for status in 'aam']
+
+    def counts(self, book):
+        book.refresh_from_db()
+        return book.copies_available, book.copies_on_loan, book.copies_reserved, book.copies_maintenance
+
+    def test_counts_follow_loans_and_status_changes(self):
+        self.assertEqual(self.counts(self.book), (2, 0, 0, 1))
+        loans.loan_copies(self.user, [self.copies[0].pk])
+        self.assertEqual(self.counts(self.book), (1, 1, 0, 1))
+        loans.return_copies(self.user, [self.copies[0].pk])
+        self.assertEqual(self.counts(self.book), (2, 0, 0, 1))
+
+        # Saves, as the admin makes them
+        copy = BookInstance.objects.get(pk=self.copies[2].pk)
+        copy.status = 'a'
+        copy.save()
+        copy.book, copy.status = self.other, 'm'
+        copy.save()
+        self.copies[1].delete()
+        self.assertEqual(self.counts(self.book), (1, 0, 0, 0))
+        self.assertEqual(self.counts(self.other), (0, 0, 0, 1))
+        self.assertFalse(availability.drifted_books().exists())
+
+    def test_book_list_invalidated_only_when_availability_crosses_zero(self):
+        with mock.patch('catalog.fragments.invalidate') as invalidate:
+            loans.loan_copies(self.user, [self.copies[0].pk])
+            loans.return_copies(self.user, [self.copies[0].pk])
+            self.assertNotIn(mock.call('list'), invalidate.call_args_list)
+            loans.loan_copies(self.user, [copy.pk for copy in self.copies[:2]])
+            self.assertIn(mock.call('list'), invalidate.call_args_list)
+            invalidate.reset_mock()
+            loans.return_copies(self.user, [self.copies[1].pk])
+            self.assertIn(mock.call('list'), invalidate.call_args_list)
+
+    def test_available_filter_and_reconcile(self):
+        self.client.login(username='avail', password='availpass')
+        BookInstance.objects.filter(book=self.other).delete()
+        response = self.client.get(reverse('books'), {'available': '1'})
+        self.assertEqual([book.pk for book in response.context['book_list']], [self.book.pk])
+        self.assertEqual([book.pk for book in search_books('available', available=True)[:10]], [self.book.pk])
+        self.assertEqual(search_books('available').count(), 2)
+
+        Book.objects.filter(pk=self.book.pk).update(copies_available=0, copies_on_loan=5)
+        out = io.StringIO()
+        call_command('reconcile_availability', stdout=out)
+        self.assertIn('1 books fixed', out.getvalue())
+        self.assertEqual(self.counts(self.book), (2, 0, 0, 1))
+
+
+class TestAdminScaling(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            username='adminscale', password='adminpass', email='admin@example.com'
+        )
+        self.client.login(username='adminscale', password='adminpass')
+        self.book = Book.objects.create(title="Many Copies", summary="Summary", isbn="1234567890123")
+        BookInstance.objects.bulk_create(BookInstance(book=self.book, imprint=f"Imprint {i}", status='a')
+                                         for i in range(25))
+
+    @override_settings(CATALOG_ADMIN_EXACT_COUNT_LIMIT=10)
+    def test_large_tables_are_counted_from_the_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(EstimatedCountPaginator(BookInstance.objects.all(), 10).count, 25)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in captured.captured_queries))
+        # Filtered lists and small tables are counted exactly
+        self.assertEqual(EstimatedCountPaginator(BookInstance.objects.filter(imprint='Imprint 1'), 10).count, 1)
+        self.assertEqual(EstimatedCountPaginator(Book.objects.order_by('pk'), 10).count, 1)
+
+    def test_user_changelist_skips_the_full_count(self):
+        response = self.client.get(reverse('admin:auth_user_changelist'), {'q': 'adminscale'})
+        changelist = response.context['cl']
+        self.assertIsInstance(changelist.paginator, EstimatedCountPaginator)
+        self.assertFalse(changelist.show_full_result_count)
+
+    def test_book_change_form_pages_its_copies(self):
+        url = reverse('admin:catalog_book_change', args=[self.book.pk])
+        response = self.client.get(url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual((formset.initial_form_count(), formset.paginator.num_pages), (20, 2))
+        self.assertContains(response, 'class="vForeignKeyRawIdAdminField"')
+
+        response = self.client.get(url, {'bookinstance_set_page': 2})
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), 5)
+
+        # Queries depend on the page size, not on the number of copies
+        BookInstance.objects.filter(book=self.book).update(status='o', borrower=self.user)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        BookInstance.objects.bulk_create(BookInstance(book=self.book, imprint="More", status='o', borrower=self.user)
+                                         for i in range(25))
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(url)
+        self.assertEqual(len(more), len(captured))
+
+
+class TestSessionOverhead(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='visitor', password='visitpass')
+        self.client.force_login(self.user)
+        cache.clear()
+        visits.clear()
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in captured.captured_queries]
+
+    def loads_user(self, url):
+        return any('FROM "auth_user"' in sql for sql in self.queries(url)[1])
+
+    @override_settings(AUTHENTICATION_BACKENDS=['catalog.auth.CachedModelBackend',
+                                                'django.contrib.auth.backends.ModelBackend'])
+    def test_user_is_cached_until_changed(self):
+        self.assertEqual([error.id for error in check_shared_caches()], ['catalog.E005'])
+        url = reverse('books')
+        # Logged in before the cached backend was enabled
+        self.assertTrue(self.loads_user(url))
+        self.assertTrue(self.loads_user(url))
+
+        self.client.force_login(self.user, backend='catalog.auth.CachedModelBackend')
+        self.assertTrue(self.loads_user(url))
+        self.assertFalse(self.loads_user(url))
+
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertTrue(self.loads_user(url))
+        self.assertFalse(self.loads_user(url))
+
+        self.user.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.assertTrue(self.loads_user(url))
+        self.assertTrue(self.client.get(url).wsgi_request.user.has_perm('catalog.can_mark_returned'))
+
+    @override_settings(CATALOG_VISITS_FLUSH_EVERY=3)
+    def test_visits_are_saved_in_batches(self):
+        shown, writes = [], 0
+        for i in range(6):
+            response, sqls = self.queries(reverse('index'))
+            shown.append(response.context['num_visits'])
+            writes += sum('UPDATE "django_session"' in sql for sql in sqls)
+        self.assertEqual(shown, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(writes, 2)
+        self.assertEqual(self.client.session['num_visits'], 6)
+
+
+class TestStaticAssets(TestCase):
+    def test_debug_can_be_turned_off(self):
+        spec = importlib.util.find_spec('locallibrary.settings')
+        for value, debug in (('False', False), ('True', True)):
+            with mock.patch.dict(os.environ, {'DJANGO_DEBUG': value}):
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            self.assertIs(module.DEBUG, debug)
+
+    def test_collected_assets_are_hashed_minified_and_immutable(self):
+        with tempfile.TemporaryDirectory() as static_root, override_settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = staticfiles_storage.url('css/styles.css')
+            self.assertRegex(url, r'^/static/css/styles\.[0-9a-f]{12}\.css$')
+            stored = staticfiles_storage.stored_name('css/styles.css')
+            with staticfiles_storage.open(stored) as css:
+                self.assertNotIn(b'/* Site styles */', css.read())
+            self.assertTrue(os.path.exists(os.path.join(static_root, stored + '.gz')))
+            self.assertEqual(check_static_references(), [])
+
+            self.assertContains(self.client.get(reverse('login')), url)
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('immutable', response['Cache-Control'])
+
+    def test_check_rejects_unhashed_assets(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.html') as template:
+            template.write('<link rel="stylesheet" href="https://cdn.example.com/site.css">')
+            template.flush()
+            with mock.patch('catalog.checks.template_files', return_value=[template.name]):
+                errors = check_static_references()
+        self.assertEqual([error.id for error in errors], ['catalog.E001'])
+
+
+class TestRecommendations(TestCase):
+    def setUp(self):
+        self.readers = [get_user_model().objects.create_user(username=f'reader{i}', password='readpass')
+                        for i in range(3)]
+        self.books = [Book.objects.create(title=f"Liked {i}", summary="Summary", isbn="1234567890123")
+                      for i in range(4)]
+        a, b, c, d = self.books
+        for reader, books in zip(self.readers, [(a, b), (a, b, c)]):
+            Wishlist.objects.bulk_create(Wishlist(user=reader, book=book) for book in books)
+        BookReview.objects.create(book=a, user=self.readers[2], rating=5, comment="Great")
+        BookReview.objects.create(book=c, user=self.readers[2], rating=4, comment="Good")
+        # Low ratings are not likes
+        BookReview.objects.create(book=d, user=self.readers[2], rating=2, comment="Meh")
+
+    def neighbours(self, book):
+        return [(entry.similar, round(entry.score, 3)) for entry in recommendations.similar_books(book)]
+
+    def test_neighbours_are_precomputed_and_served_in_one_query(self):
+        a, b, c, d = self.books
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertEqual(self.neighbours(a), [(b, 0.816), (c, 0.816)])
+        self.assertEqual(self.neighbours(b), [(a, 0.816), (c, 0.5)])
+        self.assertEqual(self.neighbours(d), [])
+        with self.assertNumQueries(1):
+            self.neighbours(b)
+
+        self.client.login(username='reader0', password='readpass')
+        response = self.client.get(reverse('book-detail', args=[b.pk]))
+        self.assertContains(response, 'Readers also liked')
+        self.assertContains(response, a.get_absolute_url())
+
+    def test_refresh_rebuilds_books_liked_by_new_likers(self):
+        a, b, c, d = self.books
+        call_command('build_recommendations', stdout=io.StringIO())
+        Wishlist.objects.create(user=self.readers[0], book=d)
+        books, written, since = recommendations.refresh_similar_books()
+        self.assertIsNotNone(since)
+        # reader0 likes a, b and now d; c keeps its neighbours
+        self.assertEqual(books, 3)
+        self.assertEqual(self.neighbours(d), [(b, 0.707), (a, 0.577)])
+        self.assertEqual(self.neighbours(c)[0], (a, 0.816))
+
+
+class TestCirculation(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='circulator', password='circpass',
+                                                         is_staff=True)
+        self.genres = [Genre.objects.create(name=name) for name in ("Fantasy", "Horror")]
+        self.books = [Book.objects.create(title=title, summary="Summary", isbn="1234567890123")
+                      for title in ("Popular", "Niche")]
+        self.books[0].genre.set(self.genres)
+        self.books[1].genre.set(self.genres[:1])
+        self.copies = [BookInstance.objects.create(book=book, imprint="Imprint", status='a')
+                       for book in (self.books[0], self.books[0], self.books[1])]
+
+    def test_changes_are_logged_and_rolled_up(self):
+        popular, niche = self.books
+        first, second, third = self.copies
+        loans.loan_copies(self.user, [first.pk, second.pk])
+        with self.assertRaises(loans.LoanConflict):
+            loans.loan_copies(self.user, [second.pk, third.pk])
+        loans.return_copies(self.user, [first.pk])
+        second.refresh_from_db()
+        loans.renew_copy(second, datetime.date.today() + datetime.timedelta(weeks=4))
+        self.assertEqual(sorted(LoanEvent.objects.values_list('kind', flat=True)),
+                         ['loan', 'loan', 'renewal', 'return'])
+
+        # An old loan, from a month already rolled up elsewhere
+        old = timezone.now() - datetime.timedelta(days=40)
+        LoanEvent.objects.create(kind=LoanEvent.LOAN, copy_id=third.pk, book_id=niche.pk, created_at=old)
+        circulation.rollup_circulation()
+        month = timezone.localdate().replace(day=1)
+        self.assertEqual([(bucket.book, bucket.loans, bucket.returns, bucket.renewals)
+                          for bucket in circulation.top_books(CirculationBucket.MONTH, month)],
+                         [(popular, 2, 1, 1)])
+        self.assertEqual(
+            dict(GenreCirculation.objects.filter(period=CirculationBucket.MONTH, start=month)
+                 .values_list('genre__name', 'loans')),
+            {'Fantasy': 2, 'Horror': 2})
+        self.assertEqual(
+            BookCirculation.objects.get(period=CirculationBucket.DAY, start=timezone.localdate(old)).loans, 1)
+
+        self.client.login(username='circulator', password='circpass')
+        stats = self.client.get(reverse('circulation-stats')).json()
+        self.assertEqual([book['id'] for book in stats['books']], [popular.pk])
+        self.assertEqual(stats['genres'][0]['loans'], 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(circulation.archive_events(timezone.now() - datetime.timedelta(days=30), directory), 1)
+            [name] = os.listdir(directory)
+            with gzip.open(os.path.join(directory, name), 'rt') as archive:
+                self.assertEqual(json.loads(archive.read())['book_id'], niche.pk)
+        self.assertEqual(LoanEvent.objects.count(), 4)
+        # The archived day keeps its buckets
+        circulation.rollup_circulation(full=True)
+        old_month = timezone.localdate(old).replace(day=1)
+        self.assertEqual(BookCirculation.objects.get(period=CirculationBucket.MONTH, start=old_month,
+                                                     book=niche).loans, 1)
@@ -12,9 +12,20 @@ urlpatterns = [
     path('book/<int:pk>/reviews/', views.book_reviews, name='book-reviews'),
     path('book/<int:pk>/add-review/', views.add_book_review, name='add-book-review'),
     path('bookinstance/<uuid:pk>/loan/', views.loan_book, name='loan-book'),
+    path('bookinstance/loan/', views.loan_books, name='loan-books'),
     path('bookinstance/<uuid:pk>/return/', views.return_book, name='return-book'),
+    path('bookinstance/<uuid:pk>/collect/', views.collect_hold, name='collect-hold'),
+    path('book/<int:pk>/hold/', views.place_hold, name='place-hold'),
+    path('book/<int:pk>/cancel-hold/', views.cancel_hold, name='cancel-hold'),
     path('wishlist/', views.wishlist, name='wishlist'),
     path('book/<int:pk>/add-to-wishlist/', views.add_to_wishlist, name='add-to-wishlist'),
     path('book/<int:pk>/remove-from-wishlist/', views.remove_from_wishlist, name='remove-from-wishlist'),
     path('notifications/', views.notifications, name='notifications'),
+    path('notifications/mark-read/', views.mark_notifications_read, name='mark-notifications-read'),
+    path('cache-stats/', views.cache_stats, name='cache-stats'),
+    path('profiling/', views.profiling_stats, name='profiling-stats'),
+    path('profiling/metrics/', views.profiling_metrics, name='profiling-metrics'),
+    path('db-stats/', views.db_stats, name='db-stats'),
+    path('circulation/', views.circulation_stats, name='circulation-stats'),
+    path('export/<str:dataset>/', views.export_catalog, name='export-catalog'),
 ]
\ No newline at end of file
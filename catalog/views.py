@@ -1,67 +1,109 @@
-from django.shortcuts import render, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404
 from django.views import generic
-from catalog.models import Book, Author, BookInstance, Genre, Language, BookReview, Wishlist, Notification
+from catalog.models import Book, Author, BookInstance, Genre, Language, BookReview, Wishlist, Notification, Hold
+from catalog.models import CirculationBucket
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 import datetime
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib.auth.decorators import permission_required
-from django.db.models import Q
-from django.contrib.auth.models import User
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import redirect
-
+from django.core.paginator import Paginator
+from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+
+from catalog import circulation, counters, export, fragments, holds, loans, notifications as inbox, profiling, recommendations, visits
+from locallibrary import database
 from catalog.forms import RenewBookForm
+from catalog.pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
+from catalog.search import search_books
+
+async def arender(request, template_name, context):
+    """
+    Render from an async view. Templates and context processors may still
+    query lazily (the user, the unread count, cache misses), which is only
+    allowed in sync code, so rendering runs in the request's sync thread.
+    :return: HttpResponse
+    """
+    return await sync_to_async(render)(request, template_name, context)
 
 @login_required
-def index(request):
+async def index(request):
     """
     View function for home page of the site
     """
 
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    num_instance_available = BookInstance.objects.filter(status__exact='a').count()
-    num_authors = Author.objects.all().count()
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
+    num_visits = await visits.arecord_visit(request.session)
 
-    context = {
-       'num_books' : num_books,
-       'num_instances' : num_instances,
-       'num_instance_available' :  num_instance_available,
-       'num_authors' : num_authors,
-        'num_visits' : num_visits,
-    }
-    return render(request, 'index.html', context = context)
+    # num_books, num_instances, num_instance_available and num_authors
+    context = await counters.aget_counters()
+    context['num_visits'] = num_visits
+    return await arender(request, 'index.html', context)
 
 
-class BookListView(LoginRequiredMixin, generic.ListView):
+class BookListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     model = Book
+    queryset = Book.objects.with_listing_related()
+    cursor_ordering = ('title', 'id')
     paginate_by = 1
 
+    def get_ordering(self):
+        if self.request.GET.get('sort') == 'rating':
+            return ('-rating_avg', 'id')
+        return super().get_ordering()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.GET.get('available') == '1':
+            queryset = queryset.filter(copies_available__gt=0)
+        try:
+            min_rating = float(self.request.GET.get('min_rating', ''))
+        except ValueError:
+            return queryset
+        return queryset.filter(rating_avg__gte=min_rating)
+
 
 class BookDetailView(LoginRequiredMixin, generic.DetailView):
     model = Book
+    queryset = Book.objects.with_detail_related()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
         book = self.object
         context['in_wishlist'] = False
+        context['hold'] = None
         if user.is_authenticated:
             context['in_wishlist'] = book.wishlist_set.filter(user=user).exists()
+            context['hold'] = Hold.objects.filter(book=book, user=user).first()
+        # Varies the cached copies fragment, which shows return and pick-up
+        # buttons to the borrower of a copy on loan or reserved
+        context['borrowed_copy_ids'] = []
+        if user.is_authenticated:
+            context['borrowed_copy_ids'] = list(
+                BookInstance.objects.filter(book=book, borrower=user, status__in=('o', 'r'))
+                .order_by('id').values_list('id', flat=True)
+            )
+        # Precomputed by manage.py build_recommendations
+        context['similar_books'] = recommendations.similar_books(book)
         return context
 
 
-class LoanedBooksByUserListView(LoginRequiredMixin, generic.ListView):
+class LoanedBooksByUserListView(LoginRequiredMixin, CursorPaginationMixin, generic.ListView):
     """Generic class-based view listing books on loan to current user."""
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
+    cursor_ordering = ('due_back', 'id')
     paginate_by = 10
 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        queryset = BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o')
+        return queryset.select_related('book').order_by(*self.get_ordering())
 
 
 @permission_required('catalog.can_mark_returned')
@@ -78,8 +120,7 @@ def renew_book_librarian(request, pk):
         # Check if the form is valid:
         if form.is_valid():
             # process the data in form.cleaned_data as required (here we just write it to the model due_back field)
-            book_instance.due_back = form.cleaned_data['renewal_date']
-            book_instance.save()
+            loans.renew_copy(book_instance, form.cleaned_data['renewal_date'])
 
             # redirect to a new URL:
             return HttpResponseRedirect(reverse('all-borrowed') )
@@ -97,18 +138,90 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', context)
 
 @login_required
-def book_search(request):
+async def book_search(request):
     query = request.GET.get('q', '')
+    available = request.GET.get('available') == '1'
     results = []
+    page_obj = None
     if query:
-        results = Book.objects.filter(
-            Q(title__icontains=query) | Q(author__name__icontains=query)
-        )
+        paginator = Paginator(search_books(query, available=available), 20)
+        # Full-text search runs raw SQL, which has no async API.
+        page_obj = await sync_to_async(paginator.get_page)(request.GET.get('page'))
+        results = page_obj.object_list
     context = {
         'query': query,
+        'available': available,
         'results': results,
+        'page_obj': page_obj,
+        'is_paginated': page_obj is not None and page_obj.has_other_pages(),
     }
-    return render(request, 'catalog/book_search.html', context)
+    return await arender(request, 'catalog/book_search.html', context)
+
+@staff_member_required
+def cache_stats(request):
+    """Fragment cache hit rates of this process."""
+    return JsonResponse(fragments.stats())
+
+@staff_member_required
+def profiling_stats(request):
+    """Per-view request profiles of this process."""
+    return JsonResponse(profiling.snapshot())
+
+@staff_member_required
+def profiling_metrics(request):
+    """The request profiles in the Prometheus text format."""
+    text = profiling.prometheus() + database.pool_prometheus(connections)
+    return HttpResponse(text, content_type='text/plain; version=0.0.4')
+
+@staff_member_required
+def db_stats(request):
+    """Connection pool checkouts and wait times of this process."""
+    return JsonResponse(database.pool_stats(connections))
+
+@staff_member_required
+def circulation_stats(request):
+    """
+    Most borrowed books and genres of a ?period=day|month starting ?start=YYYY-MM-DD (default this month),
+    read from the rollups of manage.py rollup_circulation
+    :return: JsonResponse
+    """
+    period = request.GET.get('period', CirculationBucket.MONTH)
+    if period not in dict(CirculationBucket.PERIODS):
+        raise Http404('Unknown period.')
+    try:
+        start = datetime.date.fromisoformat(request.GET['start']) if 'start' in request.GET else datetime.date.today()
+    except ValueError:
+        raise Http404('Invalid start date.')
+    if period == CirculationBucket.MONTH:
+        start = start.replace(day=1)
+    counts = circulation.COUNTS
+    return JsonResponse({
+        'period': period,
+        'start': start,
+        'books': [{'id': bucket.book_id, 'title': bucket.book.title, **{name: getattr(bucket, name) for name in counts}}
+                  for bucket in circulation.top_books(period, start)],
+        'genres': [{'id': bucket.genre_id, 'name': bucket.genre.name, **{name: getattr(bucket, name) for name in counts}}
+                   for bucket in circulation.top_genres(period, start)],
+    })
+
+@staff_member_required
+def export_catalog(request, dataset):
+    """
+    Stream books, copies or reviews as ?format=csv|jsonl|ndjson, gzipped with ?gzip=1
+    :return: StreamingHttpResponse
+    """
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') == '1'
+    if dataset not in export.DATASETS or fmt not in export.FORMATS:
+        raise Http404('Unknown export.')
+    # An ASGI server needs an async iterator to stream rather than buffer the export.
+    stream = export.aexport if isinstance(request, ASGIRequest) else export.export
+    response = StreamingHttpResponse(
+        stream(dataset, fmt, compress),
+        content_type='application/gzip' if compress else export.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export.filename(dataset, fmt, compress)}"'
+    return response
 
 @login_required
 def user_profile(request):
@@ -117,10 +230,11 @@ def user_profile(request):
     return render(request, 'catalog/user_profile.html', {'user': user, 'reviews': reviews})
 
 @login_required
-def book_reviews(request, pk):
-    book = get_object_or_404(Book, pk=pk)
-    reviews = book.reviews.all()
-    return render(request, 'catalog/book_reviews.html', {'book': book, 'reviews': reviews})
+async def book_reviews(request, pk):
+    book = await aget_object_or_404(Book, pk=pk)
+    # Only evaluated when the cached reviews fragment has to be re-rendered
+    reviews = book.reviews.select_related('user')
+    return await arender(request, 'catalog/book_reviews.html', {'book': book, 'reviews': reviews})
 
 @login_required
 def add_book_review(request, pk):
@@ -128,30 +242,83 @@ def add_book_review(request, pk):
     if request.method == 'POST':
         rating = int(request.POST.get('rating', 5))
         comment = request.POST.get('comment', '')
-        BookReview.objects.create(book=book, user=request.user, rating=rating, comment=comment)
+        # The review and the book's rating aggregates are written together
+        with transaction.atomic():
+            BookReview.objects.create(book=book, user=request.user, rating=rating, comment=comment)
         return redirect('book-reviews', pk=book.pk)
     return render(request, 'catalog/add_book_review.html', {'book': book})
 
 @login_required
 def loan_book(request, pk):
-    copy = get_object_or_404(BookInstance, pk=pk)
-    if copy.status == 'a':
-        copy.status = 'o'
-        copy.borrower = request.user
-        # Set due_back to 2 weeks from today
-        copy.due_back = datetime.date.today() + datetime.timedelta(weeks=2)
-        copy.save()
-    return HttpResponseRedirect(reverse('book-detail', args=[str(copy.book.pk)]))
+    copy = get_object_or_404(BookInstance.objects.only('id', 'book'), pk=pk)
+    try:
+        loans.loan_copies(request.user, [copy.pk])
+        messages.success(request, 'The copy is on loan to you for two weeks.')
+    except loans.LoanConflict:
+        messages.error(request, 'Sorry, this copy is no longer available.')
+    return HttpResponseRedirect(reverse('book-detail', args=[str(copy.book_id)]))
+
+@login_required
+def loan_books(request):
+    """View function loaning several copies (POSTed as 'copy') in one transaction."""
+    copy_ids = request.POST.getlist('copy')
+    if not copy_ids:
+        messages.error(request, 'Select at least one copy.')
+        return HttpResponseRedirect(reverse('my-borrowed'))
+    try:
+        loaned = loans.loan_copies(request.user, copy_ids)
+        messages.success(request, f'{loaned} copies are on loan to you for two weeks.')
+    except loans.LoanConflict:
+        messages.error(request, 'Sorry, some of these copies are no longer available. Nothing was loaned.')
+    except ValidationError:
+        messages.error(request, 'Invalid copy id.')
+    return HttpResponseRedirect(reverse('my-borrowed'))
 
 @login_required
 def return_book(request, pk):
-    copy = get_object_or_404(BookInstance, pk=pk)
-    if copy.status == 'o' and copy.borrower == request.user:
-        copy.status = 'a'
-        copy.borrower = None
-        copy.due_back = None
-        copy.save()
-    return HttpResponseRedirect(reverse('book-detail', args=[str(copy.book.pk)]))
+    copy = get_object_or_404(BookInstance.objects.only('id', 'book'), pk=pk)
+    try:
+        loans.return_copies(request.user, [copy.pk])
+        messages.success(request, 'Thank you for returning the copy.')
+    except loans.LoanConflict:
+        messages.error(request, 'This copy is not on loan to you.')
+    return HttpResponseRedirect(reverse('book-detail', args=[str(copy.book_id)]))
+
+@login_required
+def collect_hold(request, pk):
+    """View function loaning the user a copy reserved for them."""
+    copy = get_object_or_404(BookInstance.objects.only('id', 'book'), pk=pk)
+    try:
+        loans.collect_hold(request.user, copy.pk)
+        messages.success(request, 'The copy is on loan to you for two weeks.')
+    except loans.LoanConflict:
+        messages.error(request, 'This copy is not waiting for you.')
+    return HttpResponseRedirect(reverse('book-detail', args=[str(copy.book_id)]))
+
+@login_required
+def place_hold(request, pk):
+    book = get_object_or_404(Book.objects.only('id'), pk=pk)
+    if request.method == 'POST':
+        try:
+            hold = holds.place_hold(request.user, book.pk)
+            if hold.copy_id:
+                messages.success(request, 'A copy is waiting for you.')
+            else:
+                messages.success(request, 'You are in the queue for this book.')
+        except holds.HoldError as e:
+            messages.error(request, str(e))
+    return HttpResponseRedirect(reverse('book-detail', args=[str(book.pk)]))
+
+@login_required
+def cancel_hold(request, pk):
+    book = get_object_or_404(Book.objects.only('id'), pk=pk)
+    if request.method == 'POST':
+        try:
+            holds.cancel_hold(request.user, book.pk)
+            messages.success(request, 'You left the queue for this book.')
+        except holds.HoldError as e:
+            messages.error(request, str(e))
+    return HttpResponseRedirect(reverse('book-detail', args=[str(book.pk)]))
 
 @login_required
 def add_to_wishlist(request, pk):
@@ -166,22 +333,40 @@ def remove_from_wishlist(request, pk):
     return redirect('book-detail', pk=pk)
 
 @login_required
-def wishlist(request):
-    books = Book.objects.filter(wishlist__user=request.user)
-    return render(request, 'catalog/wishlist.html', {'books': books})
+async def wishlist(request):
+    user = await request.auser()
+    books = [book async for book in Book.objects.filter(wishlist__user=user).with_listing_related()]
+    return await arender(request, 'catalog/wishlist.html', {'books': books})
 
 @login_required
-def notifications(request):
-    notes = Notification.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'catalog/notifications.html', {'notifications': notes})
-
-# Helper: Notify users when a wished book becomes available
-# Call this in your loan_book and return_book views after a book is returned
+async def notifications(request):
+    """Newest-first inbox of the current user."""
+    user = await request.auser()
+    paginator = CursorPaginator(Notification.objects.filter(user=user), 20, ('-created_at', '-id'))
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+    context = {
+        'notifications': page.object_list,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+    }
+    return await arender(request, 'catalog/notifications.html', context)
 
-def notify_wishlist_users(book):
-    wished_users = User.objects.filter(wishlist__book=book)
-    for user in wished_users:
-        Notification.objects.create(
-            user=user,
-            message=f"'{book.title}' is now available!"
-        )
+@login_required
+def mark_notifications_read(request):
+    """
+    Mark the POSTed notification ids, or all with all=1, read
+    :return: redirect, or JSON for clients accepting only JSON
+    """
+    if request.method != 'POST':
+        return redirect('notifications')
+    if request.POST.get('all'):
+        marked = inbox.mark_read(request.user.pk)
+    else:
+        ids = [value for value in request.POST.getlist('notification') if value.isdigit()]
+        marked = inbox.mark_read(request.user.pk, ids) if ids else 0
+    if not request.accepts('text/html'):
+        return JsonResponse({'marked': marked, 'unread': inbox.unread_count(request.user.pk)})
+    return redirect('notifications')
@@ -0,0 +1,70 @@
+"""
+Home page visit counter, buffered in memory.
+
+Storing ``num_visits`` in the session on every home page view makes every
+view save the session: an UPDATE with the ``db`` engine, a cache write or a
+new cookie with the others. Instead each process counts the visits of a
+session in memory and saves them to the session only every
+``CATALOG_VISITS_FLUSH_EVERY`` visits, or on the first visit after
+``CATALOG_VISITS_FLUSH_SECONDS``. The count shown adds the pending visits
+to the stored one. Pending visits are lost if the process exits or if a
+session is pushed out of the buffer by ``MAX_PENDING`` newer ones; the
+counter is informative only, so that is fine.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+SESSION_KEY = 'num_visits'
+# Sessions with unsaved visits kept per process
+MAX_PENDING = 10000
+
+# session key -> (unsaved visits, time.monotonic() of the oldest one)
+_pending = {}
+_lock = threading.Lock()
+
+
+def _count(session_key):
+    """
+    Add a visit of a session to the buffer
+    :return: (unsaved visits including this one, whether to save them now)
+    """
+    flush_every = getattr(settings, 'CATALOG_VISITS_FLUSH_EVERY', 10)
+    flush_seconds = getattr(settings, 'CATALOG_VISITS_FLUSH_SECONDS', 60)
+    now = time.monotonic()
+    with _lock:
+        count, since = _pending.pop(session_key, (0, now))
+        count += 1
+        if count >= flush_every or now - since >= flush_seconds:
+            return count, True
+        # Reinserted last, so the first entry is the least recently visited.
+        _pending[session_key] = (count, since)
+        if len(_pending) > MAX_PENDING:
+            del _pending[next(iter(_pending))]
+        return count, False
+
+
+async def arecord_visit(session):
+    """
+    Count a home page visit of the session
+    :return: number of visits before this one
+    """
+    stored = await session.aget(SESSION_KEY, 0)
+    if session.session_key is None:
+        # A new session is saved anyway; saving the count with it costs nothing.
+        await session.aset(SESSION_KEY, stored + 1)
+        return stored
+    count, flush = _count(session.session_key)
+    if flush:
+        await session.aset(SESSION_KEY, stored + count)
+    return stored + count - 1
+
+
+def clear():
+    """
+    Forget every unsaved visit
+    :return:
+    """
+    with _lock:
+        _pending.clear()
@@ -0,0 +1,22 @@
+"""
+ASGI config for locallibrary project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The Procfile serves it with ``gunicorn locallibrary.asgi -k
+uvicorn_worker.UvicornWorker``; ``uvicorn locallibrary.asgi:application``
+works for development. Persistent database connections are per thread and
+ASGI requests do not reuse threads, so the Procfile turns them off
+(``DJANGO_CONN_MAX_AGE=0``); use ``DJANGO_DB_POOL=True`` to reuse
+connections instead.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')
+
+application = get_asgi_application()
@@ -0,0 +1,133 @@
+"""
+Database connection settings from the environment.
+
+PostgreSQL deployments can either keep one persistent connection per
+worker thread (``DJANGO_CONN_MAX_AGE``, health-checked before reuse; WSGI
+only, as ASGI requests do not reuse threads) or,
+with ``DJANGO_DB_POOL=True``, share a psycopg 3 connection pool per worker
+process. Pool variables:
+
+``DJANGO_DB_POOL_MIN_SIZE``
+    Connections kept open per process (default 2).
+``DJANGO_DB_POOL_MAX_SIZE``
+    Connections a process may open. Defaults to the server budget
+    ``DJANGO_DB_MAX_CONNECTIONS`` (default 100, minus 10 reserved for
+    management commands) divided by the worker processes
+    ``WEB_CONCURRENCY`` (default 2).
+``DJANGO_DB_POOL_TIMEOUT``
+    Seconds a request waits for a free connection before failing (10).
+``DJANGO_DB_POOL_MAX_IDLE`` / ``DJANGO_DB_POOL_MAX_LIFETIME``
+    Seconds before idle connections are closed (300) and before any
+    connection is recycled (1800).
+
+Read replicas are listed, comma separated, in ``DATABASE_REPLICA_URLS``
+and become the aliases ``replica1``, ``replica2``, ... with the same
+connection settings; ``catalog.routers`` decides which queries use them.
+
+Both modes set ``CONN_HEALTH_CHECKS``: persistent connections are pinged
+before reuse and pooled ones are checked by the pool when handed out, so a
+connection dropped by the server or a proxy is replaced transparently.
+"""
+import os
+
+import dj_database_url
+
+RESERVED_CONNECTIONS = 10
+
+
+def env_bool(name, default=False):
+    return os.environ.get(name, str(default)) == 'True'
+
+
+def pool_max_size():
+    """
+    Per-process share of the server's connection budget
+    :return: int
+    """
+    if 'DJANGO_DB_POOL_MAX_SIZE' in os.environ:
+        return int(os.environ['DJANGO_DB_POOL_MAX_SIZE'])
+    budget = int(os.environ.get('DJANGO_DB_MAX_CONNECTIONS', 100)) - RESERVED_CONNECTIONS
+    workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+    return max(2, budget // max(1, workers))
+
+
+def pool_options():
+    """
+    Keyword arguments for psycopg_pool.ConnectionPool
+    :return: dict
+    """
+    max_size = pool_max_size()
+    return {
+        'min_size': min(int(os.environ.get('DJANGO_DB_POOL_MIN_SIZE', 2)), max_size),
+        'max_size': max_size,
+        'timeout': float(os.environ.get('DJANGO_DB_POOL_TIMEOUT', 10)),
+        'max_idle': float(os.environ.get('DJANGO_DB_POOL_MAX_IDLE', 300)),
+        'max_lifetime': float(os.environ.get('DJANGO_DB_POOL_MAX_LIFETIME', 1800)),
+    }
+
+
+def _connection_settings():
+    # Django opens and returns pooled connections per request itself.
+    conn_max_age = 0 if env_bool('DJANGO_DB_POOL') else int(os.environ.get('DJANGO_CONN_MAX_AGE', 500))
+    return {'conn_max_age': conn_max_age, 'conn_health_checks': True}
+
+
+def _add_pool(database):
+    if env_bool('DJANGO_DB_POOL') and database['ENGINE'] == 'django.db.backends.postgresql':
+        database['OPTIONS'] = {**database.get('OPTIONS', {}), 'pool': pool_options()}
+    return database
+
+
+def database_from_env(default):
+    """
+    The default database, overridden by DATABASE_URL and the tuning variables above
+    :return: dict for settings.DATABASES
+    """
+    database = dict(default)
+    database.update(dj_database_url.config(**_connection_settings()))
+    return _add_pool(database)
+
+
+def replicas_from_env():
+    """
+    The read replicas in DATABASE_REPLICA_URLS
+    :return: dict of alias -> settings, to add to settings.DATABASES
+    """
+    urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    replicas = {}
+    for number, url in enumerate(urls, 1):
+        replica = dj_database_url.parse(url, **_connection_settings())
+        # Tests run against the primary only.
+        replica['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{number}'] = _add_pool(replica)
+    return replicas
+
+
+def pool_stats(connections):
+    """
+    Checkout and wait-time statistics of the pools of this process
+    :return: dict of alias -> stats, or {'pooled': False, ...} for unpooled aliases
+    """
+    stats = {}
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None) if connection.vendor == 'postgresql' else None
+        if pool is None:
+            stats[connection.alias] = {'pooled': False, 'conn_max_age': connection.settings_dict['CONN_MAX_AGE']}
+        else:
+            stats[connection.alias] = {'pooled': True, **pool.get_stats()}
+    return stats
+
+
+def pool_prometheus(connections):
+    """
+    Pool statistics in the Prometheus text format
+    :return: str
+    """
+    lines = []
+    for alias, stats in pool_stats(connections).items():
+        if not stats['pooled']:
+            continue
+        for key, value in sorted(stats.items()):
+            if key != 'pooled':
+                lines.append(f'catalog_db_pool_{key}{{alias="{alias}"}} {value}')
+    return '\n'.join(lines) + '\n' if lines else ''
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
-import dj_database_url
+import tempfile
+
+from locallibrary.database import database_from_env, replicas_from_env
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,7 +27,7 @@ SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY',
                             'o2j68@vr*c8$6uucv#!y%0v@8b6sbjni%zdqe+7+z=paq!wip@')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = os.environ.get('DJANGO_DEBUG', '') != False
+DEBUG = os.environ.get('DJANGO_DEBUG', '') != 'False'
 
 ALLOWED_HOSTS = ['tranquil-brook-82088.herokuapp.com','127.0.0.1']
 
@@ -44,8 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'catalog.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'catalog.middleware.StaticFilesMiddleware',
+    'catalog.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +58,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-STATIC_FILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# collectstatic minifies the stylesheets and writes content-hashed,
+# precompressed copies of every file, which WhiteNoise serves as immutable;
+# the unhashed originals are not kept. See catalog/storage.py.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'catalog.storage.MinifiedStaticFilesStorage'},
+}
+WHITENOISE_KEEP_ONLY_HASHED_FILES = True
 ROOT_URLCONF = 'locallibrary.urls'
 
 TEMPLATES = [
@@ -69,6 +80,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'catalog.context_processors.notifications',
             ],
         },
     },
@@ -76,19 +88,77 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'locallibrary.wsgi.application'
 
+# Cache
+# DJANGO_CACHE_BACKEND selects 'locmem' (default, per process), 'file' or
+# 'redis' (needs the redis package); DJANGO_CACHE_LOCATION overrides where.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'locallibrary'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache',
+             os.path.join(tempfile.gettempdir(), 'locallibrary_cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),
+}
+cache_name = os.environ.get('DJANGO_CACHE_BACKEND', 'locmem')
+cache_backend, cache_location = CACHE_BACKENDS[cache_name]
+CACHES = {
+    'default': {
+        'BACKEND': cache_backend,
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', cache_location),
+    }
+}
+
+# Rendered book page fragments are cached, and invalidated whenever the
+# data they show changes, only with a cache every worker shares: in a
+# per-process cache other workers would never see the invalidation
+# (manage.py check reports the combination).
+CATALOG_FRAGMENT_CACHE = os.environ.get('CATALOG_FRAGMENT_CACHE', str(cache_name != 'locmem')) == 'True'
+# Seconds a rendered fragment is kept
+CATALOG_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('CATALOG_FRAGMENT_CACHE_TIMEOUT', 3600))
+# Unread notification counts are cached on the same condition: cron jobs
+# and other workers create notifications too (see catalog/notifications.py).
+CATALOG_UNREAD_CACHE = os.environ.get('CATALOG_UNREAD_CACHE', str(cache_name != 'locmem')) == 'True'
+
+# Sessions and authentication
+# DJANGO_SESSION_ENGINE selects 'db' (default), 'cached_db', 'cache' or
+# 'signed_cookies'; 'cache' and 'cached_db' need a cache shared by every
+# worker ('file' or 'redis' above) once there is more than one process.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('DJANGO_SESSION_ENGINE', 'db')
+# With a cache shared by every worker, users are loaded through it for
+# CATALOG_USER_CACHE_TIMEOUT seconds (see catalog/auth.py); in a per-process
+# cache a deactivation, password or permission change would only reach one
+# worker (manage.py check reports the combination). ModelBackend stays
+# listed so sessions logged in through it remain valid.
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+if cache_name != 'locmem':
+    AUTHENTICATION_BACKENDS.insert(0, 'catalog.auth.CachedModelBackend')
+CATALOG_USER_CACHE_TIMEOUT = int(os.environ.get('CATALOG_USER_CACHE_TIMEOUT', 300))
+# The home page visit counter is saved to the session every
+# CATALOG_VISITS_FLUSH_EVERY visits or CATALOG_VISITS_FLUSH_SECONDS seconds
+CATALOG_VISITS_FLUSH_EVERY = int(os.environ.get('CATALOG_VISITS_FLUSH_EVERY', 10))
+CATALOG_VISITS_FLUSH_SECONDS = int(os.environ.get('CATALOG_VISITS_FLUSH_SECONDS', 60))
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# DATABASE_URL selects the database; see locallibrary/database.py for
+# persistent connection and pool tuning (DJANGO_DB_POOL=True and friends)
 DATABASES = {
-    'default': {
+    'default': database_from_env({
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    })
 }
-db_from_env = dj_database_url.config(conn_max_age=500)
+DATABASES.update(replicas_from_env())
+
+# Catalog reads of GET requests are spread over the replicas, if any; a
+# client that wrote reads from the primary for CATALOG_REPLICA_STICKY_SECONDS.
+DATABASE_ROUTERS = ['catalog.routers.ReplicaRouter']
+CATALOG_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+CATALOG_REPLICA_STICKY_SECONDS = int(os.environ.get('CATALOG_REPLICA_STICKY_SECONDS', 10))
 
-DATABASES['default'].update(db_from_env)
+# Admin changelists of tables at least this large show the planner's row
+# estimate instead of running COUNT(*)
+CATALOG_ADMIN_EXACT_COUNT_LIMIT = int(os.environ.get('CATALOG_ADMIN_EXACT_COUNT_LIMIT', 100000))
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -126,4 +196,21 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATIC_URL = '/static/'
-LOGIN_REDIRECT_URL = '/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/'
+
+# Run notification fan-outs (e.g. wishlist "now available" notices) on a
+# background thread after the triggering transaction commits
+CATALOG_NOTIFICATIONS_ASYNC = os.environ.get('CATALOG_NOTIFICATIONS_ASYNC', 'True') == 'True'
+
+# manage.py archive_loan_events moves loan events older than
+# CATALOG_LOAN_EVENT_RETENTION_DAYS to gzipped files in this directory;
+# the circulation rollups keep their totals
+CATALOG_LOAN_EVENT_RETENTION_DAYS = int(os.environ.get('CATALOG_LOAN_EVENT_RETENTION_DAYS', 400))
+CATALOG_LOAN_EVENT_ARCHIVE_DIR = os.environ.get('CATALOG_LOAN_EVENT_ARCHIVE_DIR',
+                                                os.path.join(BASE_DIR, 'archive', 'loan_events'))
+
+# Fraction of requests catalog.profiling.ProfilingMiddleware measures; 0
+# disables it. Profiled responses carry a Server-Timing header unless
+# CATALOG_PROFILING_SERVER_TIMING is False.
+CATALOG_PROFILING_SAMPLE_RATE = float(os.environ.get('CATALOG_PROFILING_SAMPLE_RATE', 0))
+CATALOG_PROFILING_SERVER_TIMING = os.environ.get('CATALOG_PROFILING_SERVER_TIMING', 'True') == 'True'